@@ -1,26 +1,55 @@
 from flask import Flask
-from flasgger import Swagger
 from controllers.webhook_controller import webhook_blueprint
 from controllers.customer_controller import customer_blueprint
-from config import mongo, MONGO_URI
+from controllers.metrics_controller import metrics_blueprint
+from controllers.debug_controller import debug_blueprint
+from controllers.docs_controller import docs_blueprint
+from config import MONGO_URI, OUTBOX_ENABLED, RETRY_ENABLED, CIRCUIT_BREAKER_ENABLED, WEBHOOK_CACHE_CHANGE_STREAMS, LOG_PARTITIONED, FAST_START, LOG_SNAPSHOT_DIR, REPLAY_ENABLED
 from exceptions import handle_exception
+from services.customer_service import CustomerService
+from services.webhook_service import WebhookService
 
 app = Flask(__name__)
 
 # Load configurations from config.py
 app.config["MONGO_URI"] = MONGO_URI
+app.config["OUTBOX_ENABLED"] = OUTBOX_ENABLED
 # app.config["SECRET_KEY"] = SECRET_KEY
 
-# Initialize Swagger
-swagger = Swagger(app)
+# Initialize Swagger; in fast-start mode the prebuilt spec is served instead
+if FAST_START:
+    app.register_blueprint(docs_blueprint)
+else:
+    from flasgger import Swagger
+    swagger = Swagger(app)
 
 # Register Blueprints
 app.register_blueprint(webhook_blueprint, url_prefix='/api')
 app.register_blueprint(customer_blueprint, url_prefix='/api')
+app.register_blueprint(metrics_blueprint)
+app.register_blueprint(debug_blueprint)
 
 # Register error handler
 app.register_error_handler(Exception, handle_exception)
 
+# Set up services once; background workers connect to Mongo on first use
+app.config['webhook_service'] = WebhookService()
+app.config['customer_service'] = CustomerService()
+if OUTBOX_ENABLED:
+    app.config['webhook_service'].start_outbox_workers(app)
+if RETRY_ENABLED:
+    app.config['webhook_service'].start_retry_scheduler(app)
+if CIRCUIT_BREAKER_ENABLED:
+    app.config['webhook_service'].start_circuit_sync()
+if WEBHOOK_CACHE_CHANGE_STREAMS:
+    app.config['webhook_service'].start_cache_invalidation()
+if LOG_PARTITIONED:
+    app.config['webhook_service'].start_log_retention()
+if REPLAY_ENABLED:
+    app.config['webhook_service'].start_replay_workers(app)
+if LOG_SNAPSHOT_DIR:
+    app.config['webhook_service'].start_log_snapshots()
+
 if __name__ == '__main__':
     with app.app_context():
         app.run(debug=True)
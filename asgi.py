@@ -0,0 +1,36 @@
+import contextlib
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from app import app as flask_app
+from controllers.async_webhook_controller import webhook_routes
+from controllers.async_customer_controller import customer_routes
+from exceptions import DatabaseError, NotFoundError, ForwardingError, ValidationError, error_response
+from services.async_webhook_service import AsyncWebhookService
+
+# Async entry point: the ingress routes run natively on the event loop; every
+# other route is served by the Flask app through a WSGI adapter.
+# Run with: uvicorn asgi:app
+
+@contextlib.asynccontextmanager
+async def lifespan(asgi_app):
+    webhook_service = AsyncWebhookService(flask_app.config['webhook_service'])
+    await webhook_service.start()
+    asgi_app.state.webhook_service = webhook_service
+    asgi_app.state.customer_service = flask_app.config['customer_service']
+    yield
+    await webhook_service.close()
+
+async def handle_exception(request, e):
+    body, status_code = error_response(e)
+    return JSONResponse(body, status_code=status_code)
+
+def with_prefix(prefix, routes):
+    return [Route(prefix + route.path, route.endpoint, methods=route.methods) for route in routes]
+
+app = Starlette(
+    routes=with_prefix('/api', webhook_routes + customer_routes) + [Mount('/', app=WSGIMiddleware(flask_app))],
+    exception_handlers={error: handle_exception for error in (DatabaseError, NotFoundError, ForwardingError, ValidationError)},
+    lifespan=lifespan,
+)
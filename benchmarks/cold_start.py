@@ -0,0 +1,79 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from run import ROOT, git_revision, latency_summary
+
+# Runs in a fresh interpreter: times importing the app and serving its first request.
+PROBE = r"""
+import json, sys, time
+started = time.perf_counter()
+if sys.argv[2] == "in-memory":
+    import mongomock, pymongo
+    pymongo.MongoClient = mongomock.MongoClient
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "first_request_ms": (done - imported) * 1000,
+                  "finished_at": time.time(), "status": response.status_code}))
+"""
+
+
+def probe(args):
+    env = dict(os.environ, FAST_START="true" if args.fast_start else "false")
+    env.setdefault("MONGO_URI", args.mongo_uri)
+    spawned_at = time.time()
+    output = subprocess.check_output([sys.executable, "-c", PROBE, args.path, "in-memory" if args.in_memory else "mongo"],
+                                     cwd=ROOT, env=env)
+    result = json.loads(output.decode().strip().splitlines()[-1])
+    result["time_to_first_response_ms"] = (result.pop("finished_at") - spawned_at) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app import time and time to first request in fresh processes")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/metrics", help="route for the first request")
+    parser.add_argument("--fast-start", action="store_true", help="run with FAST_START=true")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/webhook_bench")
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock instead of a MongoDB server")
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--output", default=None, help="result file (default benchmarks/results/<label>-<time>.json)")
+    args = parser.parse_args()
+
+    runs = [probe(args) for _ in range(args.runs)]
+    result = {
+        "label": args.label,
+        "git_revision": git_revision(),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": {
+            "statuses": sorted({run["status"] for run in runs}),
+            "import_ms": latency_summary([run["import_ms"] for run in runs]),
+            "first_request_ms": latency_summary([run["first_request_ms"] for run in runs]),
+            "time_to_first_response_ms": latency_summary([run["time_to_first_response_ms"] for run in runs]),
+        },
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{args.label or 'cold-start'}-{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump(result, result_file, indent=2)
+    print(json.dumps(result["results"], indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
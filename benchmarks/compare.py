@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+# (path into "results", True when a higher value is better)
+METRICS = [
+    (("throughput_rps",), True),
+    (("ingress_latency_ms", "p50"), False),
+    (("ingress_latency_ms", "p99"), False),
+    (("delivery_latency_ms", "p50"), False),
+    (("delivery_latency_ms", "p99"), False),
+    (("peak_rss_mb",), False),
+    (("import_ms", "p50"), False),
+    (("first_request_ms", "p50"), False),
+    (("time_to_first_response_ms", "p50"), False),
+]
+
+
+def lookup(results, path):
+    for key in path:
+        if not isinstance(results, dict):
+            return None
+        results = results.get(key)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    args = parser.parse_args()
+    with open(args.baseline) as baseline_file, open(args.candidate) as candidate_file:
+        baseline, candidate = json.load(baseline_file)["results"], json.load(candidate_file)["results"]
+
+    regressions = []
+    print(f"{'metric':32} {'baseline':>12} {'candidate':>12} {'change':>9}")
+    for path, higher_is_better in METRICS:
+        name = ".".join(path)
+        before, after = lookup(baseline, path), lookup(candidate, path)
+        if before is None and after is None:
+            continue
+        if before is None or after is None or before == 0:
+            print(f"{name:32} {str(before):>12} {str(after):>12} {'n/a':>9}")
+            continue
+        change = (after - before) / before * 100
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > args.threshold else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:32} {before:>12} {after:>12} {change:>+8.1f}%{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
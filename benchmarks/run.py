@@ -0,0 +1,196 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_server import StubServer
+
+
+def percentile(values, quantile):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(quantile * len(values)))], 3)
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 0.5),
+        "p90": percentile(values, 0.9),
+        "p99": percentile(values, 0.99),
+        "max": round(max(values), 3) if values else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def start_app(args):
+    # Settings are read from the environment when config is imported, so
+    # everything is set before the app module is loaded.
+    os.environ.setdefault("MONGO_URI", args.mongo_uri)
+    os.environ["OUTBOX_ENABLED"] = "true" if args.outbox else "false"
+    if args.in_memory:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    from werkzeug.serving import make_server
+    from app import app
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def create_webhook(session, app_url, stubs, webhook_stub):
+    response = session.post(f"{app_url}/api/webhooks", json={"customer_id": "bench", "webhook_url": f"{webhook_stub.url}/webhook"})
+    response.raise_for_status()
+    webhook_id = response.json()["webhook_id"]
+    endpoints = [{"url": f"{stub.url}/endpoint/{i}"} for i, stub in enumerate(stubs)]
+    session.post(f"{app_url}/api/webhooks/{webhook_id}/endpoints", json={"endpoints": endpoints}).raise_for_status()
+    return webhook_id
+
+
+def drive(args, url):
+    # Open loop: requests are started on a fixed schedule whatever the
+    # response times, so a slow server shows up as latency, not lower load.
+    import requests
+    local = threading.local()
+    latencies_ms = []
+    statuses = {}
+    lock = threading.Lock()
+    padding = "x" * args.payload_bytes
+
+    def send(seq):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = {"type": "bench.event", "seq": seq, "bench_sent_at": time.time(), "padding": padding}
+        started = time.monotonic()
+        try:
+            status = session.post(url, json=body, timeout=args.timeout).status_code
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with lock:
+            latencies_ms.append(elapsed_ms)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    total = int(args.rate * args.duration)
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for seq in range(total):
+            delay = started + seq / args.rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, seq)
+    elapsed = time.monotonic() - started
+    return total, elapsed, latencies_ms, statuses
+
+
+def wait_for_deliveries(stubs, expected, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and sum(stub.stats.received for stub in stubs) < expected:
+        time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive POST /api/webhooks/<id> against local stub endpoints")
+    parser.add_argument("--endpoints", type=int, default=5, help="endpoints per webhook")
+    parser.add_argument("--rate", type=float, default=50, help="ingress requests per second")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=64, help="client threads")
+    parser.add_argument("--payload-bytes", type=int, default=512)
+    parser.add_argument("--latency-ms", type=float, default=5, help="stub response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub responses that are 500s")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="share of stub responses that take --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--outbox", action="store_true", help="run with OUTBOX_ENABLED=true")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/webhook_bench")
+    parser.add_argument("--in-memory", action="store_true", help="use mongomock instead of a MongoDB server")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--drain-seconds", type=float, default=30, help="how long to wait for deliveries after the load")
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--output", default=None, help="result file (default benchmarks/results/<label>-<time>.json)")
+    args = parser.parse_args()
+
+    stub_options = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                        slow_rate=args.slow_rate, slow_ms=args.slow_ms)
+    stubs = [StubServer(**stub_options).start() for _ in range(args.endpoints)]
+    webhook_stub = StubServer(**stub_options).start()
+    server, app_url = start_app(args)
+
+    import requests
+    webhook_id = create_webhook(requests.Session(), app_url, stubs, webhook_stub)
+    rss_before_mb = current_rss_mb()
+    total, elapsed, latencies_ms, statuses = drive(args, f"{app_url}/api/webhooks/{webhook_id}")
+    all_stubs = stubs + [webhook_stub]
+    wait_for_deliveries(all_stubs, total * len(all_stubs), args.drain_seconds)
+    server.shutdown()
+
+    delivery_latencies_ms = [latency for stub in all_stubs for latency in stub.stats.delivery_latencies_ms]
+    received = sum(stub.stats.received for stub in all_stubs)
+    result = {
+        "label": args.label,
+        "git_revision": git_revision(),
+        "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "config": vars(args),
+        "results": {
+            "requests": total,
+            "statuses": {str(status): count for status, count in statuses.items()},
+            "throughput_rps": round(len(latencies_ms) / elapsed, 2),
+            "ingress_latency_ms": latency_summary(latencies_ms),
+            "deliveries_expected": total * len(all_stubs),
+            "deliveries_received": received,
+            "delivery_latency_ms": latency_summary(delivery_latencies_ms),
+            "rss_mb_before": rss_before_mb,
+            "rss_mb_after": current_rss_mb(),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+    }
+    for stub in all_stubs:
+        stub.stop()
+
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", f"{args.label or result['git_revision'] or 'run'}-{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as result_file:
+        json.dump(result, result_file, indent=2)
+    print(json.dumps(result["results"], indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
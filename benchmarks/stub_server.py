@@ -0,0 +1,95 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubStats:
+    def __init__(self):
+        self.received = 0
+        self.failed = 0
+        self.delivery_latencies_ms = []
+        self._lock = threading.Lock()
+
+    def record(self, failed, delivery_latency_ms):
+        with self._lock:
+            self.received += 1
+            if failed:
+                self.failed += 1
+            if delivery_latency_ms is not None:
+                self.delivery_latencies_ms.append(delivery_latency_ms)
+
+
+class StubServer:
+    # Receiver standing in for customer endpoints. Every request waits
+    # latency_ms (plus up to jitter_ms), a slow_rate share of them waits
+    # slow_ms instead, and an error_rate share is answered with a 500.
+    # Bodies carrying "bench_sent_at" (epoch seconds) are timed end to end.
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, slow_rate=0.0, slow_ms=0, host="127.0.0.1", port=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.stats = StubStats()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                received_at = time.time()
+                delay = stub.slow_ms if random.random() < stub.slow_rate else stub.latency_ms + random.uniform(0, stub.jitter_ms)
+                if delay:
+                    time.sleep(delay / 1000)
+                failed = random.random() < stub.error_rate
+                self.send_response(500 if failed else 200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                stub.stats.record(failed, stub.delivery_latency_ms(body, received_at))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def delivery_latency_ms(self, body, received_at):
+        try:
+            sent_at = json.loads(body).get("bench_sent_at")
+        except (ValueError, AttributeError):
+            return None
+        return (received_at - sent_at) * 1000 if sent_at else None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a stub webhook receiver")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=0)
+    args = parser.parse_args()
+    stub = StubServer(args.latency_ms, args.jitter_ms, args.error_rate, args.slow_rate, args.slow_ms, "0.0.0.0", args.port)
+    print(f"Stub receiver listening on port {args.port}")
+    stub.server.serve_forever()
@@ -1,4 +1,5 @@
 import os
+import threading
 from dotenv import load_dotenv
 from pymongo import MongoClient 
 
@@ -7,5 +8,156 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI")
 # SECRET_KEY = os.getenv("SECRET_KEY")
 
-mongo = MongoClient(MONGO_URI)
-db = mongo['webhook_db']
+# Outbound delivery
+DELIVERY_MAX_CONCURRENCY = int(os.getenv("DELIVERY_MAX_CONCURRENCY", 100))
+DELIVERY_LIMIT_PER_HOST = int(os.getenv("DELIVERY_LIMIT_PER_HOST", 10))
+DELIVERY_TIMEOUT_SECONDS = float(os.getenv("DELIVERY_TIMEOUT_SECONDS", 10))
+# Worker processes to forward from (0 forwards from this process). Endpoints are
+# hashed onto workers; with DELIVERY_ORDERED each endpoint gets its deliveries in order.
+DELIVERY_PROCESSES = int(os.getenv("DELIVERY_PROCESSES", 0))
+DELIVERY_ORDERED = os.getenv("DELIVERY_ORDERED", "true").lower() == "true"
+DELIVERY_HASH_REPLICAS = int(os.getenv("DELIVERY_HASH_REPLICAS", 100))
+DELIVERY_WORKER_START_SECONDS = float(os.getenv("DELIVERY_WORKER_START_SECONDS", 10))
+
+# Accept-then-deliver mode: persist incoming webhooks to the outbox, answer 202
+# and let background workers forward them.
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", "false").lower() == "true"
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 60))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", 1))
+OUTBOX_RETENTION_SECONDS = int(os.getenv("OUTBOX_RETENTION_SECONDS", 604800))
+
+# Retries for failed endpoint deliveries
+RETRY_ENABLED = os.getenv("RETRY_ENABLED", "true").lower() == "true"
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 5))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", 2))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", 3600))
+RETRY_POLL_INTERVAL_SECONDS = float(os.getenv("RETRY_POLL_INTERVAL_SECONDS", 30))
+RETRY_BATCH_SIZE = int(os.getenv("RETRY_BATCH_SIZE", 100))
+RETRY_LEASE_SECONDS = int(os.getenv("RETRY_LEASE_SECONDS", 60))
+RETRY_MAX_DEFERRALS = int(os.getenv("RETRY_MAX_DEFERRALS", 20))
+
+# Per-endpoint circuit breaker
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", 60))
+CIRCUIT_MIN_REQUESTS = int(os.getenv("CIRCUIT_MIN_REQUESTS", 5))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", 0.5))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", 30))
+CIRCUIT_SYNC_SECONDS = float(os.getenv("CIRCUIT_SYNC_SECONDS", 5))
+
+# In-process cache of webhook configurations
+WEBHOOK_CACHE_SIZE = int(os.getenv("WEBHOOK_CACHE_SIZE", 10000))
+WEBHOOK_CACHE_TTL_SECONDS = float(os.getenv("WEBHOOK_CACHE_TTL_SECONDS", 30))
+WEBHOOK_CACHE_CHANGE_STREAMS = os.getenv("WEBHOOK_CACHE_CHANGE_STREAMS", "false").lower() == "true"
+
+# Buffered log writer
+LOG_BUFFER_ENABLED = os.getenv("LOG_BUFFER_ENABLED", "true").lower() == "true"
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 500))
+LOG_FLUSH_INTERVAL_SECONDS = float(os.getenv("LOG_FLUSH_INTERVAL_SECONDS", 1))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 50000))
+LOG_QUEUE_FULL_POLICY = os.getenv("LOG_QUEUE_FULL_POLICY", "block")
+LOG_QUEUE_BLOCK_SECONDS = float(os.getenv("LOG_QUEUE_BLOCK_SECONDS", 1))
+
+# Status metrics
+METRICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("METRICS_FLUSH_INTERVAL_SECONDS", 5))
+STATUS_MINUTE_RETENTION_SECONDS = int(os.getenv("STATUS_MINUTE_RETENTION_SECONDS", 172800))
+STATUS_HOUR_RETENTION_SECONDS = int(os.getenv("STATUS_HOUR_RETENTION_SECONDS", 7776000))
+
+# Skip parsing request bodies; malformed JSON is then forwarded instead of rejected
+PASSTHROUGH_ENABLED = os.getenv("PASSTHROUGH_ENABLED", "false").lower() == "true"
+
+# Log payload store: request bodies in logs are stored once, compressed with "zlib" or "zstd" (needs zstandard)
+PAYLOAD_STORE_ENABLED = os.getenv("PAYLOAD_STORE_ENABLED", "true").lower() == "true"
+PAYLOAD_COMPRESSION = os.getenv("PAYLOAD_COMPRESSION", "zlib")
+
+# Idempotency: duplicates of a request (same header value, or same body when hashing is on) are answered from the recorded result
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "true").lower() == "true"
+IDEMPOTENCY_HEADER = os.getenv("IDEMPOTENCY_HEADER", "Idempotency-Key")
+IDEMPOTENCY_HASH_PAYLOAD = os.getenv("IDEMPOTENCY_HASH_PAYLOAD", "false").lower() == "true"
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", 3600))
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 60))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 100000))
+IDEMPOTENCY_BLOOM_CAPACITY = int(os.getenv("IDEMPOTENCY_BLOOM_CAPACITY", 1000000))
+IDEMPOTENCY_BLOOM_ERROR_RATE = float(os.getenv("IDEMPOTENCY_BLOOM_ERROR_RATE", 0.01))
+
+# Batch ingestion
+BATCH_MAX_EVENTS = int(os.getenv("BATCH_MAX_EVENTS", 1000))
+
+# Most upserts, disables, enables and deletes in one bulk endpoint request
+ENDPOINT_BULK_MAX = int(os.getenv("ENDPOINT_BULK_MAX", 10000))
+
+# Dotted path of the event type in webhook bodies, used by endpoint filters
+EVENT_TYPE_FIELD = os.getenv("EVENT_TYPE_FIELD", "type")
+
+# Rate limiting: endpoints set {"rate", "burst"} in rate_limit / host_rate_limit; HOST_RATE=0 leaves hosts unlimited by default
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", 10))
+RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS", 0.05))
+RATE_LIMIT_HOST_RATE = float(os.getenv("RATE_LIMIT_HOST_RATE", 0))
+RATE_LIMIT_HOST_BURST = float(os.getenv("RATE_LIMIT_HOST_BURST", 0))
+
+# Stage metrics on /metrics; the webhook_id label can be turned off for very many webhooks
+STAGE_METRICS_ENABLED = os.getenv("STAGE_METRICS_ENABLED", "true").lower() == "true"
+STAGE_METRICS_WEBHOOK_LABEL = os.getenv("STAGE_METRICS_WEBHOOK_LABEL", "true").lower() == "true"
+STAGE_METRICS_MAX_SERIES = int(os.getenv("STAGE_METRICS_MAX_SERIES", 5000))
+
+# Request tracing: share of ingress requests traced, ring buffer size, and the header that forces a trace
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 1000))
+TRACE_HEADER = os.getenv("TRACE_HEADER", "X-Trace")
+
+# Day-partitioned logs (logs_YYYYMMDD). Partitions older than the retention are
+# dropped, after being archived to LOG_ARCHIVE_DIR when it is set.
+LOG_PARTITIONED = os.getenv("LOG_PARTITIONED", "false").lower() == "true"
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", 30))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "")
+LOG_RETENTION_INTERVAL_SECONDS = float(os.getenv("LOG_RETENTION_INTERVAL_SECONDS", 3600))
+
+# Columnar snapshot of the delivery logs for /api/analytics (needs numpy); off
+# when LOG_SNAPSHOT_DIR is empty. Logs younger than the lag wait for the next export.
+LOG_SNAPSHOT_DIR = os.getenv("LOG_SNAPSHOT_DIR", "")
+LOG_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("LOG_SNAPSHOT_INTERVAL_SECONDS", 3600))
+LOG_SNAPSHOT_LAG_SECONDS = float(os.getenv("LOG_SNAPSHOT_LAG_SECONDS", 60))
+
+# Replays: forward logs reference the event body in the payload store so a
+# worker can re-send a webhook's or endpoint's events from a time range, paced
+# at a rate (events per second) with at most `concurrency` sends in flight.
+REPLAY_ENABLED = os.getenv("REPLAY_ENABLED", "false").lower() == "true"
+REPLAY_WORKERS = int(os.getenv("REPLAY_WORKERS", 1))
+REPLAY_DEFAULT_RATE = float(os.getenv("REPLAY_DEFAULT_RATE", 50))
+REPLAY_MAX_RATE = float(os.getenv("REPLAY_MAX_RATE", 1000))
+REPLAY_DEFAULT_CONCURRENCY = int(os.getenv("REPLAY_DEFAULT_CONCURRENCY", 10))
+REPLAY_MAX_CONCURRENCY = int(os.getenv("REPLAY_MAX_CONCURRENCY", 100))
+REPLAY_LEASE_SECONDS = int(os.getenv("REPLAY_LEASE_SECONDS", 60))
+REPLAY_POLL_INTERVAL_SECONDS = float(os.getenv("REPLAY_POLL_INTERVAL_SECONDS", 5))
+
+# Fast start: skip flasgger at startup and serve the Swagger spec written to
+# SWAGGER_SPEC_PATH by `python -m controllers.docs_controller`.
+FAST_START = os.getenv("FAST_START", "false").lower() == "true"
+SWAGGER_SPEC_PATH = os.getenv("SWAGGER_SPEC_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "swagger.json"))
+
+
+class Lazy:
+    # Builds the wrapped object on first use, so importing config doesn't
+    # resolve or connect to Mongo before a request needs it.
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __getitem__(self, name):
+        return self._get()[name]
+
+
+mongo = Lazy(lambda: MongoClient(MONGO_URI))
+db = Lazy(lambda: mongo['webhook_db'])
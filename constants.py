@@ -6,14 +6,69 @@ LOGS_COLLECTION = "logs"
 SUCCESS_MESSAGE = "success"
 ENDPOINT_DELETED_MESSAGE = "Endpoint deleted successfully"
 WEBHOOK_NOT_FOUND_MESSAGE = "Webhook not found"
+ENDPOINT_NOT_FOUND_MESSAGE = "Endpoint not found"
+ENDPOINT_URL_REQUIRED_MESSAGE = "Every endpoint needs a url"
 DATABASE_ERROR_MESSAGE = "Database error"
 FORWARDING_ERROR_MESSAGE = "Error forwarding to endpoint"
+ACCEPTED_MESSAGE = "accepted"
+CIRCUIT_OPEN_MESSAGE = "Circuit open, delivery deferred"
+INVALID_CURSOR_MESSAGE = "Invalid pagination cursor"
+INVALID_FILTER_MESSAGE = "Invalid endpoint filter"
+INVALID_RATE_LIMIT_MESSAGE = "Invalid rate limit, expected {\"rate\": <per second>, \"burst\": <count>}"
+RATE_LIMITED_MESSAGE = "Rate limited, delivery deferred"
+RETRY_CANCELLED_MESSAGE = "Endpoint removed or disabled, retry cancelled"
+WORKER_EXITED_MESSAGE = "Delivery worker exited"
+INVALID_BATCH_MESSAGE = "Expected a JSON array or NDJSON lines of events"
+TRACE_NOT_FOUND_MESSAGE = "Trace not found"
+REPLAY_NOT_FOUND_MESSAGE = "Replay not found"
+REPLAY_DISABLED_MESSAGE = "Replays are disabled, set REPLAY_ENABLED=true"
+ANALYTICS_UNAVAILABLE_MESSAGE = "Delivery analytics need numpy and LOG_SNAPSHOT_DIR"
+SWAGGER_SPEC_MISSING_MESSAGE = "Swagger spec not built, run python -m controllers.docs_controller"
+DUPLICATE_IN_PROGRESS_MESSAGE = "A request with this idempotency key is still being processed"
 
-# Status Constants
-UPTIME = "24h"  # Example static value
-AVERAGE_LATENCY_MS = 100  # Example static value
+# Outbox Event Status
+OUTBOX_PENDING = "pending"
+OUTBOX_DELIVERING = "delivering"
+OUTBOX_DELIVERED = "delivered"
+OUTBOX_FAILED = "failed"
+OUTBOX_RETRYING = "retrying"
+
+# Retry Status
+RETRY_SCHEDULED = "scheduled"
+RETRY_IN_FLIGHT = "in_flight"
+
+# Replay Status
+REPLAY_PENDING = "pending"
+REPLAY_RUNNING = "running"
+REPLAY_PAUSED = "paused"
+REPLAY_COMPLETED = "completed"
+REPLAY_CANCELLED = "cancelled"
+REPLAY_FAILED = "failed"
+
+# Idempotency Key Status
+IDEMPOTENCY_IN_PROGRESS = "in_progress"
+IDEMPOTENCY_COMPLETED = "completed"
+
+# Circuit Breaker States
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# Log Queue Full Policies
+LOG_POLICY_BLOCK = "block"
+LOG_POLICY_DROP = "drop"
+
+# Pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
 
 # Response Codes
 RESPONSE_CODE_SUCCESS = 200
+RESPONSE_CODE_ACCEPTED = 202
+RESPONSE_CODE_BAD_REQUEST = 400
 RESPONSE_CODE_ERROR = 500
 RESPONSE_CODE_NOT_FOUND = 404
+RESPONSE_CODE_CONFLICT = 409
+RESPONSE_CODE_TOO_MANY_REQUESTS = 429
+RESPONSE_CODE_UNAVAILABLE = 503
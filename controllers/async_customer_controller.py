@@ -0,0 +1,33 @@
+import asyncio
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+def get_customer_service(request):
+    return request.app.state.customer_service
+
+async def call_customer_service(request, method):
+    # CustomerService writes logs through pymongo, so it runs in the default
+    # executor instead of on the event loop.
+    data = await request.json()
+    handler = getattr(get_customer_service(request), method)
+    result, status_code = await asyncio.get_running_loop().run_in_executor(None, handler, data)
+    return JSONResponse(result, status_code=status_code)
+
+async def webhook_callback(request):
+    return await call_customer_service(request, "webhook_callback")
+
+async def event1(request):
+    return await call_customer_service(request, "event1")
+
+async def event2(request):
+    return await call_customer_service(request, "event2")
+
+async def event3(request):
+    return await call_customer_service(request, "event3")
+
+customer_routes = [
+    Route('/customers/callback', webhook_callback, methods=['POST']),
+    Route('/customers/event1', event1, methods=['POST']),
+    Route('/customers/event2', event2, methods=['POST']),
+    Route('/customers/event3', event3, methods=['POST']),
+]
@@ -0,0 +1,23 @@
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from config import OUTBOX_ENABLED, IDEMPOTENCY_HEADER
+from services.payload import Payload, read_payload
+
+def get_webhook_service(request):
+    return request.app.state.webhook_service
+
+async def receive_webhook(request):
+    webhook_id = request.path_params['webhook_id']
+    mimetype = request.headers.get('content-type', '').split(';')[0].strip()
+    payload = read_payload(await request.body(), mimetype)
+    if payload is None:
+        return JSONResponse({'error': 'No data provided'}, status_code=400)
+    result, status_code = await get_webhook_service(request).handle_webhook(
+        webhook_id, payload, request.headers.get(IDEMPOTENCY_HEADER), accept=OUTBOX_ENABLED)
+    if isinstance(result, Payload):
+        return Response(result.body, status_code=status_code, media_type=result.content_type)
+    return JSONResponse(result, status_code=status_code)
+
+webhook_routes = [
+    Route('/webhooks/{webhook_id}', receive_webhook, methods=['POST']),
+]
@@ -1,14 +1,8 @@
 from flask import Blueprint, current_app, jsonify, request
-from flasgger.utils import swag_from
-from services.customer_service import CustomerService
+from controllers.swagger import swag_from
 
 customer_blueprint = Blueprint('customer', __name__)
 
-@customer_blueprint.before_app_request
-def initialize_service():
-    if 'customer_service' not in current_app.config:
-        current_app.config['customer_service'] = CustomerService()
-
 def get_customer_service():
     return current_app.config['customer_service']
 
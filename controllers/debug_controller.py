@@ -0,0 +1,65 @@
+from flask import Blueprint, request, jsonify, current_app
+from controllers.swagger import swag_from
+
+debug_blueprint = Blueprint('debug', __name__)
+
+def get_webhook_service():
+    return current_app.config['webhook_service']
+
+@debug_blueprint.route('/debug/traces', methods=['GET'])
+@swag_from({
+    'summary': 'Recent sampled request traces, newest first',
+    'parameters': [
+        {'name': 'webhook_id', 'in': 'query', 'type': 'string', 'required': False},
+        {'name': 'min_duration_ms', 'in': 'query', 'type': 'number', 'required': False,
+         'description': 'Only traces that took at least this long'},
+        {'name': 'limit', 'in': 'query', 'type': 'integer', 'required': False, 'default': 50}
+    ],
+    'responses': {
+        200: {
+            'description': 'Traces held in this process (the last TRACE_BUFFER_SIZE)',
+            'examples': {
+                'application/json': {
+                    'traces': [
+                        {
+                            'trace_id': '667af9d742482dbaf49bcd63',
+                            'webhook_id': '667af9d742482dbaf49bcd60',
+                            'forced': False,
+                            'started_at': '2024-06-25T12:00:00Z',
+                            'duration_ms': 41.2,
+                            'root': {
+                                'name': 'receive_webhook',
+                                'start_ms': 0.0,
+                                'duration_ms': 41.2,
+                                'attributes': {},
+                                'children': [
+                                    {'name': 'forward', 'start_ms': 1.3, 'duration_ms': 38.9,
+                                     'attributes': {'url': 'http://example.com', 'connect_end_ms': 3.1, 'status_code': 200},
+                                     'children': []}
+                                ]
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+    }
+})
+def get_traces():
+    result, status_code = get_webhook_service().get_traces(
+        webhook_id=request.args.get('webhook_id'),
+        min_duration_ms=request.args.get('min_duration_ms', type=float),
+        limit=request.args.get('limit', 50, type=int))
+    return jsonify(result), status_code
+
+@debug_blueprint.route('/debug/traces/<trace_id>', methods=['GET'])
+@swag_from({
+    'summary': 'Get one trace with its span tree',
+    'responses': {
+        200: {'description': 'The trace'},
+        404: {'description': 'Trace not found, or already evicted from the buffer'}
+    }
+})
+def get_trace(trace_id):
+    result, status_code = get_webhook_service().get_trace(trace_id)
+    return jsonify(result), status_code
@@ -0,0 +1,41 @@
+import json
+import sys
+from flask import Blueprint, Response
+from config import SWAGGER_SPEC_PATH
+from constants import SWAGGER_SPEC_MISSING_MESSAGE
+from exceptions import NotFoundError
+
+docs_blueprint = Blueprint('docs', __name__)
+
+_spec = None
+
+def load_spec(path=SWAGGER_SPEC_PATH):
+    global _spec
+    if _spec is None:
+        try:
+            with open(path, 'rb') as spec_file:
+                _spec = spec_file.read()
+        except FileNotFoundError:
+            return None
+    return _spec
+
+@docs_blueprint.route('/apispec_1.json', methods=['GET'])
+def get_apispec():
+    # Served from the file written at build time, so FAST_START never imports flasgger.
+    spec = load_spec()
+    if spec is None:
+        raise NotFoundError(SWAGGER_SPEC_MISSING_MESSAGE)
+    return Response(spec, content_type='application/json')
+
+def write_spec(app, path=SWAGGER_SPEC_PATH):
+    from flasgger import Swagger
+    swagger = getattr(app, 'swag', None) or Swagger(app)
+    with app.test_request_context():
+        spec = swagger.get_apispecs()
+    with open(path, 'w') as spec_file:
+        json.dump(spec, spec_file, indent=2, sort_keys=True, default=str)
+    return path
+
+if __name__ == '__main__':
+    from app import app
+    print(f"Swagger spec written to {write_spec(app, *sys.argv[1:])}")
@@ -1,5 +1,5 @@
 from flask import Blueprint, request, jsonify, current_app
-from flasgger.utils import swag_from
+from controllers.swagger import swag_from
 from services.log_service import LogService
 
 log_blueprint = Blueprint('log', __name__)
@@ -0,0 +1,21 @@
+from flask import Blueprint, Response, current_app
+from controllers.swagger import swag_from
+from services.stage_metrics_service import PROMETHEUS_CONTENT_TYPE
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+@swag_from({
+    'summary': 'Stage latency histograms and counters in the Prometheus text format',
+    'produces': ['text/plain'],
+    'responses': {
+        200: {
+            'description': 'Prometheus exposition of this process',
+            'examples': {
+                'text/plain': 'webhook_stage_duration_seconds_bucket{stage="forward",webhook_id="667af9d742482dbaf49bcd63",host="example.com",le="0.05"} 12'
+            }
+        }
+    }
+})
+def get_metrics():
+    return Response(current_app.config['webhook_service'].get_prometheus_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
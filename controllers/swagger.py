@@ -0,0 +1,7 @@
+def swag_from(specs):
+    # Attaches the spec the way flasgger.utils.swag_from does for dict specs
+    # without validation, without importing flasgger when the routes load.
+    def decorator(function):
+        function.specs_dict = specs
+        return function
+    return decorator
@@ -0,0 +1,19 @@
+import asyncio
+import threading
+from unittest.mock import MagicMock, AsyncMock
+from controllers.async_customer_controller import event1
+
+def test_customer_service_runs_off_the_event_loop():
+    threads = []
+    request = MagicMock()
+    request.json = AsyncMock(return_value={"key": "value"})
+    request.app.state.customer_service.event1.side_effect = lambda data: threads.append(threading.get_ident()) or ({"message": "ok"}, 200)
+
+    async def call():
+        return await event1(request), threading.get_ident()
+
+    response, loop_thread = asyncio.run(call())
+
+    assert response.status_code == 200
+    request.app.state.customer_service.event1.assert_called_once_with({"key": "value"})
+    assert threads and threads[0] != loop_thread
@@ -43,4 +43,9 @@ def test_trigger_webhook(client):
     data = {"data": {"key": "value"}}
     response = client.post(f"/api/webhooks/{webhook_id}", json=data)
     assert response.status_code == 200
-    assert response.json['data'] != None
\ No newline at end of file
+    assert response.json['data'] != None
+
+def test_trigger_webhook_rejects_malformed_json(client):
+    webhook_id = "667af9d742482dbaf49bcd62"
+    response = client.post(f"/api/webhooks/{webhook_id}", data=b'{"key": ', content_type="application/json")
+    assert response.status_code == 400
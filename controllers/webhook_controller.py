@@ -1,14 +1,12 @@
-from flask import Blueprint, request, jsonify, current_app
-from flasgger.utils import swag_from
-from services.webhook_service import WebhookService
+from flask import Blueprint, Response, request, jsonify, current_app, make_response, stream_with_context
+from controllers.swagger import swag_from
+from config import IDEMPOTENCY_HEADER, TRACE_HEADER
+from constants import DEFAULT_PAGE_SIZE
+from services.pagination import parse_fields
+from services.payload import Payload, read_batch, read_payload
 
 webhook_blueprint = Blueprint('webhook', __name__)
 
-@webhook_blueprint.before_app_request
-def initialize_service():
-    if 'webhook_service' not in current_app.config:
-        current_app.config['webhook_service'] = WebhookService()
-
 def get_webhook_service():
     return current_app.config['webhook_service']
 
@@ -80,7 +78,22 @@ def create_webhook():
                         'items': {
                             'type': 'object',
                             'properties': {
-                                'url': {'type': 'string'}
+                                'url': {'type': 'string'},
+                                'filter': {
+                                    'type': 'object',
+                                    'properties': {
+                                        'event_types': {'type': 'array', 'items': {'type': 'string'}},
+                                        'match': {'type': 'object'}
+                                    }
+                                },
+                                'rate_limit': {
+                                    'type': 'object',
+                                    'properties': {'rate': {'type': 'number'}, 'burst': {'type': 'number'}}
+                                },
+                                'host_rate_limit': {
+                                    'type': 'object',
+                                    'properties': {'rate': {'type': 'number'}, 'burst': {'type': 'number'}}
+                                }
                             }
                         }
                     }
@@ -88,7 +101,7 @@ def create_webhook():
                 'example': {
                     'endpoints': [
                         {'url': 'http://example1.com'},
-                        {'url': 'http://example2.com'}
+                        {'url': 'http://example2.com', 'filter': {'event_types': ['order.paid'], 'match': {'data.amount': {'$gte': 100}}}}
                     ]
                 }
             }
@@ -118,51 +131,427 @@ def delete_endpoint(webhook_id, endpoint_id):
     result, status_code = get_webhook_service().delete_endpoint(webhook_id, endpoint_id)
     return jsonify(result), status_code
 
+@webhook_blueprint.route('/webhooks/<webhook_id>/endpoints/bulk', methods=['POST'])
+@swag_from({
+    'summary': 'Upsert, disable, enable and delete endpoints in one request',
+    'responses': {
+        200: {
+            'description': 'Counts of the applied operations and any that failed',
+            'examples': {
+                'application/json': {
+                    'webhook_id': '667af9d742482dbaf49bcd62',
+                    'upserted': 1,
+                    'matched': 2,
+                    'modified': 2,
+                    'deleted': 1,
+                    'endpoints': [{'endpoint_id': '667afa0142482dbaf49bcd63', 'url': 'http://example3.com'}],
+                    'errors': []
+                }
+            }
+        }
+    },
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'upsert': {'type': 'array', 'items': {'type': 'object'},
+                               'description': 'Endpoints, matched by endpoint_id if given, otherwise by url'},
+                    'disable': {'type': 'array', 'items': {'type': 'string'}},
+                    'enable': {'type': 'array', 'items': {'type': 'string'}},
+                    'delete': {'type': 'array', 'items': {'type': 'string'}}
+                },
+                'example': {
+                    'upsert': [{'url': 'http://example3.com', 'filter': {'event_types': ['order.paid']}}],
+                    'disable': ['667af9ee42482dbaf49bcd61'],
+                    'delete': ['667af9ee42482dbaf49bcd60']
+                }
+            }
+        }
+    ]
+})
+def bulk_update_endpoints(webhook_id):
+    data = request.json
+    result, status_code = get_webhook_service().bulk_update_endpoints(webhook_id, data)
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/webhooks/<webhook_id>/endpoints', methods=['GET'])
+@swag_from({
+    'summary': 'List the endpoints of a webhook',
+    'parameters': [
+        {'name': 'limit', 'in': 'query', 'type': 'integer', 'default': 100, 'description': 'Page size (max 1000)'},
+        {'name': 'next', 'in': 'query', 'type': 'string', 'description': 'Cursor returned by the previous page'},
+        {'name': 'include_disabled', 'in': 'query', 'type': 'boolean', 'default': True}
+    ],
+    'responses': {
+        200: {
+            'description': 'Page of endpoints in creation order',
+            'examples': {
+                'application/json': {
+                    'endpoints': [
+                        {'endpoint_id': '667af9ee42482dbaf49bcd61', 'url': 'http://example1.com', 'disabled': False}
+                    ],
+                    'next': 'WyI2NjdhZjllZTQyNDgyZGJhZjQ5YmNkNjEiXQ'
+                }
+            }
+        }
+    }
+})
+def list_endpoints(webhook_id):
+    result, status_code = get_webhook_service().list_endpoints(
+        webhook_id,
+        limit=request.args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+        after=request.args.get('next'),
+        include_disabled=request.args.get('include_disabled', 'true').lower() != 'false',
+    )
+    return jsonify(result), status_code
+
 @webhook_blueprint.route('/webhooks', methods=['GET'])
 @swag_from({
-    'summary': 'List all webhooks',
+    'summary': 'List webhooks',
+    'parameters': [
+        {'name': 'customer_id', 'in': 'query', 'type': 'string'},
+        {'name': 'limit', 'in': 'query', 'type': 'integer', 'default': 100, 'description': 'Page size (max 1000)'},
+        {'name': 'next', 'in': 'query', 'type': 'string', 'description': 'Cursor returned by the previous page'},
+        {'name': 'include_endpoints', 'in': 'query', 'type': 'boolean', 'default': True},
+        {'name': 'format', 'in': 'query', 'type': 'string', 'enum': ['json', 'ndjson'],
+         'description': 'ndjson streams every matching webhook, one JSON document per line'}
+    ],
+    'responses': {
+        200: {
+            'description': 'Page of webhooks',
+            'examples': {
+                'application/json': {
+                    'webhooks': [
+                        {
+                            '_id': '667af9d742482dbaf49bcd62',
+                            'customer_id': '123',
+                            'webhook_url': 'http://example.com',
+                            'endpoints': []
+                        }
+                    ],
+                    'next': 'WyI2NjdhZjlkNzQyNDgyZGJhZjQ5YmNkNjIiXQ'
+                }
+            }
+        }
+    }
+})
+def list_webhooks():
+    filters = {
+        'customer_id': request.args.get('customer_id'),
+        'after': request.args.get('next'),
+        'include_endpoints': request.args.get('include_endpoints', 'true').lower() != 'false',
+    }
+    if request.args.get('format') == 'ndjson':
+        webhooks = get_webhook_service().stream_webhooks(limit=request.args.get('limit', type=int), **filters)
+        return Response(stream_with_context(webhooks), mimetype='application/x-ndjson')
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    result, status_code = get_webhook_service().list_webhooks(limit=limit, **filters)
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/webhooks/cache', methods=['GET'])
+@swag_from({
+    'summary': 'Webhook configuration cache statistics',
     'responses': {
         200: {
-            'description': 'List of webhooks',
+            'description': 'Cache size and hit/miss counters for this process',
+            'examples': {
+                'application/json': {
+                    'size': 120,
+                    'max_size': 10000,
+                    'ttl_seconds': 30,
+                    'hits': 98230,
+                    'misses': 412,
+                    'hit_rate': 0.9958
+                }
+            }
+        }
+    }
+})
+def get_cache_stats():
+    result, status_code = get_webhook_service().get_cache_stats()
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/logs/webhooks/<webhook_id>', methods=['GET'])
+@swag_from({
+    'summary': 'Get webhook logs',
+    'parameters': [
+        {'name': 'webhook_id', 'in': 'path', 'type': 'string', 'required': True},
+        {'name': 'limit', 'in': 'query', 'type': 'integer', 'default': 100, 'description': 'Page size (max 1000)'},
+        {'name': 'next', 'in': 'query', 'type': 'string', 'description': 'Cursor returned by the previous page'},
+        {'name': 'fields', 'in': 'query', 'type': 'string', 'description': 'Comma-separated fields to return'},
+        {'name': 'since', 'in': 'query', 'type': 'string', 'description': 'ISO timestamp, inclusive'},
+        {'name': 'until', 'in': 'query', 'type': 'string', 'description': 'ISO timestamp, exclusive'},
+        {'name': 'endpoint_id', 'in': 'query', 'type': 'string'},
+        {'name': 'response_code', 'in': 'query', 'type': 'integer'},
+        {'name': 'format', 'in': 'query', 'type': 'string', 'enum': ['json', 'ndjson'],
+         'description': 'ndjson streams every matching log, one JSON document per line'}
+    ],
+    'responses': {
+        200: {
+            'description': 'Page of webhook logs, oldest first',
+            'examples': {
+                'application/json': {
+                    'logs': [
+                        {
+                            'webhook_id': '1',
+                            'endpoint_id': '2',
+                            'status': 'success',
+                            'response_code': 200,
+                            'response_body': 'Forwarded successfully',
+                            'timestamp': '2023-06-01T12:00:00Z'
+                        }
+                    ],
+                    'next': 'WyIyMDIzLTA2LTAxVDEyOjAwOjAwWiIsICI2NjdhZjlkNzQyNDgyZGJhZjQ5YmNkNjIiXQ'
+                }
+            }
+        }
+    }
+})
+def get_webhook_logs(webhook_id):
+    filters = {
+        'after': request.args.get('next'),
+        'fields': parse_fields(request.args.get('fields')),
+        'since': request.args.get('since'),
+        'until': request.args.get('until'),
+        'endpoint_id': request.args.get('endpoint_id'),
+        'response_code': request.args.get('response_code', type=int),
+    }
+    if request.args.get('format') == 'ndjson':
+        logs = get_webhook_service().stream_webhook_logs(webhook_id, limit=request.args.get('limit', type=int), **filters)
+        return Response(stream_with_context(logs), mimetype='application/x-ndjson')
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    result, status_code = get_webhook_service().get_webhook_logs(webhook_id, limit=limit, **filters)
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/webhooks/<webhook_id>/dead_letters', methods=['GET'])
+@swag_from({
+    'summary': 'List deliveries that exhausted their retries',
+    'parameters': [
+        {'name': 'webhook_id', 'in': 'path', 'type': 'string', 'required': True},
+        {'name': 'limit', 'in': 'query', 'type': 'integer', 'default': 100}
+    ],
+    'responses': {
+        200: {
+            'description': 'List of dead-lettered deliveries, newest first',
             'examples': {
                 'application/json': [
                     {
                         'webhook_id': '1',
-                        'webhook_url': 'http://example.com',
-                        'endpoints': []
+                        'endpoint_id': '2',
+                        'url': 'http://example1.com',
+                        'payload': {'key': 'value'},
+                        'attempts': 5,
+                        'last_error': 'Endpoint http://example1.com returned status code 503',
+                        'dead_at': '2023-06-01T12:00:00Z'
                     }
                 ]
             }
         }
     }
 })
-def list_webhooks():
-    result, status_code = get_webhook_service().list_webhooks()
+def get_dead_letters(webhook_id):
+    limit = request.args.get('limit', 100, type=int)
+    result, status_code = get_webhook_service().get_dead_letters(webhook_id, limit)
     return jsonify(result), status_code
 
-@webhook_blueprint.route('/logs/webhooks/<webhook_id>', methods=['GET'])
+@webhook_blueprint.route('/webhooks/<webhook_id>/health', methods=['GET'])
 @swag_from({
-    'summary': 'Get webhook logs',
+    'summary': 'Get circuit breaker state of each endpoint',
     'responses': {
         200: {
-            'description': 'List of webhook logs',
+            'description': 'Health of each endpoint of the webhook',
             'examples': {
                 'application/json': [
                     {
-                        'webhook_id': '1',
                         'endpoint_id': '2',
-                        'status': 'success',
-                        'response_code': 200,
-                        'response_body': 'Forwarded successfully',
-                        'timestamp': '2023-06-01T12:00:00Z'
+                        'url': 'http://example1.com',
+                        'state': 'open',
+                        'requests': 12,
+                        'failure_rate': 0.75,
+                        'opened_at': '2023-06-01T12:00:00Z'
                     }
                 ]
             }
         }
     }
 })
-def get_webhook_logs(webhook_id):
-    result, status_code = get_webhook_service().get_webhook_logs(webhook_id)
+def get_endpoint_health(webhook_id):
+    result, status_code = get_webhook_service().get_endpoint_health(webhook_id)
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/webhooks/<webhook_id>/rate_limits', methods=['GET'])
+@swag_from({
+    'summary': 'Get rate limit buckets of each endpoint in this process',
+    'responses': {
+        200: {
+            'description': 'Token bucket state of each endpoint and of its host',
+            'examples': {
+                'application/json': [
+                    {
+                        'endpoint_id': '2',
+                        'url': 'http://example1.com',
+                        'endpoint': {'rate': 5.0, 'burst': 10.0, 'queued': 3, 'delivered': 120, 'throttled': 40, 'throttle_seconds': 12.5, 'deferred': 0},
+                        'host': None
+                    }
+                ]
+            }
+        }
+    }
+})
+def get_rate_limits(webhook_id):
+    result, status_code = get_webhook_service().get_rate_limits(webhook_id)
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/webhooks/<webhook_id>/replays', methods=['POST'])
+@swag_from({
+    'summary': 'Replay the events logged for a webhook in a time range',
+    'responses': {
+        202: {
+            'description': 'Replay created, a replay worker sends the events in the background',
+            'examples': {
+                'application/json': {
+                    'replay_id': '667b0a1c42482dbaf49bcd70',
+                    'webhook_id': '667af9d742482dbaf49bcd62',
+                    'endpoint_id': None,
+                    'since': '2024-06-25T12:00:00Z',
+                    'until': '2024-06-25T14:00:00Z',
+                    'only_failed': True,
+                    'rate': 50.0,
+                    'concurrency': 10,
+                    'status': 'running',
+                    'checkpoint': 'WyIyMDI0LTA2LTI1VDEyOjMwOjAwLjAwMDAwMFoiLCAiNjY3YWZhMDE0MjQ4MmRiYWY0OWJjZDYzIl0',
+                    'counts': {'read': 1200, 'delivered': 310, 'failed': 4, 'skipped': 2},
+                    'created_at': '2024-06-25T14:05:00.000000Z',
+                    'updated_at': '2024-06-25T14:05:09.000000Z'
+                }
+            }
+        }
+    },
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'since': {'type': 'string', 'description': 'ISO timestamp of the first log to replay'},
+                    'until': {'type': 'string', 'description': 'ISO timestamp the replay stops before, defaults to now'},
+                    'endpoint_id': {'type': 'string', 'description': 'Replay to this endpoint only'},
+                    'only_failed': {'type': 'boolean', 'default': True, 'description': 'Skip logs of successful deliveries'},
+                    'rate': {'type': 'number', 'default': 50, 'description': 'Events sent per second'},
+                    'concurrency': {'type': 'integer', 'default': 10, 'description': 'Events in flight at a time'}
+                },
+                'example': {'since': '2024-06-25T12:00:00Z', 'until': '2024-06-25T14:00:00Z', 'rate': 20}
+            }
+        }
+    ]
+})
+def create_replay(webhook_id):
+    data = request.json
+    if not data:
+        return jsonify({'error': 'No data provided'}), 400
+    result, status_code = get_webhook_service().create_replay(webhook_id, data)
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/webhooks/<webhook_id>/replays', methods=['GET'])
+@swag_from({
+    'summary': 'List the replays of a webhook, newest first',
+    'parameters': [
+        {'name': 'limit', 'in': 'query', 'type': 'integer', 'default': 100}
+    ],
+    'responses': {
+        200: {
+            'description': 'Replays of the webhook',
+            'examples': {
+                'application/json': {'replays': [{
+                    'replay_id': '667b0a1c42482dbaf49bcd70',
+                    'webhook_id': '667af9d742482dbaf49bcd62',
+                    'endpoint_id': None,
+                    'since': '2024-06-25T12:00:00Z',
+                    'until': '2024-06-25T14:00:00Z',
+                    'only_failed': True,
+                    'rate': 50.0,
+                    'concurrency': 10,
+                    'status': 'running',
+                    'checkpoint': 'WyIyMDI0LTA2LTI1VDEyOjMwOjAwLjAwMDAwMFoiLCAiNjY3YWZhMDE0MjQ4MmRiYWY0OWJjZDYzIl0',
+                    'counts': {'read': 1200, 'delivered': 310, 'failed': 4, 'skipped': 2},
+                    'created_at': '2024-06-25T14:05:00.000000Z',
+                    'updated_at': '2024-06-25T14:05:09.000000Z'
+                }]}
+            }
+        }
+    }
+})
+def list_replays(webhook_id):
+    result, status_code = get_webhook_service().list_replays(webhook_id, request.args.get('limit', 100, type=int))
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/replays/<replay_id>', methods=['GET'])
+@swag_from({
+    'summary': 'Get the progress of a replay',
+    'responses': {
+        200: {
+            'description': 'Status, checkpoint and counts of the replay',
+            'examples': {
+                'application/json': {
+                    'replay_id': '667b0a1c42482dbaf49bcd70',
+                    'webhook_id': '667af9d742482dbaf49bcd62',
+                    'endpoint_id': None,
+                    'since': '2024-06-25T12:00:00Z',
+                    'until': '2024-06-25T14:00:00Z',
+                    'only_failed': True,
+                    'rate': 50.0,
+                    'concurrency': 10,
+                    'status': 'running',
+                    'checkpoint': 'WyIyMDI0LTA2LTI1VDEyOjMwOjAwLjAwMDAwMFoiLCAiNjY3YWZhMDE0MjQ4MmRiYWY0OWJjZDYzIl0',
+                    'counts': {'read': 1200, 'delivered': 310, 'failed': 4, 'skipped': 2},
+                    'created_at': '2024-06-25T14:05:00.000000Z',
+                    'updated_at': '2024-06-25T14:05:09.000000Z'
+                }
+            }
+        }
+    }
+})
+def get_replay(replay_id):
+    result, status_code = get_webhook_service().get_replay(replay_id)
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/replays/<replay_id>/<action>', methods=['POST'])
+@swag_from({
+    'summary': 'Pause, resume or cancel a replay',
+    'parameters': [
+        {'name': 'action', 'in': 'path', 'type': 'string', 'enum': ['pause', 'resume', 'cancel'], 'required': True}
+    ],
+    'responses': {
+        200: {
+            'description': 'Replay after the status change; a paused replay resumes from its checkpoint',
+            'examples': {
+                'application/json': {
+                    'replay_id': '667b0a1c42482dbaf49bcd70',
+                    'webhook_id': '667af9d742482dbaf49bcd62',
+                    'endpoint_id': None,
+                    'since': '2024-06-25T12:00:00Z',
+                    'until': '2024-06-25T14:00:00Z',
+                    'only_failed': True,
+                    'rate': 50.0,
+                    'concurrency': 10,
+                    'status': 'running',
+                    'checkpoint': 'WyIyMDI0LTA2LTI1VDEyOjMwOjAwLjAwMDAwMFoiLCAiNjY3YWZhMDE0MjQ4MmRiYWY0OWJjZDYzIl0',
+                    'counts': {'read': 1200, 'delivered': 310, 'failed': 4, 'skipped': 2},
+                    'created_at': '2024-06-25T14:05:00.000000Z',
+                    'updated_at': '2024-06-25T14:05:09.000000Z'
+                }
+            }
+        }
+    }
+})
+def update_replay(replay_id, action):
+    result, status_code = get_webhook_service().update_replay(replay_id, action)
     return jsonify(result), status_code
 
 @webhook_blueprint.route('/webhooks/<webhook_id>', methods=['POST'])
@@ -176,9 +565,35 @@ def get_webhook_logs(webhook_id):
                     'status': 'success'
                 }
             }
+        },
+        202: {
+            'description': 'Webhook accepted for background delivery (OUTBOX_ENABLED=true)',
+            'examples': {
+                'application/json': {
+                    'status': 'accepted',
+                    'event_id': '667af9d742482dbaf49bcd63'
+                }
+            }
+        },
+        409: {
+            'description': 'A request with the same idempotency key is still being processed'
         }
     },
     'parameters': [
+        {
+            'name': 'Idempotency-Key',
+            'in': 'header',
+            'type': 'string',
+            'required': False,
+            'description': 'Repeats of a key within IDEMPOTENCY_WINDOW_SECONDS get the first result back without being forwarded again'
+        },
+        {
+            'name': 'X-Trace',
+            'in': 'header',
+            'type': 'string',
+            'required': False,
+            'description': 'Set to 1 to trace this request regardless of TRACE_SAMPLE_RATE; the trace id comes back in X-Trace-Id'
+        },
         {
             'name': 'body',
             'in': 'body',
@@ -193,8 +608,175 @@ def get_webhook_logs(webhook_id):
     ]
 })
 def receive_webhook(webhook_id):
-    data = request.get_json()
-    if not data:
-        return jsonify({'error': 'No data provided'}), 400
-    result, status_code = get_webhook_service().receive_webhook(webhook_id, data)
+    force = request.headers.get(TRACE_HEADER, '').lower() in ('1', 'true')
+    with get_webhook_service().tracer.trace("receive_webhook", webhook_id, force=force) as trace:
+        response = make_response(handle_receive_webhook(webhook_id))
+    if trace is not None:
+        response.headers['X-Trace-Id'] = trace.trace_id
+    return response
+
+def handle_receive_webhook(webhook_id):
+    stage_metrics = get_webhook_service().stage_metrics
+    with stage_metrics.time("request", webhook_id):
+        with stage_metrics.time("parse", webhook_id):
+            payload = read_payload(request.get_data(cache=False), request.mimetype)
+        if payload is None:
+            return jsonify({'error': 'No data provided'}), 400
+        result, status_code = get_webhook_service().handle_webhook(
+            webhook_id, payload, request.headers.get(IDEMPOTENCY_HEADER), accept=current_app.config.get('OUTBOX_ENABLED'))
+        with stage_metrics.time("respond", webhook_id):
+            if isinstance(result, Payload):
+                return Response(result.body, status=status_code, mimetype=result.content_type)
+            return jsonify(result), status_code
+
+@webhook_blueprint.route('/webhooks/<webhook_id>/batch', methods=['POST'])
+@swag_from({
+    'summary': 'Trigger webhook with a batch of events',
+    'consumes': ['application/json', 'application/x-ndjson'],
+    'responses': {
+        200: {
+            'description': 'Per-event delivery results, in request order',
+            'examples': {
+                'application/json': {
+                    'results': [
+                        {'index': 0, 'status_code': 200},
+                        {'index': 1, 'status_code': 500, 'error': 'Error forwarding to endpoint http://example.com: timeout'}
+                    ],
+                    'delivered': 1,
+                    'failed': 1
+                }
+            }
+        },
+        202: {
+            'description': 'Events accepted for background delivery (OUTBOX_ENABLED=true)'
+        },
+        400: {
+            'description': 'Body is not a JSON array or NDJSON, or has more than BATCH_MAX_EVENTS events'
+        }
+    },
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'array',
+                'items': {'type': 'object'}
+            }
+        }
+    ]
+})
+def receive_batch(webhook_id):
+    stage_metrics = get_webhook_service().stage_metrics
+    with stage_metrics.time("batch_request", webhook_id):
+        with stage_metrics.time("parse", webhook_id):
+            payloads = read_batch(request.get_data(cache=False), request.mimetype)
+        if not payloads:
+            return jsonify({'error': 'No data provided'}), 400
+        if current_app.config.get('OUTBOX_ENABLED'):
+            result, status_code = get_webhook_service().accept_batch(webhook_id, payloads)
+        else:
+            result, status_code = get_webhook_service().receive_batch(webhook_id, payloads)
+        with stage_metrics.time("respond", webhook_id):
+            return jsonify(result), status_code
+
+@webhook_blueprint.route('/status', methods=['GET'])
+@swag_from({
+    'summary': 'Service status',
+    'responses': {
+        200: {
+            'description': 'Uptime of this process and delivery counters and latency across all processes',
+            'examples': {
+                'application/json': {
+                    'uptime': '2:03:04',
+                    'uptime_seconds': 7384,
+                    'total_requests': 120500,
+                    'successful_requests': 119873,
+                    'failed_requests': 627,
+                    'average_latency_ms': 84.2,
+                    'latency_ms': {'p50': 41.3, 'p95': 212.8, 'p99': 734.1}
+                }
+            }
+        }
+    }
+})
+def get_status():
+    result, status_code = get_webhook_service().get_status()
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/status/history', methods=['GET'])
+@swag_from({
+    'summary': 'Per-minute or per-hour delivery rollups',
+    'parameters': [
+        {'name': 'granularity', 'in': 'query', 'type': 'string', 'enum': ['minute', 'hour'], 'default': 'minute'},
+        {'name': 'limit', 'in': 'query', 'type': 'integer', 'default': 60}
+    ],
+    'responses': {
+        200: {
+            'description': 'Rollups, newest first',
+            'examples': {
+                'application/json': [
+                    {
+                        'bucket': '2023-06-01T12:00:00Z',
+                        'total_requests': 2010,
+                        'successful_requests': 2002,
+                        'failed_requests': 8,
+                        'average_latency_ms': 80.5,
+                        'latency_ms': {'p50': 40.1, 'p95': 190.2, 'p99': 610.7}
+                    }
+                ]
+            }
+        }
+    }
+})
+def get_status_history():
+    granularity = request.args.get('granularity', 'minute')
+    limit = request.args.get('limit', 60, type=int)
+    result, status_code = get_webhook_service().get_status_history(granularity, limit)
+    return jsonify(result), status_code
+
+@webhook_blueprint.route('/analytics/deliveries', methods=['GET'])
+@swag_from({
+    'summary': 'Delivery counts, success rate and latency percentiles from the log snapshot',
+    'parameters': [
+        {'name': 'group_by', 'in': 'query', 'type': 'string', 'enum': ['endpoint', 'webhook'], 'default': 'endpoint'},
+        {'name': 'interval', 'in': 'query', 'type': 'string', 'enum': ['minute', 'hour', 'day'],
+         'description': 'Also group by time bucket'},
+        {'name': 'webhook_id', 'in': 'query', 'type': 'string'},
+        {'name': 'endpoint_id', 'in': 'query', 'type': 'string'},
+        {'name': 'since', 'in': 'query', 'type': 'string', 'description': 'ISO timestamp, inclusive'},
+        {'name': 'until', 'in': 'query', 'type': 'string', 'description': 'ISO timestamp, exclusive'}
+    ],
+    'responses': {
+        200: {
+            'description': 'One group per endpoint or webhook (and bucket), covering logs up to snapshot_until',
+            'examples': {
+                'application/json': {
+                    'groups': [
+                        {
+                            'webhook_id': '667af9d742482dbaf49bcd62',
+                            'endpoint_id': '667af9ee42482dbaf49bcd61',
+                            'deliveries': 10480,
+                            'successful': 10391,
+                            'failed': 62,
+                            'deferred': 27,
+                            'success_rate': 0.9915,
+                            'latency_ms': {'avg': 48.2, 'p50': 39.0, 'p95': 121.7, 'p99': 402.3}
+                        }
+                    ],
+                    'snapshot_until': '2024-06-25T11:59:00.421311Z'
+                }
+            }
+        }
+    }
+})
+def get_delivery_analytics():
+    result, status_code = get_webhook_service().get_delivery_analytics(
+        group_by=request.args.get('group_by', 'endpoint'),
+        interval=request.args.get('interval'),
+        webhook_id=request.args.get('webhook_id'),
+        endpoint_id=request.args.get('endpoint_id'),
+        since=request.args.get('since'),
+        until=request.args.get('until'),
+    )
     return jsonify(result), status_code
@@ -1,6 +1,6 @@
 import logging
 from flask import jsonify
-from constants import RESPONSE_CODE_ERROR, RESPONSE_CODE_NOT_FOUND
+from constants import RESPONSE_CODE_ERROR, RESPONSE_CODE_NOT_FOUND, RESPONSE_CODE_BAD_REQUEST
 
 class DatabaseError(Exception):
     pass
@@ -11,15 +11,22 @@ class NotFoundError(Exception):
 class ForwardingError(Exception):
     pass
 
-def handle_exception(e):
+class ValidationError(Exception):
+    pass
+
+def error_response(e):
     if isinstance(e, NotFoundError):
-        response = {"error": str(e)}, RESPONSE_CODE_NOT_FOUND
+        return {"error": str(e)}, RESPONSE_CODE_NOT_FOUND
     elif isinstance(e, DatabaseError):
-        response = {"error": str(e)}, RESPONSE_CODE_ERROR
+        return {"error": str(e)}, RESPONSE_CODE_ERROR
     elif isinstance(e, ForwardingError):
-        response = {"error": str(e)}, RESPONSE_CODE_ERROR
+        return {"error": str(e)}, RESPONSE_CODE_ERROR
+    elif isinstance(e, ValidationError):
+        return {"error": str(e)}, RESPONSE_CODE_BAD_REQUEST
     else:
-        response = {"error": "An unexpected error occurred"}, RESPONSE_CODE_ERROR
+        return {"error": "An unexpected error occurred"}, RESPONSE_CODE_ERROR
 
+def handle_exception(e):
+    response = error_response(e)
     logging.error(f"Exception: {str(e)}")
     return jsonify(response[0]), response[1]
@@ -0,0 +1,110 @@
+import asyncio
+from bson.objectid import ObjectId
+from config import MONGO_URI, IDEMPOTENCY_ENABLED, RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS
+from constants import (
+    RESPONSE_CODE_ERROR, SUCCESS_MESSAGE, WEBHOOK_NOT_FOUND_MESSAGE, DATABASE_ERROR_MESSAGE,
+    RESPONSE_CODE_SUCCESS, RESPONSE_CODE_ACCEPTED, ACCEPTED_MESSAGE, STREAM_BATCH_SIZE
+)
+from exceptions import DatabaseError, NotFoundError
+from services.delivery_service import DeliveryEngine
+from services.endpoints import fan_out_query, merge_endpoints, to_endpoint
+from services.routing_service import RoutingIndex
+
+
+class AsyncWebhookService:
+    # Ingress path for the ASGI entry point. Mongo reads and writes go
+    # through motor and forwards through an aiohttp session on the serving
+    # event loop; the in-memory parts (cache, circuit breakers, metrics, log
+    # queue) are shared with the synchronous WebhookService. Bookkeeping that
+    # may touch pymongo, including log writes, is run in the default executor.
+    def __init__(self, webhook_service):
+        self.webhook_service = webhook_service
+        self.log_service = webhook_service.log_service
+        self.webhook_cache = webhook_service.webhook_cache
+        self.outbox_service = webhook_service.outbox_service
+        self.idempotency_service = webhook_service.idempotency_service
+        self.delivery_engine = DeliveryEngine()
+        self.mongo = None
+
+    async def start(self):
+        from motor.motor_asyncio import AsyncIOMotorClient
+        self.mongo = AsyncIOMotorClient(MONGO_URI)
+        await self.delivery_engine.open_session()
+
+    async def close(self):
+        await self.delivery_engine.close_session()
+        self.mongo.close()
+
+    def get_webhook_collection(self):
+        return self.mongo.webhook_db.webhooks
+
+    def get_endpoints_collection(self):
+        return self.mongo.webhook_db.endpoints
+
+    def get_outbox_collection(self):
+        return self.mongo.webhook_db.outbox
+
+    async def get_webhook(self, webhook_id):
+        webhook, generation = self.webhook_cache.peek(webhook_id)
+        if webhook is None:
+            webhook = await self.get_webhook_collection().find_one({"_id": ObjectId(webhook_id)})
+            if not webhook:
+                raise NotFoundError(WEBHOOK_NOT_FOUND_MESSAGE)
+            cursor = self.get_endpoints_collection().find(fan_out_query(webhook_id)).sort("_id", 1).batch_size(STREAM_BATCH_SIZE)
+            webhook["endpoints"] = merge_endpoints(webhook.get("endpoints"), [to_endpoint(document) async for document in cursor])
+            webhook["routing"] = RoutingIndex(webhook["endpoints"])
+            self.webhook_cache.put(webhook_id, webhook, generation)
+        return webhook
+
+    async def handle_webhook(self, webhook_id, payload, idempotency_key=None, accept=False):
+        handler = self.accept_webhook if accept else self.receive_webhook
+        key = self.idempotency_service.key_for(webhook_id, payload, idempotency_key) if IDEMPOTENCY_ENABLED else None
+        if key is None:
+            return await handler(webhook_id, payload)
+        loop = asyncio.get_running_loop()
+        recorded = await loop.run_in_executor(None, self.idempotency_service.claim, key)
+        if recorded is not None:
+            return recorded
+        try:
+            result, status_code = await handler(webhook_id, payload)
+        except Exception:
+            await loop.run_in_executor(None, self.idempotency_service.release, key)
+            raise
+        await loop.run_in_executor(None, self.idempotency_service.complete, key, result, status_code)
+        return result, status_code
+
+    async def receive_webhook(self, webhook_id, data):
+        try:
+            webhook = await self.get_webhook(webhook_id)
+            await self.deliver_webhook(webhook_id, webhook, data)
+            await self.create_log(webhook_id, None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Webhook received successfully")
+            return data, RESPONSE_CODE_SUCCESS
+        except NotFoundError as e:
+            raise e
+        except Exception as e:
+            await self.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error receiving webhook: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    async def accept_webhook(self, webhook_id, data):
+        try:
+            webhook = await self.get_webhook(webhook_id)
+            event = self.outbox_service.build_event(webhook_id, webhook, data)
+            result = await self.get_outbox_collection().insert_one(event)
+            self.outbox_service.wakeup()
+            return {"status": ACCEPTED_MESSAGE, "event_id": str(result.inserted_id)}, RESPONSE_CODE_ACCEPTED
+        except NotFoundError as e:
+            raise e
+        except Exception as e:
+            await self.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error accepting webhook: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    async def create_log(self, *args):
+        # With LOG_BUFFER_ENABLED=false this is a blocking insert_one.
+        await asyncio.get_running_loop().run_in_executor(None, self.log_service.create_log, *args)
+
+    async def deliver_webhook(self, webhook_id, webhook, data):
+        loop = asyncio.get_running_loop()
+        endpoints = await loop.run_in_executor(None, self.webhook_service.select_endpoints, webhook_id, webhook, data)
+        deliveries = self.webhook_service.build_deliveries(webhook_id, webhook, endpoints, data, RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS)
+        results = await self.delivery_engine.post_each(deliveries)
+        await loop.run_in_executor(None, self.webhook_service.record_results, webhook_id, endpoints, data, results)
@@ -0,0 +1,188 @@
+import collections
+import datetime
+import logging
+import threading
+import time
+from config import (
+    mongo, CIRCUIT_WINDOW_SECONDS, CIRCUIT_MIN_REQUESTS, CIRCUIT_FAILURE_RATE,
+    CIRCUIT_OPEN_SECONDS, CIRCUIT_SYNC_SECONDS
+)
+from constants import CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN
+
+logger = logging.getLogger(__name__)
+
+
+class Breaker:
+    def __init__(self, webhook_id, endpoint_id):
+        self.webhook_id = webhook_id
+        self.endpoint_id = endpoint_id
+        self.state = CIRCUIT_CLOSED
+        self.opened_at = None
+        self.probe_started_at = None
+        self.changed_at = 0.0
+        self.outcomes = collections.deque()
+        self.failures = 0
+
+    def trim(self, now, window):
+        while self.outcomes and self.outcomes[0][0] < now - window:
+            _, ok = self.outcomes.popleft()
+            if not ok:
+                self.failures -= 1
+
+    @property
+    def failure_rate(self):
+        return self.failures / len(self.outcomes) if self.outcomes else 0.0
+
+    def to_dict(self):
+        return {
+            "endpoint_id": self.endpoint_id,
+            "state": self.state,
+            "requests": len(self.outcomes),
+            "failure_rate": round(self.failure_rate, 3),
+            "opened_at": datetime.datetime.utcfromtimestamp(self.opened_at).isoformat() + 'Z' if self.opened_at else None,
+        }
+
+
+class CircuitBreakerService:
+    # Breakers live in process memory so the hot path never waits on Mongo;
+    # state transitions are written to the endpoint_health collection and
+    # transitions made by other processes are pulled in every sync interval
+    # by a background thread.
+    def __init__(self, window_seconds=CIRCUIT_WINDOW_SECONDS, min_requests=CIRCUIT_MIN_REQUESTS,
+                 failure_rate=CIRCUIT_FAILURE_RATE, open_seconds=CIRCUIT_OPEN_SECONDS,
+                 sync_seconds=CIRCUIT_SYNC_SECONDS):
+        self.mongo = mongo
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.sync_seconds = sync_seconds
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._last_refresh = None
+        self._thread = None
+
+    def get_health_collection(self):
+        return self.mongo.webhook_db.endpoint_health
+
+    def _breaker(self, webhook_id, endpoint_id):
+        breaker = self._breakers.get(endpoint_id)
+        if breaker is None:
+            breaker = self._breakers[endpoint_id] = Breaker(webhook_id, endpoint_id)
+        return breaker
+
+    def allow(self, webhook_id, endpoint_id):
+        now = time.time()
+        with self._lock:
+            breaker = self._breaker(webhook_id, endpoint_id)
+            if breaker.state == CIRCUIT_CLOSED:
+                return True
+            if breaker.state == CIRCUIT_OPEN and now - breaker.opened_at < self.open_seconds:
+                return False
+            # Cool-down elapsed: let a single probe through at a time.
+            if breaker.probe_started_at is not None and now - breaker.probe_started_at < self.open_seconds:
+                return False
+            breaker.probe_started_at = now
+            changed = breaker.state != CIRCUIT_HALF_OPEN
+            if changed:
+                self._transition(breaker, CIRCUIT_HALF_OPEN, now)
+        if changed:
+            self._persist(breaker)
+        return True
+
+    def retry_after(self, webhook_id, endpoint_id):
+        # Seconds until allow() may let a probe through to this endpoint.
+        now = time.time()
+        with self._lock:
+            breaker = self._breaker(webhook_id, endpoint_id)
+            started = breaker.probe_started_at if breaker.state == CIRCUIT_HALF_OPEN else breaker.opened_at
+            if breaker.state == CIRCUIT_CLOSED or started is None:
+                return 0.0
+            return max(0.0, started + self.open_seconds - now)
+
+    def record(self, webhook_id, endpoint_id, ok):
+        now = time.time()
+        with self._lock:
+            breaker = self._breaker(webhook_id, endpoint_id)
+            previous = breaker.state
+            if breaker.state == CIRCUIT_HALF_OPEN:
+                breaker.probe_started_at = None
+                breaker.outcomes.clear()
+                breaker.failures = 0
+                self._transition(breaker, CIRCUIT_CLOSED if ok else CIRCUIT_OPEN, now)
+            else:
+                breaker.outcomes.append((now, ok))
+                if not ok:
+                    breaker.failures += 1
+                breaker.trim(now, self.window_seconds)
+                if (breaker.state == CIRCUIT_CLOSED and len(breaker.outcomes) >= self.min_requests
+                        and breaker.failure_rate >= self.failure_rate):
+                    self._transition(breaker, CIRCUIT_OPEN, now)
+            changed = breaker.state != previous
+        if changed:
+            self._persist(breaker)
+
+    def _transition(self, breaker, state, now):
+        breaker.state = state
+        breaker.changed_at = now
+        if state == CIRCUIT_OPEN:
+            breaker.opened_at = now
+        elif state == CIRCUIT_CLOSED:
+            breaker.opened_at = None
+
+    def _persist(self, breaker):
+        try:
+            self.get_health_collection().update_one({"_id": breaker.endpoint_id}, {"$set": {
+                "webhook_id": breaker.webhook_id,
+                "state": breaker.state,
+                "failure_rate": breaker.failure_rate,
+                "opened_at": datetime.datetime.utcfromtimestamp(breaker.opened_at) if breaker.opened_at else None,
+                "updated_at": datetime.datetime.utcfromtimestamp(breaker.changed_at),
+            }}, upsert=True)
+        except Exception as e:
+            logger.error(f"Error persisting circuit state for endpoint {breaker.endpoint_id}: {e}")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="circuit-sync", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.refresh()
+            time.sleep(self.sync_seconds)
+
+    def refresh(self, query=None):
+        # Adopt transitions written by other processes since the last refresh.
+        incremental = query is None
+        if incremental:
+            query = {"updated_at": {"$gt": self._last_refresh}} if self._last_refresh else {}
+        try:
+            documents = list(self.get_health_collection().find(query))
+        except Exception as e:
+            logger.error(f"Error refreshing circuit states: {e}")
+            return
+        with self._lock:
+            for document in documents:
+                updated_at = document["updated_at"].replace(tzinfo=datetime.timezone.utc).timestamp()
+                if incremental and (self._last_refresh is None or document["updated_at"] > self._last_refresh):
+                    self._last_refresh = document["updated_at"]
+                breaker = self._breaker(document.get("webhook_id"), document["_id"])
+                if updated_at <= breaker.changed_at:
+                    continue
+                breaker.state = document["state"]
+                breaker.changed_at = updated_at
+                opened_at = document.get("opened_at")
+                breaker.opened_at = opened_at.replace(tzinfo=datetime.timezone.utc).timestamp() if opened_at else None
+
+    def get_health(self, webhook_id, endpoints):
+        self.refresh({"webhook_id": webhook_id})
+        now = time.time()
+        health = []
+        with self._lock:
+            for endpoint in endpoints:
+                breaker = self._breaker(webhook_id, endpoint["endpoint_id"])
+                breaker.trim(now, self.window_seconds)
+                health.append(dict(breaker.to_dict(), url=endpoint["url"]))
+        return health
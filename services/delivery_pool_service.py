@@ -0,0 +1,313 @@
+import asyncio
+import atexit
+import bisect
+import collections
+import hashlib
+import itertools
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Listener
+from config import DELIVERY_PROCESSES, DELIVERY_HASH_REPLICAS, DELIVERY_ORDERED, DELIVERY_WORKER_START_SECONDS
+from constants import RATE_LIMITED_MESSAGE, WORKER_EXITED_MESSAGE
+from services.delivery_service import DeliveryEngine, DeliveryResult
+from services.payload import Payload, to_payload
+from services.tracing_service import Span
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUTHKEY_ENV = "DELIVERY_WORKER_AUTHKEY"
+
+
+class HashRing:
+    # Consistent hashing of endpoint URLs onto worker indexes. Each worker has
+    # `replicas` points on the ring, so resizing the pool only moves the
+    # endpoints that land next to the added or removed points.
+    def __init__(self, nodes, replicas=DELIVERY_HASH_REPLICAS):
+        points = sorted((self.hash(f"{node}:{replica}"), node) for node in nodes for replica in range(replicas))
+        self._hashes = [point[0] for point in points]
+        self._nodes = [point[1] for point in points]
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def node_for(self, key):
+        if not self._nodes:
+            raise LookupError("Empty hash ring")
+        return self._nodes[bisect.bisect(self._hashes, self.hash(key)) % len(self._nodes)]
+
+
+class DeliveryWorker:
+    # Runs inside a pool process. Jobs for the same endpoint go through one
+    # lane and are sent one after another in the order they arrived; lanes
+    # for different endpoints run concurrently on the worker's engine.
+    def __init__(self, conn, engine=None, ordered=DELIVERY_ORDERED):
+        self.conn = conn
+        self.engine = engine or DeliveryEngine()
+        self.ordered = ordered
+        self.lanes = {}
+        self.tasks = set()
+
+    async def run(self):
+        await self.engine.open_session()
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    job = await loop.run_in_executor(None, self.conn.recv)
+                except EOFError:
+                    break
+                if job is None:
+                    break
+                self.submit(job)
+            while self.tasks:
+                await asyncio.gather(*self.tasks)
+        finally:
+            await self.engine.close_session()
+
+    def submit(self, job):
+        job_id, url = job[0], job[1]
+        key = url if self.ordered else job_id
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = collections.deque()
+            task = asyncio.get_running_loop().create_task(self.drain(key, lane))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        lane.append(job)
+
+    async def drain(self, key, lane):
+        while lane:
+            self.conn.send(await self.send(lane[0]))
+            lane.popleft()
+        del self.lanes[key]
+
+    async def send(self, job):
+        job_id, url, body, content_type, not_before, traced = job
+        # CLOCK_MONOTONIC is system-wide, so the rate limiter's deadline from
+        # the parent process holds here too.
+        delay = not_before - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        span = Span("forward") if traced else None
+        try:
+            result = await self.engine.post(url, Payload(body, content_type), span=span)
+        except Exception as e:
+            result = DeliveryResult(url, error=str(e) or type(e).__name__)
+        return job_id, result.status_code, result.error, result.latency_ms, span.attributes if span else None
+
+
+class WorkerProcess:
+    # Parent-side handle of one pool process: a `python -m` subprocess (so it
+    # doesn't re-import the app's entry module) with a socket connection for
+    # jobs going out and results coming back on a reader thread.
+    def __init__(self, index, directory, on_result, on_exit):
+        self.index = index
+        self.address = os.path.join(directory, f"worker-{index}.sock")
+        self.on_result = on_result
+        self.on_exit = on_exit
+        self.process = None
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        authkey = os.urandom(32)
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        env = dict(os.environ, **{AUTHKEY_ENV: authkey.hex()})
+        self.process = subprocess.Popen([sys.executable, "-m", "services.delivery_pool_service", self.address],
+                                        cwd=ROOT_DIRECTORY, env=env)
+        deadline = time.monotonic() + DELIVERY_WORKER_START_SECONDS
+        while self.conn is None:
+            try:
+                self.conn = Client(self.address, authkey=authkey)
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.process.kill()
+                    raise RuntimeError(f"Delivery worker {self.index} failed to start")
+                time.sleep(0.05)
+        threading.Thread(target=self._read, name=f"delivery-pool-reader-{self.index}", daemon=True).start()
+
+    def send(self, job):
+        with self.lock:
+            self.conn.send(job)
+
+    def _read(self):
+        try:
+            while True:
+                self.on_result(self.conn.recv())
+        except (EOFError, OSError):
+            pass
+        self.on_exit(self)
+
+    def stop(self, timeout):
+        try:
+            self.send(None)
+            self.process.wait(timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+        self.conn.close()
+
+
+class DeliveryPool:
+    # Spreads forwarding across worker processes, each with its own event
+    # loop and aiohttp session, so JSON and TLS work isn't bound by this
+    # process's GIL. Endpoints are partitioned by consistent hashing on their
+    # URL, which keeps every delivery to an endpoint on one worker and in
+    # submission order. Rate limiting stays in this process: the wait is
+    # reserved here and the worker sends no earlier than the deadline.
+    # Same interface as DeliveryEngine (deliver_each, deliver_many, deliver).
+    def __init__(self, processes=DELIVERY_PROCESSES, replicas=DELIVERY_HASH_REPLICAS):
+        self.processes = processes
+        self.ring = HashRing(range(processes), replicas)
+        self.restarts = 0
+        self._workers = []
+        self._pending = {}
+        self._job_ids = itertools.count()
+        self._directory = None
+        self._closing = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._workers:
+                return
+            self._closing = False
+            self._directory = tempfile.mkdtemp(prefix="delivery-pool-")
+            workers = []
+            try:
+                for index in range(self.processes):
+                    worker = WorkerProcess(index, self._directory, self._complete, self._on_exit)
+                    worker.start()
+                    workers.append(worker)
+            except RuntimeError:
+                self._closing = True
+                for worker in workers:
+                    worker.stop(1)
+                raise
+            self._workers = workers
+
+    def submit(self, url, data, throttle=None, span=None):
+        future = Future()
+        wait = 0
+        if throttle is not None:
+            wait = throttle.reserve()
+            if wait is None:
+                if span is not None:
+                    span.finish(deferred=True)
+                future.set_result(DeliveryResult(url, error=RATE_LIMITED_MESSAGE, deferred=True))
+                return future
+        payload = to_payload(data)
+        index = self.ring.node_for(url)
+        job_id = next(self._job_ids)
+        with self._lock:
+            self._pending[job_id] = (future, index, url, throttle, wait, span)
+            worker = self._workers[index]
+        try:
+            worker.send((job_id, url, payload.body, payload.content_type, time.monotonic() + wait, span is not None))
+        except OSError:
+            self._fail(job_id)
+        return future
+
+    def deliver_each(self, deliveries):
+        # Each delivery is (url, data), optionally followed by a throttle and a trace span.
+        if not deliveries:
+            return []
+        self.start()
+        futures = [self.submit(*delivery) for delivery in deliveries]
+        return [future.result() for future in futures]
+
+    def deliver_many(self, urls, data):
+        payload = to_payload(data)
+        return self.deliver_each([(url, payload) for url in urls])
+
+    def deliver(self, url, data):
+        return self.deliver_many([url], data)[0]
+
+    def _complete(self, message):
+        job_id, status_code, error, latency_ms, attributes = message
+        with self._lock:
+            entry = self._pending.pop(job_id, None)
+        if entry is None:
+            return
+        future, index, url, throttle, wait, span = entry
+        if throttle is not None:
+            throttle.release(wait)
+        if span is not None:
+            span.attributes.update(attributes or {})
+            span.finish(worker=index)
+        future.set_result(DeliveryResult(url, status_code, error, latency_ms))
+
+    def _fail(self, job_id):
+        self._complete((job_id, None, WORKER_EXITED_MESSAGE, 0.0, None))
+
+    def _on_exit(self, worker):
+        # Jobs still on a worker that died fail (and go to the retry queue
+        # like any failed delivery); a replacement takes over its slot.
+        with self._lock:
+            lost = [job_id for job_id, entry in self._pending.items() if entry[1] == worker.index]
+            closing = self._closing
+        for job_id in lost:
+            self._fail(job_id)
+        if closing:
+            return
+        logger.error(f"Delivery worker {worker.index} exited, restarting it")
+        replacement = WorkerProcess(worker.index, self._directory, self._complete, self._on_exit)
+        try:
+            replacement.start()
+        except RuntimeError as e:
+            logger.error(str(e))
+            return
+        with self._lock:
+            self._workers[worker.index] = replacement
+            self.restarts += 1
+
+    def stats(self):
+        with self._lock:
+            pending = collections.Counter(entry[1] for entry in self._pending.values())
+            return {
+                "processes": self.processes,
+                "restarts": self.restarts,
+                "pending": [pending[index] for index in range(self.processes)],
+            }
+
+    def close(self, timeout=5):
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._closing = True
+        for worker in workers:
+            worker.stop(timeout)
+        if self._directory:
+            shutil.rmtree(self._directory, ignore_errors=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_delivery_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DeliveryPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def main(address):
+    authkey = bytes.fromhex(os.environ.pop(AUTHKEY_ENV))
+    with Listener(address, authkey=authkey) as listener:
+        with listener.accept() as conn:
+            asyncio.run(DeliveryWorker(conn).run())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1])
@@ -0,0 +1,164 @@
+import asyncio
+import atexit
+import threading
+import time
+from config import DELIVERY_MAX_CONCURRENCY, DELIVERY_LIMIT_PER_HOST, DELIVERY_TIMEOUT_SECONDS
+from constants import RESPONSE_CODE_SUCCESS, RATE_LIMITED_MESSAGE
+from services.payload import to_payload
+
+
+class DeliveryResult:
+    def __init__(self, url, status_code=None, error=None, latency_ms=0.0, deferred=False, retry_after=None, cancelled=False):
+        self.url = url
+        self.status_code = status_code
+        self.error = error
+        self.latency_ms = latency_ms
+        self.deferred = deferred
+        # Not sent and never will be, e.g. a retry whose endpoint was removed.
+        self.cancelled = cancelled
+        # Seconds before a deferred delivery is worth trying again, when known.
+        self.retry_after = retry_after
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _on_event(name):
+    async def mark(session, context, params):
+        span = context.trace_request_ctx
+        if span is not None:
+            span.mark(name)
+    return mark
+
+
+def build_trace_config():
+    # Connection timings for traced deliveries, as offsets into their span.
+    from aiohttp import TraceConfig
+    trace_config = TraceConfig()
+    trace_config.on_dns_resolvehost_start.append(_on_event("dns_start_ms"))
+    trace_config.on_dns_resolvehost_end.append(_on_event("dns_end_ms"))
+    trace_config.on_dns_cache_hit.append(_on_event("dns_cache_hit_ms"))
+    trace_config.on_connection_create_start.append(_on_event("connect_start_ms"))
+    trace_config.on_connection_create_end.append(_on_event("connect_end_ms"))
+    trace_config.on_connection_reuseconn.append(_on_event("connection_reused_ms"))
+    trace_config.on_request_start.append(_on_event("request_start_ms"))
+    trace_config.on_request_end.append(_on_event("response_headers_ms"))
+    return trace_config
+
+
+class DeliveryEngine:
+    # Owns one event loop thread and one pooled aiohttp session for the whole
+    # process, so request threads only submit work and wait for the results.
+    def __init__(self, max_concurrency=DELIVERY_MAX_CONCURRENCY, limit_per_host=DELIVERY_LIMIT_PER_HOST,
+                 timeout=DELIVERY_TIMEOUT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.loop = None
+        self.session = None
+        self.semaphore = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            thread = threading.Thread(target=self._run, args=(loop, ready), name="delivery-engine", daemon=True)
+            thread.start()
+            ready.wait()
+            self.loop = loop
+
+    def _run(self, loop, ready):
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(self.open_session())
+        ready.set()
+        loop.run_forever()
+
+    async def open_session(self):
+        # aiohttp is imported here, on first delivery, to keep it out of app startup.
+        from aiohttp import ClientSession, ClientTimeout, TCPConnector
+        connector = TCPConnector(limit=self.max_concurrency, limit_per_host=self.limit_per_host)
+        self.session = ClientSession(connector=connector, timeout=ClientTimeout(total=self.timeout),
+                                     trace_configs=[build_trace_config()])
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def post(self, url, data, throttle=None, span=None):
+        result = await self._post(url, data, throttle, span)
+        if span is not None:
+            span.finish(status_code=result.status_code, error=result.error, deferred=result.deferred)
+        return result
+
+    async def _post(self, url, data, throttle, span):
+        payload = to_payload(data)
+        if throttle is not None:
+            # Paced before taking a concurrency slot, so a throttled endpoint
+            # doesn't hold up deliveries to others.
+            wait = throttle.reserve()
+            if wait is None:
+                return DeliveryResult(url, error=RATE_LIMITED_MESSAGE, deferred=True)
+            if wait:
+                await asyncio.sleep(wait)
+                throttle.release(wait)
+        if span is not None:
+            span.mark("throttled_ms")
+        async with self.semaphore:
+            if span is not None:
+                span.mark("slot_acquired_ms")
+            started = time.monotonic()
+            try:
+                async with self.session.post(url, data=payload.body, headers={"Content-Type": payload.content_type},
+                                             trace_request_ctx=span) as response:
+                    await response.read()
+                    status_code = response.status
+            except Exception as e:
+                return DeliveryResult(url, error=str(e) or type(e).__name__,
+                                      latency_ms=(time.monotonic() - started) * 1000)
+            latency_ms = (time.monotonic() - started) * 1000
+            if status_code != RESPONSE_CODE_SUCCESS:
+                return DeliveryResult(url, status_code, f"Endpoint {url} returned status code {status_code}", latency_ms)
+            return DeliveryResult(url, status_code, latency_ms=latency_ms)
+
+    async def post_each(self, deliveries):
+        # Each delivery is (url, data), optionally followed by a throttle and a trace span.
+        return await asyncio.gather(*(self.post(*delivery) for delivery in deliveries))
+
+    def deliver_each(self, deliveries):
+        if not deliveries:
+            return []
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self.post_each(deliveries), self.loop)
+        return future.result()
+
+    def deliver_many(self, urls, data):
+        payload = to_payload(data)
+        return self.deliver_each([(url, payload) for url in urls])
+
+    def deliver(self, url, data):
+        return self.deliver_many([url], data)[0]
+
+    async def close_session(self):
+        await self.session.close()
+
+    def close(self):
+        with self._lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.close_session(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_delivery_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = DeliveryEngine()
+            atexit.register(_engine.close)
+        return _engine
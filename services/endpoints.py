@@ -0,0 +1,95 @@
+import datetime
+import sys
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+from constants import STREAM_BATCH_SIZE
+
+DUPLICATE_KEY_ERROR = 11000
+# Keys of the endpoint documents that aren't part of the endpoint itself.
+STORAGE_FIELDS = ("_id", "endpoint_id", "webhook_id", "created_at")
+
+
+def ensure_endpoint_indexes(endpoints):
+    endpoints.create_index([("webhook_id", ASCENDING), ("_id", ASCENDING)])
+    endpoints.create_index([("webhook_id", ASCENDING), ("url", ASCENDING)], unique=True)
+
+
+def fan_out_query(webhook_id):
+    # The endpoints a delivery goes to, in creation order with sort("_id").
+    return {"webhook_id": webhook_id, "disabled": {"$ne": True}}
+
+
+def to_endpoint_id(endpoint_id):
+    # Endpoint ids are ObjectId strings; anything else can't match a stored one.
+    return ObjectId(endpoint_id) if isinstance(endpoint_id, str) and ObjectId.is_valid(endpoint_id) else endpoint_id
+
+
+def to_endpoint(document):
+    # Stored document -> the endpoint shape the API and fan-out use.
+    endpoint = {"endpoint_id": str(document["_id"])}
+    endpoint.update((key, value) for key, value in document.items() if key not in STORAGE_FIELDS)
+    return endpoint
+
+
+def merge_endpoints(embedded, stored):
+    # Endpoints still embedded in a webhook document that hasn't been migrated
+    # yet come first; the ones already in the collection win on a clash.
+    stored_ids = {endpoint["endpoint_id"] for endpoint in stored}
+    return [endpoint for endpoint in embedded or [] if endpoint["endpoint_id"] not in stored_ids] + stored
+
+
+def upsert_operation(webhook_id, endpoint, now=None):
+    # Keyed by endpoint_id when the endpoint has one, otherwise by url, which
+    # is unique within a webhook.
+    now = now or datetime.datetime.utcnow().isoformat() + "Z"
+    fields = {key: value for key, value in endpoint.items() if key not in STORAGE_FIELDS + ("disabled",)}
+    fields["updated_at"] = now
+    on_insert = {"webhook_id": webhook_id, "created_at": now}
+    if "disabled" in endpoint:
+        fields["disabled"] = bool(endpoint["disabled"])
+    else:
+        on_insert["disabled"] = False
+    if endpoint.get("endpoint_id"):
+        query = {"_id": to_endpoint_id(endpoint["endpoint_id"]), "webhook_id": webhook_id}
+    else:
+        query = {"webhook_id": webhook_id, "url": endpoint["url"]}
+        on_insert["_id"] = ObjectId()
+    return UpdateOne(query, {"$set": fields, "$setOnInsert": on_insert}, upsert=True)
+
+
+def migrate_webhook(webhooks, endpoints, webhook):
+    # Copies a webhook's embedded endpoints into the endpoints collection
+    # (keeping their ids) and removes the array. The array is only removed if
+    # it didn't change meanwhile; a later migration picks up what was added.
+    embedded = webhook.get("endpoints")
+    if not embedded:
+        return 0
+    webhook_id = str(webhook["_id"])
+    operations = [upsert_operation(webhook_id, dict(endpoint, endpoint_id=endpoint.get("endpoint_id") or str(ObjectId())))
+                  for endpoint in embedded]
+    try:
+        endpoints.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Embedded arrays allowed the same url twice; the first one is kept.
+        if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details["writeErrors"]):
+            raise
+    webhooks.update_one({"_id": webhook["_id"], "endpoints": embedded}, {"$unset": {"endpoints": ""}})
+    return len(embedded)
+
+
+def migrate_all(database):
+    webhooks, endpoints = database.webhooks, database.endpoints
+    ensure_endpoint_indexes(endpoints)
+    migrated = 0
+    query = {"endpoints.0": {"$exists": True}}
+    for webhook in webhooks.find(query, {"endpoints": 1}).batch_size(STREAM_BATCH_SIZE):
+        migrated += migrate_webhook(webhooks, endpoints, webhook)
+    # Webhooks left with an empty array only need it removed.
+    webhooks.update_many({"endpoints": {"$size": 0}}, {"$unset": {"endpoints": ""}})
+    return migrated
+
+
+if __name__ == "__main__":
+    from config import mongo
+    print(f"Migrated {migrate_all(mongo.webhook_db)} endpoints", file=sys.stderr)
@@ -0,0 +1,199 @@
+import collections
+import datetime
+import hashlib
+import math
+import threading
+import time
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from config import (
+    mongo, IDEMPOTENCY_HASH_PAYLOAD, IDEMPOTENCY_WINDOW_SECONDS, IDEMPOTENCY_LEASE_SECONDS, IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_BLOOM_CAPACITY, IDEMPOTENCY_BLOOM_ERROR_RATE
+)
+from constants import (
+    IDEMPOTENCY_IN_PROGRESS, IDEMPOTENCY_COMPLETED, DUPLICATE_IN_PROGRESS_MESSAGE, RESPONSE_CODE_CONFLICT
+)
+from services.payload import Payload
+
+_indexes_ensured = False
+_indexes_lock = threading.Lock()
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class IdempotencyService:
+    # The idempotency_keys collection is the source of truth: inserting the
+    # key claims it across processes, and a TTL index forgets it after the
+    # window. In front of it sit two Bloom filter generations of keys this
+    # process has seen (rotated every window) and a bounded TTL map of their
+    # recorded results, so a fresh key goes straight to the claiming insert
+    # and a repeat seen here is answered without touching Mongo. An
+    # in-progress claim holds a lease; once it expires (the process died
+    # mid-request) the next request with the key takes the claim over.
+    def __init__(self, window_seconds=IDEMPOTENCY_WINDOW_SECONDS, cache_size=IDEMPOTENCY_CACHE_SIZE,
+                 bloom_capacity=IDEMPOTENCY_BLOOM_CAPACITY, bloom_error_rate=IDEMPOTENCY_BLOOM_ERROR_RATE,
+                 lease_seconds=IDEMPOTENCY_LEASE_SECONDS, hash_payload=IDEMPOTENCY_HASH_PAYLOAD):
+        self.mongo = mongo
+        self.window_seconds = window_seconds
+        self.lease_seconds = lease_seconds
+        self.hash_payload = hash_payload
+        self.cache_size = cache_size
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.hits = 0
+        self._blooms = [BloomFilter(bloom_capacity, bloom_error_rate), BloomFilter(bloom_capacity, bloom_error_rate)]
+        self._rotate_at = time.monotonic() + window_seconds
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_keys_collection(self):
+        return self.mongo.webhook_db.idempotency_keys
+
+    def ensure_indexes(self):
+        global _indexes_ensured
+        with _indexes_lock:
+            if _indexes_ensured:
+                return
+            self.get_keys_collection().create_index([("created_at", ASCENDING)], expireAfterSeconds=self.window_seconds)
+            _indexes_ensured = True
+
+    def key_for(self, webhook_id, payload, header_value=None):
+        # Returns None when the request carries no key and hashing is off.
+        if header_value:
+            return f"{webhook_id}:key:{header_value}"
+        if self.hash_payload:
+            return f"{webhook_id}:sha256:{hashlib.sha256(payload.body).hexdigest()}"
+        return None
+
+    def run(self, key, handler):
+        recorded = self.claim(key)
+        if recorded is not None:
+            return recorded
+        try:
+            result, status_code = handler()
+        except Exception:
+            self.release(key)
+            raise
+        self.complete(key, result, status_code)
+        return result, status_code
+
+    def claim(self, key):
+        # Returns the recorded (result, status_code) of an earlier request with
+        # this key, or None once the caller owns the key.
+        self.ensure_indexes()
+        if self._maybe_seen(key):
+            recorded = self._recent(key)
+            if recorded is not None:
+                return recorded
+            document = self.get_keys_collection().find_one({"_id": key})
+            if document is not None and not self._expired(document):
+                return self._remember(key, self.to_result(document))
+        now = datetime.datetime.utcnow()
+        try:
+            self.get_keys_collection().insert_one({
+                "_id": key,
+                "status": IDEMPOTENCY_IN_PROGRESS,
+                "created_at": now,
+                "lease_expires_at": now + datetime.timedelta(seconds=self.lease_seconds),
+            })
+        except DuplicateKeyError:
+            if not self._take_over(key, now):
+                document = self.get_keys_collection().find_one({"_id": key})
+                if document is not None:
+                    return self._remember(key, self.to_result(document))
+                return self.claim(key)
+        with self._lock:
+            self._blooms[0].add(key)
+        return None
+
+    def _expired(self, document):
+        lease_expires_at = document.get("lease_expires_at")
+        return (document.get("status") == IDEMPOTENCY_IN_PROGRESS and lease_expires_at is not None
+                and lease_expires_at <= datetime.datetime.utcnow())
+
+    def _take_over(self, key, now):
+        return self.get_keys_collection().find_one_and_update(
+            {"_id": key, "status": IDEMPOTENCY_IN_PROGRESS, "lease_expires_at": {"$lte": now}},
+            {"$set": {"created_at": now, "lease_expires_at": now + datetime.timedelta(seconds=self.lease_seconds)}},
+            return_document=ReturnDocument.AFTER,
+        ) is not None
+
+    def complete(self, key, result, status_code):
+        update = {"status": IDEMPOTENCY_COMPLETED, "status_code": status_code}
+        if isinstance(result, Payload):
+            update.update({"body": result.body, "content_type": result.content_type})
+        else:
+            update.update({"body": result, "content_type": None})
+        self.get_keys_collection().update_one({"_id": key}, {"$set": update})
+        self._remember(key, (result, status_code))
+
+    def release(self, key):
+        # A failed request gives its key back so the sender's retry goes through.
+        self.get_keys_collection().delete_one({"_id": key, "status": IDEMPOTENCY_IN_PROGRESS})
+        with self._lock:
+            self._results.pop(key, None)
+
+    def to_result(self, document):
+        if document.get("status") != IDEMPOTENCY_COMPLETED:
+            return {"error": DUPLICATE_IN_PROGRESS_MESSAGE}, RESPONSE_CODE_CONFLICT
+        if document.get("content_type"):
+            return Payload(document["body"], document["content_type"]), document["status_code"]
+        return document["body"], document["status_code"]
+
+    def _maybe_seen(self, key):
+        with self._lock:
+            now = time.monotonic()
+            if now >= self._rotate_at:
+                self._blooms = [BloomFilter(self.bloom_capacity, self.bloom_error_rate), self._blooms[0]]
+                self._rotate_at = now + self.window_seconds
+            return any(key in bloom for bloom in self._blooms)
+
+    def _recent(self, key):
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def _remember(self, key, recorded):
+        # In-progress answers are not cached; the next duplicate asks Mongo again.
+        if recorded[1] == RESPONSE_CODE_CONFLICT:
+            return recorded
+        with self._lock:
+            self._blooms[0].add(key)
+            self._results[key] = (time.monotonic() + self.window_seconds, recorded)
+            self._results.move_to_end(key)
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+        return recorded
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_idempotency_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = IdempotencyService()
+        return _service
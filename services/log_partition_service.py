@@ -0,0 +1,167 @@
+import datetime
+import gzip
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from bson import json_util
+from pymongo import ASCENDING
+from config import mongo, LOG_RETENTION_DAYS, LOG_ARCHIVE_DIR, LOG_RETENTION_INTERVAL_SECONDS
+from constants import LOGS_COLLECTION, STREAM_BATCH_SIZE
+from services.payload_store_service import get_payload_store
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PATTERN = re.compile(rf"^{LOGS_COLLECTION}_(\d{{8}})$")
+# Day partitions plus the unpartitioned collection from before partitioning.
+LISTING_PATTERN = rf"^{LOGS_COLLECTION}(_\d{{8}})?$"
+PARTITION_LIST_TTL_SECONDS = 60
+
+
+def partition_day(timestamp):
+    # "2024-06-25T12:00:00Z" -> "20240625"
+    return timestamp[:10].replace("-", "")
+
+
+class LogPartitions:
+    # Logs are written to one collection per UTC day (logs_YYYYMMDD, by the
+    # log's timestamp). Reads only touch the days a time range covers, and
+    # retention drops whole days, optionally after archiving them to gzipped
+    # NDJSON files, instead of deleting documents one by one. Stored payloads
+    # expire through a TTL index once no retained log can reference them.
+    def __init__(self, retention_days=LOG_RETENTION_DAYS, archive_dir=LOG_ARCHIVE_DIR,
+                 interval=LOG_RETENTION_INTERVAL_SECONDS):
+        self.mongo = mongo
+        self.retention_days = retention_days
+        self.archive_dir = archive_dir
+        self.interval = interval
+        self.payload_store = get_payload_store()
+        self._indexed = set()
+        self._listed = []
+        self._listed_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get_database(self):
+        return self.mongo.webhook_db
+
+    def name_for(self, timestamp):
+        return f"{LOGS_COLLECTION}_{partition_day(timestamp)}"
+
+    def collection_for(self, timestamp):
+        # The collection a log with this timestamp is written to, indexed the
+        # first time this process writes to it.
+        name = self.name_for(timestamp)
+        collection = self.get_database()[name]
+        if name not in self._indexed:
+            collection.create_index([("webhook_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)])
+            collection.create_index([("webhook_id", ASCENDING), ("endpoint_id", ASCENDING), ("timestamp", ASCENDING)])
+            with self._lock:
+                self._indexed.add(name)
+        return collection
+
+    def group(self, logs):
+        groups = {}
+        for log in logs:
+            groups.setdefault(self.name_for(log["timestamp"]), []).append(log)
+        return groups
+
+    def listed(self):
+        # Collection listing, cached for a minute.
+        now = time.monotonic()
+        with self._lock:
+            if self._listed_at is None or now - self._listed_at > PARTITION_LIST_TTL_SECONDS:
+                self._listed = self.get_database().list_collection_names(filter={"name": {"$regex": LISTING_PATTERN}})
+                self._listed_at = now
+            return list(self._listed)
+
+    def names(self):
+        # Day partitions in order: the listed ones plus the ones this process
+        # wrote to and today's.
+        names = {name for name in self.listed() if PARTITION_PATTERN.match(name)}
+        with self._lock:
+            names |= self._indexed
+        names.add(self.name_for(datetime.datetime.utcnow().isoformat()))
+        return sorted(names)
+
+    def collections_between(self, since=None, until=None):
+        # Partitions that can hold logs in [since, until), oldest first. The
+        # unpartitioned collection from before partitioning, if it's still
+        # there, is read first.
+        since_day = partition_day(since) if since else None
+        until_day = partition_day(until) if until else None
+        collections = []
+        if LOGS_COLLECTION in self.listed():
+            collections.append(self.get_database()[LOGS_COLLECTION])
+        for name in self.names():
+            day = PARTITION_PATTERN.match(name).group(1)
+            if (since_day and day < since_day) or (until_day and day > until_day):
+                continue
+            collections.append(self.get_database()[name])
+        return collections
+
+    def expired(self):
+        if not self.retention_days:
+            return []
+        cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=self.retention_days)).strftime("%Y%m%d")
+        return [name for name in self.names() if PARTITION_PATTERN.match(name).group(1) < cutoff]
+
+    def enforce_retention(self):
+        for name in self.expired():
+            try:
+                if self.archive_dir:
+                    self.archive(name)
+                self.get_database().drop_collection(name)
+                with self._lock:
+                    self._indexed.discard(name)
+                    self._listed = [listed for listed in self._listed if listed != name]
+                logger.info(f"Dropped expired log partition {name}")
+            except Exception as e:
+                logger.error(f"Error expiring log partition {name}: {e}")
+
+    def archive(self, name):
+        # Bodies are inlined so the archive doesn't depend on the payloads
+        # collection. Written under a temporary name and renamed when complete.
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{name}.ndjson.gz")
+        temporary = f"{path}.{os.getpid()}.tmp"
+        cursor = self.get_database()[name].find().sort([("timestamp", ASCENDING), ("_id", ASCENDING)]).batch_size(STREAM_BATCH_SIZE)
+        with gzip.open(temporary, "wt", encoding="utf-8") as archive:
+            for logs in iter(lambda: list(itertools.islice(cursor, STREAM_BATCH_SIZE)), []):
+                self.payload_store.resolve(logs)
+                for log in logs:
+                    archive.write(json_util.dumps(log) + "\n")
+        os.replace(temporary, path)
+        return path
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-retention", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        if self.retention_days:
+            try:
+                # A day is dropped up to a day and one interval after its
+                # oldest log falls out of the retention.
+                self.payload_store.ensure_ttl((self.retention_days + 1) * 86400 + self.interval)
+            except Exception as e:
+                logger.error(f"Error creating payload TTL index: {e}")
+        while True:
+            self.enforce_retention()
+            time.sleep(self.interval)
+
+
+_partitions = None
+_partitions_lock = threading.Lock()
+
+
+def get_log_partitions():
+    global _partitions
+    with _partitions_lock:
+        if _partitions is None:
+            _partitions = LogPartitions()
+        return _partitions
@@ -1,21 +1,45 @@
+import contextlib
+import logging
+import threading
 from bson.objectid import ObjectId
-from flask import current_app
-from config import mongo
+from pymongo import ASCENDING
+from config import mongo, LOG_BUFFER_ENABLED, LOG_PARTITIONED, PAYLOAD_STORE_ENABLED, REPLAY_ENABLED
 from constants import (
     RESPONSE_CODE_ERROR, SUCCESS_MESSAGE, DATABASE_ERROR_MESSAGE,
-    RESPONSE_CODE_SUCCESS
+    RESPONSE_CODE_SUCCESS, STREAM_BATCH_SIZE
 )
 from exceptions import DatabaseError
 import datetime
+from services.log_partition_service import get_log_partitions
+from services.log_writer_service import get_log_writer
+from services.pagination import decode_cursor, to_object_id
+from services.payload import to_payload
+from services.payload_store_service import get_payload_store
+from services.stage_metrics_service import get_stage_metrics
+
+logger = logging.getLogger(__name__)
+
+LOG_SORT = [("timestamp", ASCENDING), ("_id", ASCENDING)]
+
+_indexes_ensured = False
+_indexes_lock = threading.Lock()
 
 class LogService:
     def __init__(self):
         self.mongo = mongo
+        self.log_writer = get_log_writer(self.insert_logs) if LOG_BUFFER_ENABLED else None
+        self.payload_store = get_payload_store()
+        self._batch = threading.local()
+        self.stage_metrics = get_stage_metrics()
+        self.partitions = get_log_partitions() if LOG_PARTITIONED else None
 
-    def get_logs_collection(self):
+    def get_logs_collection(self, timestamp=None):
+        if self.partitions is not None and timestamp:
+            return self.partitions.collection_for(timestamp)
         return self.mongo.webhook_db.logs
 
-    def create_log(self, webhook_id, endpoint_id, status, response_code, response_body, timestamp=None):
+    def create_log(self, webhook_id, endpoint_id, status, response_code, response_body, timestamp=None, latency_ms=None,
+                   event_ref=None, delivery=False):
         try:
             if timestamp is None:
                 timestamp = datetime.datetime.utcnow().isoformat() + 'Z'
@@ -27,10 +51,145 @@ class LogService:
                 "response_body": response_body,
                 "timestamp": timestamp
             }
-            self.get_logs_collection().insert_one(log)
+            if latency_ms is not None:
+                log["latency_ms"] = round(latency_ms, 2)
+            if event_ref is not None:
+                log["event_ref"] = event_ref
+            # Marks the outcome of one delivery attempt to an endpoint, as
+            # opposed to admin and bookkeeping logs that carry an endpoint_id.
+            if delivery:
+                log["delivery"] = True
+            # Messages stay inline; request bodies are stored once and referenced.
+            if PAYLOAD_STORE_ENABLED and response_body is not None and not isinstance(response_body, str):
+                log["response_body"] = None
+                log["payload_ref"] = self.payload_store.reference(response_body)
+            batch = getattr(self._batch, "logs", None)
+            if batch is not None:
+                batch.append(log)
+            elif self.log_writer is not None:
+                with self.stage_metrics.time("log_enqueue", webhook_id):
+                    self.log_writer.write(log)
+            else:
+                with self.stage_metrics.time("log_write", webhook_id):
+                    self.payload_store.flush()
+                    self.get_logs_collection(timestamp).insert_one(log)
             return log, RESPONSE_CODE_SUCCESS
         except Exception as e:
-            current_app.logger.error(f"Error creating log: {e}")
+            logger.error(f"Error creating log: {e}")
             raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
+    @contextlib.contextmanager
+    def batch(self):
+        # create_log calls made by this thread inside the block are written
+        # together when it exits.
+        logs = self._batch.logs = []
+        try:
+            yield logs
+        finally:
+            self._batch.logs = None
+            if logs:
+                if self.log_writer is not None:
+                    for log in logs:
+                        self.log_writer.write(log)
+                else:
+                    self.insert_logs(logs)
+
+    def insert_logs(self, logs):
+        with self.stage_metrics.time("log_write"):
+            self.payload_store.flush()
+            if self.partitions is None:
+                self.get_logs_collection().insert_many(logs, ordered=False)
+                return
+            for partition in self.partitions.group(logs).values():
+                self.get_logs_collection(partition[0]["timestamp"]).insert_many(partition, ordered=False)
+
+    def reference_event(self, data):
+        # Payload store key of a delivered event, recorded on its forward logs
+        # so it can be replayed.
+        return self.payload_store.reference(to_payload(data)) if REPLAY_ENABLED else None
+
+    def load_bodies(self, logs):
+        self.payload_store.resolve(logs)
+
+    def ensure_indexes(self):
+        global _indexes_ensured
+        with _indexes_lock:
+            if _indexes_ensured:
+                return
+            self.get_logs_collection().create_index([("webhook_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)])
+            self.get_logs_collection().create_index([("webhook_id", ASCENDING), ("endpoint_id", ASCENDING), ("timestamp", ASCENDING)])
+            _indexes_ensured = True
+
+    def find_logs(self, webhook_id, since=None, until=None, endpoint_id=None, response_code=None,
+                  after=None, fields=None, limit=None):
+        # Keyset pagination over (timestamp, _id): `after` is the cursor token
+        # of the last log already returned.
+        query = {"webhook_id": webhook_id}
+        if since or until:
+            query["timestamp"] = {}
+            if since:
+                query["timestamp"]["$gte"] = since
+            if until:
+                query["timestamp"]["$lt"] = until
+        if endpoint_id:
+            query["endpoint_id"] = endpoint_id
+        if response_code is not None:
+            query["response_code"] = response_code
+        if after:
+            timestamp, log_id = decode_cursor(after, 2)
+            since = max(since or timestamp, timestamp)
+            query = {"$and": [query, {"$or": [
+                {"timestamp": {"$gt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$gt": to_object_id(log_id)}},
+            ]}]}
+        projection = dict.fromkeys(fields, 1) if fields else None
+        if projection is not None:
+            projection["timestamp"] = 1
+            if "response_body" in projection:
+                projection["payload_ref"] = 1
+        if self.partitions is None:
+            self.ensure_indexes()
+            return self.query_logs(self.get_logs_collection(), query, projection, limit)
+        # Partitions are read oldest first and each is sorted, so chaining
+        # them keeps the (timestamp, _id) order.
+        return self.query_partitions(self.partitions.collections_between(since, until), query, projection, limit)
+
+    def find_delivered(self, webhook_id, logs):
+        # (endpoint_id, event_ref) of the given logs whose event a later
+        # successful forward log shows was delivered to the same endpoint.
+        since = min(log["timestamp"] for log in logs)
+        query = {
+            "webhook_id": webhook_id,
+            "endpoint_id": {"$in": list({log["endpoint_id"] for log in logs})},
+            "timestamp": {"$gt": since},
+            "response_code": RESPONSE_CODE_SUCCESS,
+            "event_ref": {"$in": list({log["event_ref"] for log in logs})},
+        }
+        projection = {"endpoint_id": 1, "event_ref": 1, "timestamp": 1}
+        if self.partitions is None:
+            self.ensure_indexes()
+            delivered = self.query_logs(self.get_logs_collection(), query, projection, None)
+        else:
+            delivered = self.query_partitions(self.partitions.collections_between(since), query, projection, None)
+        latest = {}
+        for log in delivered:
+            key = (log["endpoint_id"], log["event_ref"])
+            latest[key] = max(latest.get(key, ""), log["timestamp"])
+        return {(log["endpoint_id"], log["event_ref"]) for log in logs
+                if latest.get((log["endpoint_id"], log["event_ref"]), "") > log["timestamp"]}
+
+    def query_logs(self, collection, query, projection, limit):
+        cursor = collection.find(query, projection).sort(LOG_SORT).batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
 
+    def query_partitions(self, collections, query, projection, limit):
+        remaining = limit
+        for collection in collections:
+            for log in self.query_logs(collection, query, projection, remaining):
+                yield log
+                if limit:
+                    remaining -= 1
+                    if not remaining:
+                        return
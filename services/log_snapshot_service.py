@@ -0,0 +1,383 @@
+import datetime
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from pymongo import ASCENDING
+from config import (
+    mongo, LOG_PARTITIONED, LOG_SNAPSHOT_DIR, LOG_SNAPSHOT_INTERVAL_SECONDS, LOG_SNAPSHOT_LAG_SECONDS
+)
+from constants import STREAM_BATCH_SIZE
+from services.log_partition_service import get_log_partitions
+from services.pagination import to_object_id
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+# Column files of a segment, one value per delivery log, in log order.
+COLUMNS = {
+    "timestamp": "int64",       # ms since the epoch
+    "response_code": "int16",
+    "latency_ms": "float32",    # NaN (from None) when the log has none
+    "webhook": "int32",         # index into the segment's webhook_ids
+    "endpoint": "int32",        # index into the segment's endpoint_ids
+}
+MANIFEST = "manifest.json"
+LOCK_FILE = ".lock"
+SEGMENT_PREFIX = "segment-"
+INTERVALS_MS = {"minute": 60000, "hour": 3600000, "day": 86400000}
+PERCENTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+DEFERRED_CODES = (429, 503)
+
+
+def to_epoch_ms(timestamps):
+    # ISO timestamps as written by create_log ("...T12:00:00.123456Z").
+    return np.array([timestamp.rstrip("Z") for timestamp in timestamps], dtype="datetime64[ms]").astype(np.int64)
+
+
+def to_iso(epoch_ms):
+    return f"{np.datetime64(int(epoch_ms), 'ms')}Z"
+
+
+def try_lock(lock_file):
+    # Non-blocking exclusive lock, released when the file is closed; False
+    # when another process holds it.
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+class Segment:
+    # One export run: memory-mapped column files plus the dictionaries the
+    # webhook and endpoint columns index into.
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        self.name = os.path.basename(path)
+        self.count = meta["count"]
+        self.first = meta["first"]
+        self.last = meta["last"]
+        self.webhook_ids = meta["webhook_ids"]
+        self.endpoint_ids = meta["endpoint_ids"]
+        self.webhook_codes = {webhook_id: code for code, webhook_id in enumerate(self.webhook_ids)}
+        self.endpoint_codes = {endpoint_id: code for code, endpoint_id in enumerate(self.endpoint_ids)}
+        self.columns = {
+            name: np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode="r", shape=(self.count,))
+            for name, dtype in COLUMNS.items()
+        }
+
+
+class SegmentWriter:
+    # Appends column batches to files in a temporary directory; finish()
+    # writes the metadata and moves the directory into place.
+    def __init__(self, directory, name):
+        self.path = os.path.join(directory, name)
+        self.temporary = f"{self.path}.{os.getpid()}.tmp"
+        os.makedirs(self.temporary)
+        self.files = {name: open(os.path.join(self.temporary, f"{name}.bin"), "wb") for name in COLUMNS}
+        self.webhook_codes = {}
+        self.endpoint_codes = {}
+        self.count = 0
+        self.first = None
+        self.last = None
+
+    def write(self, logs):
+        timestamps = to_epoch_ms([log["timestamp"] for log in logs])
+        columns = {
+            "timestamp": timestamps,
+            "response_code": np.array([log.get("response_code") or 0 for log in logs], dtype=COLUMNS["response_code"]),
+            "latency_ms": np.array([log.get("latency_ms") for log in logs], dtype=COLUMNS["latency_ms"]),
+            "webhook": np.array([self.webhook_codes.setdefault(log["webhook_id"], len(self.webhook_codes)) for log in logs],
+                                dtype=COLUMNS["webhook"]),
+            "endpoint": np.array([self.endpoint_codes.setdefault(log["endpoint_id"], len(self.endpoint_codes)) for log in logs],
+                                 dtype=COLUMNS["endpoint"]),
+        }
+        for name, column in columns.items():
+            column.tofile(self.files[name])
+        if self.first is None:
+            self.first = int(timestamps[0])
+        self.last = int(timestamps[-1])
+        self.count += len(logs)
+
+    def finish(self):
+        for column_file in self.files.values():
+            column_file.close()
+        if not self.count:
+            shutil.rmtree(self.temporary)
+            return None
+        meta = {
+            "count": self.count,
+            "first": self.first,
+            "last": self.last,
+            "webhook_ids": list(self.webhook_codes),
+            "endpoint_ids": list(self.endpoint_codes),
+        }
+        with open(os.path.join(self.temporary, "meta.json"), "w") as meta_file:
+            json.dump(meta, meta_file)
+        # A segment left by an export that died before updating the manifest.
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.temporary, self.path)
+        return os.path.basename(self.path)
+
+    def abort(self):
+        for column_file in self.files.values():
+            column_file.close()
+        shutil.rmtree(self.temporary, ignore_errors=True)
+
+
+class LogSnapshot:
+    # Columnar copy of the delivery logs (the ones with an endpoint_id) on
+    # local disk, for analytics that would otherwise page through raw logs.
+    # Each export appends one segment holding the logs written since the
+    # previous one, up to LOG_SNAPSHOT_LAG_SECONDS ago so that logs still
+    # sitting in a writer queue aren't skipped. Aggregates are computed over
+    # the memory-mapped columns with NumPy.
+    def __init__(self, directory=LOG_SNAPSHOT_DIR, interval=LOG_SNAPSHOT_INTERVAL_SECONDS, lag_seconds=LOG_SNAPSHOT_LAG_SECONDS):
+        self.mongo = mongo
+        self.directory = directory
+        self.interval = interval
+        self.lag_seconds = lag_seconds
+        self.partitions = get_log_partitions() if LOG_PARTITIONED else None
+        self._segments = {}
+        self._indexed = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def available(self):
+        return np is not None and bool(self.directory)
+
+    @property
+    def can_export(self):
+        # Exports are serialized across processes with a file lock.
+        return self.available and (fcntl is not None or msvcrt is not None)
+
+    def get_logs_collection(self):
+        return self.mongo.webhook_db.logs
+
+    def read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {"segments": [], "watermark": None}
+
+    def write_manifest(self, manifest):
+        path = os.path.join(self.directory, MANIFEST)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+        os.replace(temporary, path)
+
+    def ensure_indexes(self, collection):
+        if collection.name in self._indexed:
+            return
+        collection.create_index([("timestamp", ASCENDING), ("_id", ASCENDING)])
+        with self._lock:
+            self._indexed.add(collection.name)
+
+    def source_collections(self, since):
+        if self.partitions is None:
+            return [self.get_logs_collection()]
+        return self.partitions.collections_between(since)
+
+    def iter_new_logs(self, watermark, cutoff):
+        # Delivery logs only; those written before the `delivery` marker are
+        # recognized by their latency.
+        query = {"$or": [{"delivery": True}, {"latency_ms": {"$exists": True}}], "timestamp": {"$lt": cutoff}}
+        if watermark:
+            timestamp, log_id = watermark
+            query = {"$and": [query, {"$or": [
+                {"timestamp": {"$gt": timestamp}},
+                {"timestamp": timestamp, "_id": {"$gt": to_object_id(log_id)}},
+            ]}]}
+        projection = {"webhook_id": 1, "endpoint_id": 1, "response_code": 1, "latency_ms": 1, "timestamp": 1}
+        for collection in self.source_collections(watermark[0] if watermark else None):
+            self.ensure_indexes(collection)
+            cursor = collection.find(query, projection).sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+            yield from cursor.batch_size(STREAM_BATCH_SIZE)
+
+    def export(self):
+        # Returns the number of logs exported; 0 when another process holds
+        # the export lock.
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), "w") as lock_file:
+            if not try_lock(lock_file):
+                return 0
+            manifest = self.read_manifest()
+            cutoff = (datetime.datetime.utcnow() - datetime.timedelta(seconds=self.lag_seconds)).isoformat() + "Z"
+            writer = SegmentWriter(self.directory, f"{SEGMENT_PREFIX}{len(manifest['segments']):08d}")
+            logs = self.iter_new_logs(manifest["watermark"], cutoff)
+            last = None
+            try:
+                for batch in iter(lambda: list(itertools.islice(logs, STREAM_BATCH_SIZE)), []):
+                    writer.write(batch)
+                    last = batch[-1]
+            except Exception:
+                writer.abort()
+                raise
+            name = writer.finish()
+            if name is not None:
+                manifest["segments"].append(name)
+                manifest["watermark"] = [last["timestamp"], str(last["_id"])]
+                self.write_manifest(manifest)
+            return writer.count
+
+    def segments(self):
+        # Segments listed in the manifest, mapped once per process.
+        names = self.read_manifest()["segments"]
+        with self._lock:
+            for name in names:
+                if name not in self._segments:
+                    self._segments[name] = Segment(os.path.join(self.directory, name))
+            return [self._segments[name] for name in names]
+
+    def select(self, webhook_id=None, endpoint_id=None, since=None, until=None):
+        # Matching rows of every segment, with webhook and endpoint codes
+        # translated to one shared dictionary.
+        webhook_ids, endpoint_ids = {}, {}
+        parts = []
+        for segment in self.segments():
+            if (since is not None and segment.last < since) or (until is not None and segment.first >= until):
+                continue
+            columns = segment.columns
+            mask = np.ones(segment.count, dtype=bool)
+            if since is not None:
+                mask &= columns["timestamp"] >= since
+            if until is not None:
+                mask &= columns["timestamp"] < until
+            if webhook_id is not None:
+                if webhook_id not in segment.webhook_codes:
+                    continue
+                mask &= columns["webhook"] == segment.webhook_codes[webhook_id]
+            if endpoint_id is not None:
+                if endpoint_id not in segment.endpoint_codes:
+                    continue
+                mask &= columns["endpoint"] == segment.endpoint_codes[endpoint_id]
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                continue
+            webhooks = np.array([webhook_ids.setdefault(value, len(webhook_ids)) for value in segment.webhook_ids], dtype=np.int32)
+            endpoints = np.array([endpoint_ids.setdefault(value, len(endpoint_ids)) for value in segment.endpoint_ids], dtype=np.int32)
+            parts.append((
+                columns["timestamp"][rows],
+                columns["response_code"][rows],
+                columns["latency_ms"][rows],
+                webhooks[columns["webhook"][rows]],
+                endpoints[columns["endpoint"][rows]],
+            ))
+        if not parts:
+            return None, list(webhook_ids), list(endpoint_ids)
+        return [np.concatenate(column) for column in zip(*parts)], list(webhook_ids), list(endpoint_ids)
+
+    def aggregate(self, group_by="endpoint", interval=None, webhook_id=None, endpoint_id=None, since=None, until=None):
+        # Delivery counts, success rate and latency percentiles per endpoint
+        # or per webhook, optionally per time bucket of `interval`.
+        selected, webhook_ids, endpoint_ids = self.select(webhook_id, endpoint_id, since, until)
+        if selected is None:
+            return []
+        timestamps, codes, latencies, webhooks, endpoints = selected
+        keys = [webhooks, endpoints] if group_by == "endpoint" else [webhooks]
+        if interval:
+            keys.append(timestamps // INTERVALS_MS[interval] * INTERVALS_MS[interval])
+        groups, inverse = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        size = len(groups)
+        deliveries = np.bincount(inverse, minlength=size)
+        successful = np.bincount(inverse, weights=(codes >= 200) & (codes < 300), minlength=size)
+        deferred = np.bincount(inverse, weights=np.isin(codes, DEFERRED_CODES), minlength=size)
+        timed = ~np.isnan(latencies)
+        timed_groups, timed_latencies = inverse[timed], latencies[timed].astype(np.float64)
+        timed_counts = np.bincount(timed_groups, minlength=size)
+        latency_sums = np.bincount(timed_groups, weights=timed_latencies, minlength=size)
+        # Latencies sorted within each group; group g's run starts at starts[g].
+        ordered = timed_latencies[np.lexsort((timed_latencies, timed_groups))]
+        starts = np.cumsum(timed_counts) - timed_counts
+        percentiles = {}
+        for name, quantile in PERCENTILES.items():
+            position = quantile * np.maximum(timed_counts - 1, 0)
+            lower, upper = np.floor(position).astype(np.int64), np.ceil(position).astype(np.int64)
+            if len(ordered):
+                low = ordered[np.minimum(starts + lower, len(ordered) - 1)]
+                high = ordered[np.minimum(starts + upper, len(ordered) - 1)]
+                percentiles[name] = low + (high - low) * (position - lower)
+            else:
+                percentiles[name] = np.zeros(size)
+        results = []
+        for index, group in enumerate(groups):
+            result = {"webhook_id": webhook_ids[group[0]]}
+            if group_by == "endpoint":
+                result["endpoint_id"] = endpoint_ids[group[1]]
+            if interval:
+                result["bucket"] = to_iso(group[-1])
+            timed_count = int(timed_counts[index])
+            result.update({
+                "deliveries": int(deliveries[index]),
+                "successful": int(successful[index]),
+                "failed": int(deliveries[index] - successful[index] - deferred[index]),
+                "deferred": int(deferred[index]),
+                "success_rate": round(float(successful[index] / deliveries[index]), 4),
+                "latency_ms": dict({
+                    "avg": round(float(latency_sums[index] / timed_count), 2) if timed_count else None,
+                }, **{name: round(float(values[index]), 2) if timed_count else None for name, values in percentiles.items()}),
+            })
+            results.append(result)
+        return results
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-snapshot", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                exported = self.export()
+                if exported:
+                    logger.info(f"Exported {exported} delivery logs to the log snapshot")
+            except Exception as e:
+                logger.error(f"Error exporting log snapshot: {e}")
+            time.sleep(self.interval)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def get_log_snapshot():
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = LogSnapshot()
+        return _snapshot
+
+
+if __name__ == "__main__":
+    snapshot = get_log_snapshot()
+    if not snapshot.can_export:
+        sys.exit("The log snapshot export needs numpy, LOG_SNAPSHOT_DIR and file locking")
+    print(f"Exported {snapshot.export()} delivery logs", file=sys.stderr)
@@ -0,0 +1,119 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from config import (
+    LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL_SECONDS, LOG_QUEUE_SIZE, LOG_QUEUE_FULL_POLICY, LOG_QUEUE_BLOCK_SECONDS
+)
+from constants import LOG_POLICY_DROP
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class LogWriter:
+    # Buffers log documents in a bounded queue and writes them with one
+    # insert_many per batch from a background thread. When the queue is full
+    # the "block" policy waits up to block_seconds for room before dropping,
+    # the "drop" policy drops straight away; drops are counted either way.
+    def __init__(self, write_batch, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL_SECONDS,
+                 queue_size=LOG_QUEUE_SIZE, full_policy=LOG_QUEUE_FULL_POLICY, block_seconds=LOG_QUEUE_BLOCK_SECONDS):
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.block_seconds = block_seconds
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, log):
+        self.start()
+        try:
+            if self.full_policy == LOG_POLICY_DROP:
+                self._queue.put_nowait(log)
+            else:
+                self._queue.put(log, timeout=self.block_seconds)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def flush(self):
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+            }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in range(len(batch) + (1 if stopping else 0)):
+                self._queue.task_done()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self.write_batch(batch)
+            with self._lock:
+                self.written += len(batch)
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} logs: {e}")
+            with self._lock:
+                self.failed += len(batch)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_log_writer(write_batch):
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter(write_batch)
+            atexit.register(_writer.close)
+        return _writer
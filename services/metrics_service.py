@@ -0,0 +1,207 @@
+import atexit
+import bisect
+import datetime
+import logging
+import threading
+import time
+from pymongo import ASCENDING, DESCENDING
+from config import mongo, METRICS_FLUSH_INTERVAL_SECONDS, STATUS_MINUTE_RETENTION_SECONDS, STATUS_HOUR_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+ROLLUP_GRANULARITIES = {
+    "minute": lambda moment: moment.replace(second=0, microsecond=0),
+    "hour": lambda moment: moment.replace(minute=0, second=0, microsecond=0),
+}
+TOTALS_ID = "totals"
+
+
+class LatencyHistogram:
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts else [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, latency_ms):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def merge(self, counts):
+        for i, count in enumerate(counts):
+            self.counts[i] += count
+
+    def percentile(self, quantile):
+        total = sum(self.counts)
+        if not total:
+            return None
+        rank = quantile * total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS_MS[i - 1] if i else 0
+                upper = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else LATENCY_BUCKETS_MS[-1]
+                return round(lower + (upper - lower) * (rank - seen) / count, 2)
+            seen += count
+        return float(LATENCY_BUCKETS_MS[-1])
+
+
+class Rollup:
+    def __init__(self):
+        self.requests = 0
+        self.successful = 0
+        self.failed = 0
+        self.latency_sum_ms = 0.0
+        self.histogram = LatencyHistogram()
+
+    @classmethod
+    def from_document(cls, document):
+        rollup = cls()
+        rollup.requests = document.get("requests", 0)
+        rollup.successful = document.get("successful", 0)
+        rollup.failed = document.get("failed", 0)
+        rollup.latency_sum_ms = document.get("latency_sum_ms", 0.0)
+        for i, count in (document.get("latency_buckets") or {}).items():
+            rollup.histogram.counts[int(i)] += count
+        return rollup
+
+    def record(self, ok, latency_ms):
+        self.requests += 1
+        if ok:
+            self.successful += 1
+        else:
+            self.failed += 1
+        self.latency_sum_ms += latency_ms
+        self.histogram.observe(latency_ms)
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.successful += other.successful
+        self.failed += other.failed
+        self.latency_sum_ms += other.latency_sum_ms
+        self.histogram.merge(other.histogram.counts)
+
+    def to_update(self):
+        increments = {
+            "requests": self.requests,
+            "successful": self.successful,
+            "failed": self.failed,
+            "latency_sum_ms": self.latency_sum_ms,
+        }
+        for i, count in enumerate(self.histogram.counts):
+            if count:
+                increments[f"latency_buckets.{i}"] = count
+        return {"$inc": increments}
+
+    def summary(self):
+        return {
+            "total_requests": self.requests,
+            "successful_requests": self.successful,
+            "failed_requests": self.failed,
+            "average_latency_ms": round(self.latency_sum_ms / self.requests, 2) if self.requests else None,
+            "latency_ms": {
+                "p50": self.histogram.percentile(0.5),
+                "p95": self.histogram.percentile(0.95),
+                "p99": self.histogram.percentile(0.99),
+            },
+        }
+
+
+class StatusMetrics:
+    # Delivery counters and latency histograms are kept in memory and their
+    # deltas are $inc-ed into status_rollups (a running totals document plus
+    # per-minute and per-hour buckets) every flush interval, so the numbers
+    # survive restarts and status never scans the logs collection.
+    def __init__(self, flush_interval=METRICS_FLUSH_INTERVAL_SECONDS, minute_retention=STATUS_MINUTE_RETENTION_SECONDS,
+                 hour_retention=STATUS_HOUR_RETENTION_SECONDS):
+        self.mongo = mongo
+        self.flush_interval = flush_interval
+        self.retention = {"minute": minute_retention, "hour": hour_retention}
+        self.started_at = time.time()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def get_rollups_collection(self):
+        return self.mongo.webhook_db.status_rollups
+
+    def record(self, ok, latency_ms):
+        self.start()
+        now = datetime.datetime.utcnow()
+        keys = [TOTALS_ID] + [f"{name}:{bucket(now).isoformat()}Z" for name, bucket in ROLLUP_GRANULARITIES.items()]
+        with self._lock:
+            for key in keys:
+                rollup = self._pending.get(key)
+                if rollup is None:
+                    rollup = self._pending[key] = Rollup()
+                rollup.record(ok, latency_ms)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="status-metrics", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            self.get_rollups_collection().create_index([("granularity", ASCENDING), ("bucket", DESCENDING)])
+            # Buckets carry their own expiry, so each granularity keeps its own retention.
+            self.get_rollups_collection().create_index("expires_at", expireAfterSeconds=0)
+        except Exception as e:
+            logger.error(f"Error creating status rollup index: {e}")
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for key, rollup in pending.items():
+            update = rollup.to_update()
+            if key != TOTALS_ID:
+                granularity, bucket = key.split(":", 1)
+                expires_at = datetime.datetime.fromisoformat(bucket.rstrip("Z")) + datetime.timedelta(seconds=self.retention[granularity])
+                update["$set"] = {"granularity": granularity, "bucket": bucket, "expires_at": expires_at}
+            try:
+                self.get_rollups_collection().update_one({"_id": key}, update, upsert=True)
+            except Exception as e:
+                logger.error(f"Error flushing status rollup {key}: {e}")
+                with self._lock:
+                    self._merge_back(key, rollup)
+
+    def _merge_back(self, key, rollup):
+        current = self._pending.get(key)
+        if current is None:
+            self._pending[key] = rollup
+        else:
+            current.merge(rollup)
+
+    def snapshot(self):
+        totals = Rollup.from_document(self.get_rollups_collection().find_one({"_id": TOTALS_ID}) or {})
+        with self._lock:
+            unflushed = self._pending.get(TOTALS_ID)
+            if unflushed is not None:
+                totals.merge(unflushed)
+        uptime_seconds = int(time.time() - self.started_at)
+        return dict({
+            "uptime": str(datetime.timedelta(seconds=uptime_seconds)),
+            "uptime_seconds": uptime_seconds,
+        }, **totals.summary())
+
+    def history(self, granularity, limit):
+        rollups = self.get_rollups_collection().find({"granularity": granularity}).sort("bucket", DESCENDING).limit(limit)
+        return [dict({"bucket": rollup["bucket"]}, **Rollup.from_document(rollup).summary()) for rollup in rollups]
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_status_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = StatusMetrics()
+            atexit.register(_metrics.flush)
+        return _metrics
@@ -0,0 +1,194 @@
+import datetime
+import logging
+import threading
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import OperationFailure
+from config import mongo, OUTBOX_WORKERS, OUTBOX_LEASE_SECONDS, OUTBOX_POLL_INTERVAL_SECONDS, OUTBOX_RETENTION_SECONDS
+from constants import OUTBOX_PENDING, OUTBOX_DELIVERING, OUTBOX_DELIVERED, OUTBOX_FAILED, OUTBOX_RETRYING
+from services.payload import to_payload
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxService:
+    def __init__(self, workers=OUTBOX_WORKERS, lease_seconds=OUTBOX_LEASE_SECONDS,
+                 poll_interval=OUTBOX_POLL_INTERVAL_SECONDS, retention_seconds=OUTBOX_RETENTION_SECONDS):
+        self.mongo = mongo
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._leased = {}
+        self._lock = threading.Lock()
+
+    def get_outbox_collection(self):
+        return self.mongo.webhook_db.outbox
+
+    def ensure_indexes(self):
+        self.get_outbox_collection().create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        self.get_outbox_collection().create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+        # delivered_at is only set once an event is delivered or failed for good.
+        try:
+            self.get_outbox_collection().create_index("delivered_at", expireAfterSeconds=self.retention_seconds)
+        except OperationFailure:
+            # The retention changed since the index was created.
+            self.mongo.webhook_db.command("collMod", "outbox", index={
+                "keyPattern": {"delivered_at": 1}, "expireAfterSeconds": self.retention_seconds,
+            })
+
+    def enqueue(self, webhook_id, webhook, data):
+        result = self.get_outbox_collection().insert_one(self.build_event(webhook_id, webhook, data))
+        self.wakeup()
+        return str(result.inserted_id)
+
+    def enqueue_many(self, webhook_id, webhook, payloads):
+        result = self.get_outbox_collection().insert_many([self.build_event(webhook_id, webhook, data) for data in payloads])
+        self.wakeup()
+        return [str(event_id) for event_id in result.inserted_ids]
+
+    def build_event(self, webhook_id, webhook, data):
+        return {
+            "webhook_id": webhook_id,
+            "webhook_url": webhook["webhook_url"],
+            "endpoints": webhook.get("endpoints", []),
+            "payload": to_payload(data).body,
+            "status": OUTBOX_PENDING,
+            "created_at": datetime.datetime.utcnow(),
+            "lease_expires_at": None,
+        }
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def claim(self):
+        # A pending event, or one whose worker died mid-delivery, is leased to
+        # exactly one worker at a time; an expired lease makes it claimable
+        # again. `owner` tells the claims of the same event apart.
+        now = datetime.datetime.utcnow()
+        return self.get_outbox_collection().find_one_and_update(
+            {"$or": [
+                {"status": OUTBOX_PENDING},
+                {"status": OUTBOX_DELIVERING, "lease_expires_at": {"$lte": now}},
+            ]},
+            {"$set": {
+                "status": OUTBOX_DELIVERING,
+                "owner": ObjectId(),
+                "lease_expires_at": now + datetime.timedelta(seconds=self.lease_seconds),
+            }, "$inc": {"attempts": 1}},
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def renew(self, event):
+        # False when another worker has taken the event over since it was claimed.
+        result = self.get_outbox_collection().update_one(
+            {"_id": event["_id"], "status": OUTBOX_DELIVERING, "owner": event["owner"]},
+            {"$set": {"lease_expires_at": datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lease_seconds)}},
+        )
+        return bool(result.modified_count)
+
+    def complete(self, event, error=None):
+        update = {
+            "status": OUTBOX_FAILED if error else OUTBOX_DELIVERED,
+            "delivered_at": datetime.datetime.utcnow(),
+            "lease_expires_at": None,
+        }
+        if error:
+            update["error"] = error
+        result = self.get_outbox_collection().update_one({"_id": event["_id"], "owner": event["owner"]}, {"$set": update})
+        return bool(result.matched_count)
+
+    def mark_retrying(self, event, error):
+        # The webhook_url delivery is handed to the retry scheduler, which
+        # settles the event once the retry succeeds or is dead-lettered.
+        result = self.get_outbox_collection().update_one({"_id": event["_id"], "owner": event["owner"]}, {"$set": {
+            "status": OUTBOX_RETRYING, "error": error, "lease_expires_at": None,
+        }})
+        return bool(result.matched_count)
+
+    def settle(self, event_id, error=None):
+        update = {"$set": {
+            "status": OUTBOX_FAILED if error else OUTBOX_DELIVERED,
+            "delivered_at": datetime.datetime.utcnow(),
+        }}
+        if error:
+            update["$set"]["error"] = error
+        else:
+            update["$unset"] = {"error": ""}
+        self.get_outbox_collection().update_one({"_id": event_id, "status": OUTBOX_RETRYING}, update)
+
+    def start_workers(self, app, deliver):
+        for i in range(self.workers):
+            # The first worker creates the indexes, so app startup doesn't wait on Mongo.
+            thread = threading.Thread(target=self._work, args=(app, deliver, i == 0), name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="outbox-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop_workers(self):
+        self._stopped.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _heartbeat(self):
+        # Renews the leases of the events being delivered, so a slow fan-out
+        # isn't claimed and sent again by another worker.
+        while not self._stopped.wait(self.lease_seconds / 3):
+            with self._lock:
+                events = list(self._leased.values())
+            for event in events:
+                try:
+                    if not self.renew(event):
+                        logger.warning(f"Lost the lease on outbox event {event['_id']}")
+                        with self._lock:
+                            self._leased.pop(event["_id"], None)
+                except Exception as e:
+                    logger.error(f"Error renewing lease of outbox event {event['_id']}: {e}")
+
+    def _work(self, app, deliver, create_indexes=False):
+        if create_indexes:
+            try:
+                self.ensure_indexes()
+            except Exception as e:
+                logger.error(f"Error creating outbox indexes: {e}")
+        with app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    event = self.claim()
+                except Exception as e:
+                    logger.error(f"Error claiming outbox event: {e}")
+                    event = None
+                if event is None:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                with self._lock:
+                    self._leased[event["_id"]] = event
+                try:
+                    self._deliver(event, deliver)
+                finally:
+                    with self._lock:
+                        self._leased.pop(event["_id"], None)
+
+    def _deliver(self, event, deliver):
+        error = None
+        try:
+            if deliver(event) == OUTBOX_RETRYING:
+                return
+        except Exception as e:
+            logger.error(f"Error delivering outbox event {event['_id']}: {e}")
+            error = str(e)
+        try:
+            if not self.complete(event, error):
+                logger.warning(f"Outbox event {event['_id']} was taken over by another worker")
+        except Exception as e:
+            # The lease expires and another worker picks the event up again.
+            logger.error(f"Error completing outbox event {event['_id']}: {e}")
@@ -0,0 +1,37 @@
+import base64
+import json
+from bson.objectid import ObjectId
+from constants import INVALID_CURSOR_MESSAGE
+from exceptions import ValidationError
+
+
+def encode_cursor(*values):
+    raw = json.dumps([str(value) if isinstance(value, ObjectId) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError(token)
+        return values
+    except (ValueError, TypeError):
+        raise ValidationError(INVALID_CURSOR_MESSAGE)
+
+
+def to_object_id(value):
+    if not isinstance(value, str) or not ObjectId.is_valid(value):
+        raise ValidationError(INVALID_CURSOR_MESSAGE)
+    return ObjectId(value)
+
+
+def parse_fields(fields):
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+def to_ndjson(document):
+    document["_id"] = str(document["_id"])
+    return json.dumps(document, default=str) + "\n"
@@ -0,0 +1,102 @@
+import json
+from config import PASSTHROUGH_ENABLED
+from constants import INVALID_BATCH_MESSAGE
+from exceptions import ValidationError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_CONTENT_TYPE = "application/json"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+EMPTY_BODIES = (b"", b"{}", b"[]", b"null", b"\"\"", b"0", b"false")
+
+
+def loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dumps(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def canonical_dumps(data):
+    # Key order is normalised so equal documents encode to the same bytes.
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(data, separators=(",", ":"), sort_keys=True).encode()
+
+
+class Payload:
+    # A webhook body kept as the bytes it arrived in. The same buffer is sent
+    # to every destination and stored as-is; it is only parsed when something
+    # reads .data.
+    __slots__ = ("body", "content_type", "_data")
+
+    def __init__(self, body, content_type=JSON_CONTENT_TYPE, data=None):
+        self.body = bytes(body)
+        self.content_type = content_type
+        self._data = data
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(dumps(data), data=data)
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = loads(self.body)
+        return self._data
+
+    def __len__(self):
+        return len(self.body)
+
+
+def to_payload(value):
+    # Accepts a Payload, raw bytes (as stored in Mongo) or an already parsed
+    # document from before passthrough was enabled.
+    if isinstance(value, Payload):
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return Payload(value)
+    return Payload.from_data(value)
+
+
+def read_payload(body, mimetype, validate=not PASSTHROUGH_ENABLED):
+    # Returns None when there is nothing to forward. With passthrough on, the
+    # body is only checked for a JSON content type and emptiness; with it off
+    # it is parsed once to reject malformed JSON.
+    if mimetype != JSON_CONTENT_TYPE and not mimetype.endswith("+json"):
+        return None
+    if validate:
+        try:
+            data = loads(body)
+        except ValueError:
+            return None
+        return Payload(body, data=data) if data else None
+    if body.strip() in EMPTY_BODIES:
+        return None
+    return Payload(body)
+
+
+def read_batch(body, mimetype, validate=not PASSTHROUGH_ENABLED):
+    # NDJSON lines are kept as the bytes they arrived in; a JSON array has to
+    # be parsed to split it, so each event is encoded once from it.
+    try:
+        if mimetype == NDJSON_CONTENT_TYPE:
+            lines = [line for line in body.splitlines() if line.strip()]
+            if validate:
+                return [Payload(line, data=loads(line)) for line in lines]
+            return [Payload(line) for line in lines]
+        if mimetype == JSON_CONTENT_TYPE or mimetype.endswith("+json"):
+            events = loads(body)
+            if isinstance(events, list):
+                return [Payload.from_data(event) for event in events]
+    except ValueError:
+        pass
+    raise ValidationError(INVALID_BATCH_MESSAGE)
@@ -0,0 +1,137 @@
+import collections
+import datetime
+import hashlib
+import threading
+import time
+import zlib
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from config import mongo, PAYLOAD_COMPRESSION
+from services.payload import Payload, canonical_dumps, loads
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+KNOWN_DIGESTS_SIZE = 10000
+# A stored payload's referenced_at is refreshed at most this often by each
+# process, so payload expiry allows for it on top of the log retention.
+TOUCH_INTERVAL_SECONDS = 86400
+
+
+def compress(body, codec):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor().compress(body)
+    return zlib.compress(body)
+
+
+def decompress(data, codec):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+class PayloadStore:
+    # Request bodies referenced from logs are stored once in the payloads
+    # collection under the sha256 of their bytes, compressed. Blobs are
+    # collected by reference() and written by flush(), which the log writer
+    # calls before inserting the logs that point at them. Each write also
+    # stamps referenced_at, which the TTL index from ensure_ttl() expires.
+    def __init__(self, codec=PAYLOAD_COMPRESSION):
+        self.mongo = mongo
+        self.codec = CODEC_ZSTD if codec == CODEC_ZSTD and zstandard is not None else CODEC_ZLIB
+        self._pending = {}
+        self._known = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_payloads_collection(self):
+        return self.mongo.webhook_db.payloads
+
+    def reference(self, body):
+        body = body.body if isinstance(body, Payload) else canonical_dumps(body)
+        digest = hashlib.sha256(body).hexdigest()
+        with self._lock:
+            if digest in self._known and time.monotonic() - self._known[digest] < TOUCH_INTERVAL_SECONDS:
+                self._known.move_to_end(digest)
+                return digest
+            if digest not in self._pending:
+                self._pending[digest] = body
+        return digest
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        now = datetime.datetime.utcnow()
+        self.get_payloads_collection().bulk_write([
+            UpdateOne({"_id": digest}, {"$setOnInsert": {
+                "codec": self.codec,
+                "size": len(body),
+                "data": compress(body, self.codec),
+                "created_at": now,
+            }, "$set": {"referenced_at": now}}, upsert=True)
+            for digest, body in pending.items()
+        ], ordered=False)
+        with self._lock:
+            written = time.monotonic()
+            for digest in pending:
+                self._known[digest] = written
+                self._known.move_to_end(digest)
+            while len(self._known) > KNOWN_DIGESTS_SIZE:
+                self._known.popitem(last=False)
+
+    def ensure_ttl(self, retention_seconds):
+        # Payloads no log written in the retention period references expire.
+        expire_after = int(retention_seconds + TOUCH_INTERVAL_SECONDS)
+        try:
+            self.get_payloads_collection().create_index("referenced_at", expireAfterSeconds=expire_after)
+        except OperationFailure:
+            # The retention changed since the index was created.
+            self.mongo.webhook_db.command("collMod", "payloads", index={
+                "keyPattern": {"referenced_at": 1}, "expireAfterSeconds": expire_after,
+            })
+
+    def load_raw_many(self, digests):
+        # Bodies as the stored bytes, for re-sending them.
+        blobs = self.get_payloads_collection().find({"_id": {"$in": list(set(digests))}})
+        return {blob["_id"]: decompress(blob["data"], blob.get("codec", CODEC_ZLIB)) for blob in blobs}
+
+    def load_many(self, digests):
+        blobs = self.get_payloads_collection().find({"_id": {"$in": list(set(digests))}})
+        return {blob["_id"]: self.decode(blob) for blob in blobs}
+
+    def decode(self, blob):
+        body = decompress(blob["data"], blob.get("codec", CODEC_ZLIB))
+        try:
+            return loads(body)
+        except ValueError:
+            return body.decode("utf-8", "replace")
+
+    def resolve(self, logs):
+        # Swaps payload references for the decompressed bodies, one query per
+        # batch of logs.
+        digests = [log["payload_ref"] for log in logs if log.get("payload_ref")]
+        if not digests:
+            return logs
+        bodies = self.load_many(digests)
+        for log in logs:
+            digest = log.pop("payload_ref", None)
+            if digest:
+                log["response_body"] = bodies.get(digest)
+        return logs
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_payload_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = PayloadStore()
+        return _store
@@ -0,0 +1,151 @@
+import threading
+import time
+from urllib.parse import urlsplit
+from config import RATE_LIMIT_MAX_WAIT_SECONDS, RATE_LIMIT_HOST_RATE, RATE_LIMIT_HOST_BURST
+from constants import INVALID_RATE_LIMIT_MESSAGE
+from exceptions import ValidationError
+
+
+def parse_rate_limit(spec):
+    # {"rate": <deliveries per second>, "burst": <bucket size, defaults to rate>}
+    if spec is None:
+        return None
+    if not isinstance(spec, dict) or set(spec) - {"rate", "burst"}:
+        raise ValidationError(INVALID_RATE_LIMIT_MESSAGE)
+    rate, burst = spec.get("rate"), spec.get("burst", spec.get("rate"))
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0 for value in (rate, burst)):
+        raise ValidationError(INVALID_RATE_LIMIT_MESSAGE)
+    return float(rate), max(1.0, float(burst))
+
+
+class TokenBucket:
+    # Reservations may drive the balance below zero: a negative balance is
+    # the backlog, and each reservation is told how long to wait for its turn.
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.queued = 0
+        self.delivered = 0
+        self.throttled = 0
+        self.throttle_seconds = 0.0
+        self.deferred = 0
+
+    def configure(self, rate, burst):
+        if (rate, burst) != (self.rate, self.burst):
+            self.refill(time.monotonic())
+            self.rate, self.burst = rate, burst
+            self.tokens = min(self.tokens, burst)
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        self.refill(now)
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+    def to_dict(self):
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "queued": self.queued,
+            "delivered": self.delivered,
+            "throttled": self.throttled,
+            "throttle_seconds": round(self.throttle_seconds, 3),
+            "deferred": self.deferred,
+        }
+
+
+class Throttle:
+    # The buckets one delivery has to pass (its endpoint's and its host's).
+    def __init__(self, limiter, buckets, max_wait):
+        self.limiter = limiter
+        self.buckets = buckets
+        self.max_wait = max_wait
+
+    def reserve(self):
+        # Returns the seconds to wait before sending, or None when that would
+        # exceed max_wait and the delivery should be deferred instead.
+        with self.limiter.lock:
+            now = time.monotonic()
+            wait = max(bucket.wait_time(now) for bucket in self.buckets)
+            if self.max_wait is not None and wait > self.max_wait:
+                for bucket in self.buckets:
+                    bucket.deferred += 1
+                return None
+            for bucket in self.buckets:
+                bucket.tokens -= 1
+                bucket.delivered += 1
+                if wait:
+                    bucket.queued += 1
+                    bucket.throttled += 1
+                    bucket.throttle_seconds += wait
+            return wait
+
+    def release(self, wait):
+        if not wait:
+            return
+        with self.limiter.lock:
+            for bucket in self.buckets:
+                bucket.queued -= 1
+
+
+class RateLimiter:
+    def __init__(self, max_wait=RATE_LIMIT_MAX_WAIT_SECONDS, host_rate=RATE_LIMIT_HOST_RATE, host_burst=RATE_LIMIT_HOST_BURST):
+        self.max_wait = max_wait
+        self.host_limit = (float(host_rate), max(1.0, float(host_burst or host_rate))) if host_rate else None
+        self.lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, key, limit):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(*limit)
+        else:
+            bucket.configure(*limit)
+        return bucket
+
+    def throttle(self, url, endpoint=None, webhook_id=None, defer=True, max_wait=None):
+        # Returns None when no limit applies to this delivery. max_wait
+        # overrides the limiter's own for deliveries that can be deferred.
+        buckets = []
+        with self.lock:
+            if endpoint is not None:
+                limit = parse_rate_limit(endpoint.get("rate_limit"))
+                if limit:
+                    buckets.append(self._bucket(("endpoint", webhook_id, endpoint["endpoint_id"]), limit))
+            host_limit = parse_rate_limit(endpoint.get("host_rate_limit")) if endpoint is not None else None
+            host_limit = host_limit or self.host_limit
+            if host_limit:
+                buckets.append(self._bucket(("host", urlsplit(url).netloc), host_limit))
+        if not buckets:
+            return None
+        if not defer:
+            return Throttle(self, buckets, None)
+        return Throttle(self, buckets, self.max_wait if max_wait is None else max_wait)
+
+    def stats(self, webhook_id, endpoints):
+        with self.lock:
+            result = []
+            for endpoint in endpoints:
+                entry = {"endpoint_id": endpoint["endpoint_id"], "url": endpoint["url"]}
+                bucket = self._buckets.get(("endpoint", webhook_id, endpoint["endpoint_id"]))
+                host = self._buckets.get(("host", urlsplit(endpoint["url"]).netloc))
+                entry["endpoint"] = bucket.to_dict() if bucket else None
+                entry["host"] = host.to_dict() if host else None
+                result.append(entry)
+            return result
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter()
+        return _limiter
@@ -0,0 +1,308 @@
+import collections
+import datetime
+import logging
+import threading
+import time
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from config import (
+    mongo, REPLAY_WORKERS, REPLAY_DEFAULT_RATE, REPLAY_MAX_RATE, REPLAY_DEFAULT_CONCURRENCY, REPLAY_MAX_CONCURRENCY,
+    REPLAY_LEASE_SECONDS, REPLAY_POLL_INTERVAL_SECONDS
+)
+from constants import (
+    REPLAY_PENDING, REPLAY_RUNNING, REPLAY_PAUSED, REPLAY_COMPLETED, REPLAY_CANCELLED, REPLAY_FAILED,
+    RESPONSE_CODE_SUCCESS, STREAM_BATCH_SIZE
+)
+from exceptions import ValidationError
+from services.pagination import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# Events already sent by a replay, by (endpoint_id, event_ref), so retries of
+# one event logged several times inside the range go out once.
+SENT_EVENTS_SIZE = 100000
+# Status changes allowed through the API: action -> (from, to).
+ACTIONS = {
+    "pause": ((REPLAY_PENDING, REPLAY_RUNNING), REPLAY_PAUSED),
+    "resume": ((REPLAY_PAUSED, REPLAY_FAILED), REPLAY_PENDING),
+    "cancel": ((REPLAY_PENDING, REPLAY_RUNNING, REPLAY_PAUSED), REPLAY_CANCELLED),
+}
+
+
+class ReplayService:
+    # Replays re-send the events recorded on a webhook's forward logs (every
+    # endpoint's, or one endpoint's) between `since` and `until`. A worker
+    # leases the replay, streams the logs through the (webhook_id,
+    # endpoint_id, timestamp) index from its checkpoint, and sends at most
+    # `concurrency` events at a time, no faster than `rate` per second. The
+    # checkpoint is the cursor of the last log read, saved after each group,
+    # so a paused, failed, restarted or crashed replay continues where it
+    # stopped; the group in flight at a crash is sent again. The lease is
+    # renewed in the background while the worker waits or sends.
+    def __init__(self, log_service, workers=REPLAY_WORKERS, lease_seconds=REPLAY_LEASE_SECONDS,
+                 poll_interval=REPLAY_POLL_INTERVAL_SECONDS):
+        self.mongo = mongo
+        self.log_service = log_service
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def get_replays_collection(self):
+        return self.mongo.webhook_db.replays
+
+    def ensure_indexes(self):
+        self.get_replays_collection().create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        self.get_replays_collection().create_index([("webhook_id", ASCENDING), ("created_at", DESCENDING)])
+
+    def create(self, webhook_id, data):
+        since, until = data.get("since"), data.get("until")
+        if not isinstance(since, str) or (until is not None and not isinstance(until, str)):
+            raise ValidationError("since is required; since and until are ISO timestamps")
+        now = datetime.datetime.utcnow()
+        # Logs written after the replay was created, including its own, stay out of it.
+        until = min(until, now.isoformat() + "Z") if until else now.isoformat() + "Z"
+        rate = data.get("rate", REPLAY_DEFAULT_RATE)
+        concurrency = data.get("concurrency", REPLAY_DEFAULT_CONCURRENCY)
+        if not isinstance(rate, (int, float)) or not 0 < rate <= REPLAY_MAX_RATE:
+            raise ValidationError(f"rate must be above 0 and at most {REPLAY_MAX_RATE}")
+        if not isinstance(concurrency, int) or not 0 < concurrency <= REPLAY_MAX_CONCURRENCY:
+            raise ValidationError(f"concurrency must be between 1 and {REPLAY_MAX_CONCURRENCY}")
+        replay = {
+            "webhook_id": webhook_id,
+            "endpoint_id": data.get("endpoint_id"),
+            "since": since,
+            "until": until,
+            "only_failed": bool(data.get("only_failed", True)),
+            "rate": float(rate),
+            "concurrency": concurrency,
+            "status": REPLAY_PENDING,
+            "checkpoint": None,
+            "counts": {"read": 0, "delivered": 0, "failed": 0, "skipped": 0},
+            "created_at": now,
+            "updated_at": now,
+            "lease_expires_at": None,
+        }
+        replay["_id"] = self.get_replays_collection().insert_one(replay).inserted_id
+        self.wakeup()
+        return replay
+
+    def get(self, replay_id):
+        if not ObjectId.is_valid(replay_id):
+            return None
+        return self.get_replays_collection().find_one({"_id": ObjectId(replay_id)})
+
+    def list_replays(self, webhook_id, limit=100):
+        return list(self.get_replays_collection().find({"webhook_id": webhook_id}).sort("created_at", DESCENDING).limit(limit))
+
+    def transition(self, replay_id, action):
+        # Returns the updated replay, or None when it doesn't exist or can't
+        # take the action from its current status. A running replay notices
+        # at its next checkpoint.
+        if action not in ACTIONS:
+            raise ValidationError(f"Unknown replay action: {action}")
+        if not ObjectId.is_valid(replay_id):
+            return None
+        allowed, status = ACTIONS[action]
+        update = {"$set": {"status": status, "lease_expires_at": None, "updated_at": datetime.datetime.utcnow()}}
+        if status == REPLAY_PENDING:
+            update["$unset"] = {"error": ""}
+        replay = self.get_replays_collection().find_one_and_update(
+            {"_id": ObjectId(replay_id), "status": {"$in": list(allowed)}},
+            update,
+            return_document=ReturnDocument.AFTER,
+        )
+        if replay is not None and status == REPLAY_PENDING:
+            self.wakeup()
+        return replay
+
+    def wakeup(self):
+        self._wakeup.set()
+
+    def claim(self):
+        now = datetime.datetime.utcnow()
+        return self.get_replays_collection().find_one_and_update(
+            {"$or": [
+                {"status": REPLAY_PENDING},
+                {"status": REPLAY_RUNNING, "lease_expires_at": {"$lte": now}},
+            ]},
+            {"$set": {
+                "status": REPLAY_RUNNING,
+                "owner": ObjectId(),
+                "lease_expires_at": now + datetime.timedelta(seconds=self.lease_seconds),
+                "updated_at": now,
+            }},
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def select(self, replay):
+        # Groups of up to `concurrency` replayable logs, each with the last log
+        # read so far (the next checkpoint) and how many logs were read. Logs
+        # are read a page at a time, so no cursor is left open while groups
+        # are paced and sent; each page ends with a checkpoint, so long runs
+        # of logs that aren't replayed are checkpointed too.
+        after = replay["checkpoint"]
+        while True:
+            logs = list(self.log_service.find_logs(
+                replay["webhook_id"], since=replay["since"], until=replay["until"], endpoint_id=replay["endpoint_id"],
+                after=after, fields=["endpoint_id", "response_code", "event_ref"], limit=STREAM_BATCH_SIZE,
+            ))
+            group, read = [], 0
+            for log in logs:
+                read += 1
+                if log.get("event_ref") and log.get("endpoint_id") and not (
+                        replay["only_failed"] and log.get("response_code") == RESPONSE_CODE_SUCCESS):
+                    group.append(log)
+                if len(group) == replay["concurrency"]:
+                    yield group, log, read
+                    group, read = [], 0
+            if read:
+                yield group, logs[-1], read
+            if len(logs) < STREAM_BATCH_SIZE:
+                return
+            after = encode_cursor(logs[-1]["timestamp"], logs[-1]["_id"])
+
+    def renew(self, replay):
+        # False when the replay was paused or cancelled, or its lease was
+        # taken over, since it was claimed.
+        result = self.get_replays_collection().update_one(
+            {"_id": replay["_id"], "status": REPLAY_RUNNING, "owner": replay["owner"]},
+            {"$set": {"lease_expires_at": datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lease_seconds)}},
+        )
+        return bool(result.modified_count)
+
+    def _heartbeat(self, replay, halt):
+        while not halt.wait(self.lease_seconds / 3):
+            try:
+                if not self.renew(replay):
+                    halt.set()
+            except Exception as e:
+                logger.error(f"Error renewing lease of replay {replay['_id']}: {e}")
+
+    def checkpoint(self, replay, last, counts):
+        # False when the replay was paused or cancelled, or its lease was
+        # taken over, since it was claimed.
+        now = datetime.datetime.utcnow()
+        result = self.get_replays_collection().update_one(
+            {"_id": replay["_id"], "status": REPLAY_RUNNING, "owner": replay["owner"]},
+            {"$set": {
+                "checkpoint": encode_cursor(last["timestamp"], last["_id"]),
+                "lease_expires_at": now + datetime.timedelta(seconds=self.lease_seconds),
+                "updated_at": now,
+            }, "$inc": {f"counts.{name}": count for name, count in counts.items() if count}},
+        )
+        return bool(result.modified_count)
+
+    def finish(self, replay, status, error=None):
+        update = {"status": status, "lease_expires_at": None, "updated_at": datetime.datetime.utcnow()}
+        if error:
+            update["error"] = error
+        self.get_replays_collection().update_one(
+            {"_id": replay["_id"], "status": REPLAY_RUNNING, "owner": replay["owner"]},
+            {"$set": update},
+        )
+
+    def run(self, replay, deliver):
+        # `halt` is set when the worker stops or the replay loses its lease.
+        halt = threading.Event()
+        with self._lock:
+            self._running.add(halt)
+            if self._stopped.is_set():
+                halt.set()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(replay, halt), name="replay-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            if self._run(replay, deliver, halt):
+                self.finish(replay, REPLAY_COMPLETED)
+        finally:
+            with self._lock:
+                self._running.discard(halt)
+            halt.set()
+            heartbeat.join()
+
+    def _run(self, replay, deliver, halt):
+        # `deliver(replay, logs, bodies)` sends one group and returns its
+        # counts. Returns False when the replay stopped before the end.
+        interval = 1 / replay["rate"]
+        sent = collections.OrderedDict()
+        started = time.monotonic()
+        for group, last, read in self.select(replay):
+            fresh = []
+            for log in group:
+                key = (log["endpoint_id"], log["event_ref"])
+                if key not in sent:
+                    sent[key] = True
+                    fresh.append(log)
+            while len(sent) > SENT_EVENTS_SIZE:
+                sent.popitem(last=False)
+            if fresh and replay["only_failed"]:
+                # Failures a retry (or an earlier run of this replay) delivered since.
+                delivered = self.log_service.find_delivered(replay["webhook_id"], fresh)
+                fresh = [log for log in fresh if (log["endpoint_id"], log["event_ref"]) not in delivered]
+            counts = {"read": read, "delivered": 0, "failed": 0, "skipped": len(group) - len(fresh)}
+            if fresh:
+                # Pace the start of each group so the average stays at `rate`.
+                if halt.wait(max(0.0, started - time.monotonic())):
+                    return False
+                started = max(started, time.monotonic()) + len(fresh) * interval
+                bodies = self.log_service.payload_store.load_raw_many([log["event_ref"] for log in fresh])
+                for name, count in deliver(replay, fresh, bodies).items():
+                    counts[name] += count
+            if not self.checkpoint(replay, last, counts) or halt.is_set():
+                return False
+        return True
+
+    def start_workers(self, app, deliver):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(app, deliver, i == 0), name=f"replay-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop_workers(self):
+        with self._lock:
+            self._stopped.set()
+            for halt in self._running:
+                halt.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self, app, deliver, create_indexes=False):
+        if create_indexes:
+            try:
+                self.ensure_indexes()
+            except Exception as e:
+                logger.error(f"Error creating replay indexes: {e}")
+        with app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    replay = self.claim()
+                except Exception as e:
+                    logger.error(f"Error claiming replay: {e}")
+                    replay = None
+                if replay is None:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+                    continue
+                try:
+                    self.run(replay, deliver)
+                except Exception as e:
+                    logger.error(f"Error running replay {replay['_id']}: {e}")
+                    try:
+                        self.finish(replay, REPLAY_FAILED, str(e))
+                    except Exception as e:
+                        logger.error(f"Error failing replay {replay['_id']}: {e}")
+
+
+def to_replay_response(replay):
+    response = {key: value for key, value in replay.items() if key not in ("_id", "owner", "lease_expires_at")}
+    response["replay_id"] = str(replay["_id"])
+    for key in ("created_at", "updated_at"):
+        response[key] = replay[key].isoformat() + "Z"
+    return response
@@ -0,0 +1,249 @@
+import datetime
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from config import (
+    mongo, RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS,
+    RETRY_POLL_INTERVAL_SECONDS, RETRY_BATCH_SIZE, RETRY_LEASE_SECONDS, RETRY_MAX_DEFERRALS
+)
+from constants import RETRY_SCHEDULED, RETRY_IN_FLIGHT, RESPONSE_CODE_ERROR
+from services.delivery_service import DeliveryResult
+from services.log_service import LogService
+from services.payload import to_payload
+
+logger = logging.getLogger(__name__)
+
+
+class RetryService:
+    # Pending retries live in the retries collection; each process keeps the
+    # ones due soon in a heap ordered by due time and sleeps until the earliest
+    # one, so waiting retries cost nothing but memory.
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY_SECONDS,
+                 max_delay=RETRY_MAX_DELAY_SECONDS, poll_interval=RETRY_POLL_INTERVAL_SECONDS,
+                 batch_size=RETRY_BATCH_SIZE, lease_seconds=RETRY_LEASE_SECONDS, max_deferrals=RETRY_MAX_DEFERRALS,
+                 outbox_service=None):
+        self.mongo = mongo
+        self.log_service = LogService()
+        self.outbox_service = outbox_service
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_deferrals = max_deferrals
+        self._heap = []
+        self._known = set()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._next_refresh = 0
+        self._thread = None
+
+    def get_retries_collection(self):
+        return self.mongo.webhook_db.retries
+
+    def get_dead_letters_collection(self):
+        return self.mongo.webhook_db.dead_letters
+
+    def ensure_indexes(self):
+        self.get_retries_collection().create_index([("status", ASCENDING), ("due_at", ASCENDING)])
+        self.get_dead_letters_collection().create_index([("webhook_id", ASCENDING), ("dead_at", DESCENDING)])
+
+    def next_delay(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def defer_delay(self, deferrals, retry_after=None):
+        return max(retry_after or 0.0, self.next_delay(deferrals))
+
+    def schedule(self, webhook_id, endpoint, data, error, attempts=1, retry_after=None, outbox_event_id=None):
+        # attempts=0 schedules a delivery that was deferred before being sent.
+        # outbox_event_id ties a webhook_url retry to the outbox event it settles.
+        retry = {
+            "webhook_id": webhook_id,
+            "endpoint_id": endpoint["endpoint_id"],
+            "url": endpoint["url"],
+            "payload": to_payload(data).body,
+            "attempts": attempts,
+            "last_error": error,
+        }
+        for key in ("rate_limit", "host_rate_limit"):
+            if endpoint.get(key):
+                retry[key] = endpoint[key]
+        if outbox_event_id is not None:
+            retry["outbox_event_id"] = outbox_event_id
+        if attempts >= self.max_attempts:
+            return self.dead_letter(retry)
+        retry["status"] = RETRY_SCHEDULED
+        retry["deferrals"] = 0 if attempts else 1
+        delay = self.next_delay(attempts) if attempts else self.defer_delay(1, retry_after)
+        retry["due_at"] = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+        retry["_id"] = self.get_retries_collection().insert_one(retry).inserted_id
+        if self._thread is not None:
+            self._push(retry["_id"], retry["due_at"])
+        return retry
+
+    def reschedule(self, retry, error):
+        attempts = retry["attempts"] + 1
+        if attempts >= self.max_attempts:
+            self.get_retries_collection().delete_one({"_id": retry["_id"]})
+            retry.update({"attempts": attempts, "last_error": error})
+            return self.dead_letter(retry)
+        due_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.next_delay(attempts))
+        self.get_retries_collection().update_one({"_id": retry["_id"]}, {"$set": {
+            "status": RETRY_SCHEDULED, "attempts": attempts, "last_error": error, "due_at": due_at
+        }})
+        self._push(retry["_id"], due_at)
+
+    def defer(self, retry, retry_after=None, error=None):
+        # Not sent (e.g. the endpoint's circuit is open), so no attempt is used
+        # up; deferrals back off on their own counter and are capped too.
+        deferrals = retry.get("deferrals", 0) + 1
+        if deferrals > self.max_deferrals:
+            self.get_retries_collection().delete_one({"_id": retry["_id"]})
+            retry.update({"deferrals": deferrals, "last_error": f"Deferred {deferrals - 1} times: {error or retry['last_error']}"})
+            return self.dead_letter(retry)
+        due_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.defer_delay(deferrals, retry_after))
+        self.get_retries_collection().update_one({"_id": retry["_id"]}, {"$set": {
+            "status": RETRY_SCHEDULED, "due_at": due_at, "deferrals": deferrals
+        }})
+        self._push(retry["_id"], due_at)
+
+    def cancel(self, retry, reason):
+        # The endpoint is gone, so there is nothing left to dead-letter.
+        self.get_retries_collection().delete_one({"_id": retry["_id"]})
+        self.log_service.create_log(retry["webhook_id"], retry["endpoint_id"], None, RESPONSE_CODE_ERROR,
+                                    f"Dropped after {retry['attempts']} attempts: {reason}")
+
+    def complete(self, retry):
+        self.get_retries_collection().delete_one({"_id": retry["_id"]})
+        self.settle_outbox_event(retry)
+
+    def dead_letter(self, retry):
+        dead_letter = {key: value for key, value in retry.items() if key not in ("_id", "status", "due_at", "lease_expires_at")}
+        dead_letter["dead_at"] = datetime.datetime.utcnow()
+        self.get_dead_letters_collection().insert_one(dead_letter)
+        self.settle_outbox_event(retry, retry["last_error"])
+        self.log_service.create_log(retry["webhook_id"], retry["endpoint_id"], None, RESPONSE_CODE_ERROR,
+                                    f"Moved to dead letters after {retry['attempts']} attempts: {retry['last_error']}")
+        return dead_letter
+
+    def settle_outbox_event(self, retry, error=None):
+        if self.outbox_service is not None and retry.get("outbox_event_id") is not None:
+            self.outbox_service.settle(retry["outbox_event_id"], error)
+
+    def list_dead_letters(self, webhook_id, limit):
+        dead_letters = list(self.get_dead_letters_collection().find({"webhook_id": webhook_id})
+                            .sort("dead_at", DESCENDING).limit(limit))
+        for dead_letter in dead_letters:
+            dead_letter["_id"] = str(dead_letter["_id"])
+            dead_letter["dead_at"] = dead_letter["dead_at"].isoformat() + 'Z'
+            dead_letter["payload"] = to_payload(dead_letter["payload"]).data
+        return dead_letters
+
+    def claim(self, retry_id):
+        now = datetime.datetime.utcnow()
+        return self.get_retries_collection().find_one_and_update(
+            {"_id": retry_id, "$or": [
+                {"status": RETRY_SCHEDULED},
+                {"status": RETRY_IN_FLIGHT, "lease_expires_at": {"$lte": now}},
+            ]},
+            {"$set": {"status": RETRY_IN_FLIGHT, "lease_expires_at": now + datetime.timedelta(seconds=self.lease_seconds)}},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def refresh(self):
+        # Pick up retries scheduled by other processes or left over from a
+        # previous run that fall due before the next refresh.
+        now = datetime.datetime.utcnow()
+        horizon = now + datetime.timedelta(seconds=self.poll_interval)
+        cursor = self.get_retries_collection().find(
+            {"$or": [
+                {"status": RETRY_SCHEDULED, "due_at": {"$lte": horizon}},
+                {"status": RETRY_IN_FLIGHT, "lease_expires_at": {"$lte": now}},
+            ]},
+            {"due_at": 1},
+        )
+        for retry in cursor:
+            self._push(retry["_id"], retry.get("due_at") or now)
+
+    def _push(self, retry_id, due_at):
+        with self._condition:
+            if retry_id in self._known:
+                return
+            self._known.add(retry_id)
+            due = due_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+            heapq.heappush(self._heap, (due, next(self._sequence), retry_id))
+            if self._heap[0][2] == retry_id:
+                self._condition.notify()
+
+    def _pop_due(self):
+        with self._condition:
+            while not self._stopped.is_set():
+                now = time.time()
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                        retry_id = heapq.heappop(self._heap)[2]
+                        self._known.discard(retry_id)
+                        due.append(retry_id)
+                    return due
+                if now >= self._next_refresh:
+                    return []
+                timeout = self._next_refresh - now
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - now)
+                self._condition.wait(timeout)
+            return []
+
+    def start(self, app, deliver):
+        self._thread = threading.Thread(target=self._run, args=(app, deliver), name="retry-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, app, deliver):
+        # Indexes are created here rather than in start() so app startup
+        # doesn't wait on Mongo.
+        try:
+            self.ensure_indexes()
+        except Exception as e:
+            logger.error(f"Error creating retry indexes: {e}")
+        with app.app_context():
+            while not self._stopped.is_set():
+                try:
+                    if time.time() >= self._next_refresh:
+                        self._next_refresh = time.time() + self.poll_interval
+                        self.refresh()
+                    retries = [retry for retry in map(self.claim, self._pop_due()) if retry]
+                    if retries:
+                        self._deliver(retries, deliver)
+                except Exception as e:
+                    logger.error(f"Error running retry scheduler: {e}")
+                    self._stopped.wait(self.poll_interval)
+
+    def _deliver(self, retries, deliver):
+        try:
+            results = deliver(retries)
+        except Exception as e:
+            results = [DeliveryResult(retry["url"], error=str(e)) for retry in retries]
+        for retry, result in zip(retries, results):
+            if result.ok:
+                self.complete(retry)
+            elif result.cancelled:
+                self.cancel(retry, result.error)
+            elif result.deferred:
+                self.defer(retry, result.retry_after, result.error)
+            else:
+                self.reschedule(retry, result.error)
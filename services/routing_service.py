@@ -0,0 +1,114 @@
+import operator
+from config import EVENT_TYPE_FIELD
+from constants import INVALID_FILTER_MESSAGE
+from exceptions import ValidationError
+from services.payload import to_payload
+
+_MISSING = object()
+
+
+def _compare(compare):
+    def apply(value, expected):
+        try:
+            return value is not _MISSING and compare(value, expected)
+        except TypeError:
+            return False
+    return apply
+
+
+OPERATORS = {
+    "$eq": _compare(operator.eq),
+    "$ne": lambda value, expected: value is _MISSING or value != expected,
+    "$gt": _compare(operator.gt),
+    "$gte": _compare(operator.ge),
+    "$lt": _compare(operator.lt),
+    "$lte": _compare(operator.le),
+    "$in": lambda value, expected: value is not _MISSING and value in expected,
+    "$nin": lambda value, expected: value is _MISSING or value not in expected,
+    "$exists": lambda value, expected: (value is not _MISSING) == bool(expected),
+}
+
+
+def lookup(data, path):
+    for key in path:
+        if not isinstance(data, dict):
+            return _MISSING
+        data = data.get(key, _MISSING)
+        if data is _MISSING:
+            return _MISSING
+    return data
+
+
+def compile_filter(spec):
+    # {"event_types": [...], "match": {"data.status": "paid", "amount": {"$gte": 100}}}
+    # becomes (event_types or None, [(path, test, expected), ...]).
+    if not spec:
+        return None, []
+    if not isinstance(spec, dict) or set(spec) - {"event_types", "match"}:
+        raise ValidationError(INVALID_FILTER_MESSAGE)
+    event_types = spec.get("event_types")
+    if event_types is not None and (not isinstance(event_types, list) or not all(isinstance(t, str) for t in event_types)):
+        raise ValidationError(INVALID_FILTER_MESSAGE)
+    match = spec.get("match") or {}
+    if not isinstance(match, dict):
+        raise ValidationError(INVALID_FILTER_MESSAGE)
+    predicates = []
+    for field, condition in match.items():
+        path = tuple(field.split("."))
+        conditions = condition if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition) else {"$eq": condition}
+        for name, expected in conditions.items():
+            if name not in OPERATORS or (name in ("$in", "$nin") and not isinstance(expected, list)):
+                raise ValidationError(INVALID_FILTER_MESSAGE)
+            predicates.append((path, OPERATORS[name], expected))
+    return (set(event_types) if event_types else None), predicates
+
+
+class RoutingIndex:
+    # Built once per webhook document. Endpoints without an event type filter
+    # go in every bucket, so picking candidates is one dict lookup and only
+    # their field predicates are evaluated. Webhooks without filters never
+    # parse the payload.
+    def __init__(self, endpoints, event_type_field=EVENT_TYPE_FIELD):
+        self.event_type_path = tuple(event_type_field.split("."))
+        self.predicates = {}
+        typed = {}
+        self.default = []
+        for endpoint in endpoints:
+            event_types, predicates = compile_filter(endpoint.get("filter"))
+            if predicates:
+                self.predicates[endpoint["endpoint_id"]] = predicates
+            if event_types is None:
+                self.default.append(endpoint)
+                for bucket in typed.values():
+                    bucket.append(endpoint)
+            else:
+                for event_type in event_types:
+                    if event_type not in typed:
+                        typed[event_type] = list(self.default)
+                    typed[event_type].append(endpoint)
+        self.by_type = typed
+        self.needs_data = bool(typed or self.predicates)
+
+    def route(self, payload):
+        if not self.needs_data:
+            return self.default
+        try:
+            data = to_payload(payload).data
+        except ValueError:
+            data = None
+        event_type = lookup(data, self.event_type_path)
+        candidates = self.by_type.get(event_type, self.default) if isinstance(event_type, str) else self.default
+        if not self.predicates:
+            return candidates
+        return [endpoint for endpoint in candidates if all(
+            test(lookup(data, path), expected) for path, test, expected in self.predicates.get(endpoint["endpoint_id"], ())
+        )]
+
+
+def get_routing_index(webhook):
+    # Cached webhook documents carry their compiled index; outbox events are
+    # compiled on use.
+    routing = webhook.get("routing")
+    if routing is None:
+        routing = RoutingIndex(webhook.get("endpoints", []))
+    return routing
@@ -0,0 +1,136 @@
+import bisect
+import threading
+import time
+from urllib.parse import urlsplit
+from config import STAGE_METRICS_ENABLED, STAGE_METRICS_WEBHOOK_LABEL, STAGE_METRICS_MAX_SERIES
+from services.metrics_service import LATENCY_BUCKETS_MS
+from services.tracing_service import get_tracer
+
+BUCKETS_SECONDS = [bucket / 1000 for bucket in LATENCY_BUCKETS_MS]
+OVERFLOW_LABEL = "other"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Series:
+    __slots__ = ("count", "total", "errors", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.buckets = [0] * (len(BUCKETS_SECONDS) + 1)
+
+
+class StageTimer:
+    # Also opens a trace span for the stage when the request is being traced.
+    __slots__ = ("metrics", "stage", "webhook_id", "host", "started", "scope")
+
+    def __init__(self, metrics, stage, webhook_id, host):
+        self.metrics = metrics
+        self.stage = stage
+        self.webhook_id = webhook_id
+        self.host = host
+
+    def __enter__(self):
+        self.scope = self.metrics.tracer.span(self.stage, host=self.host) if self.host else self.metrics.tracer.span(self.stage)
+        self.scope.__enter__()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started, self.webhook_id, self.host, error_type is not None)
+        self.scope.__exit__(error_type, error, traceback)
+        return False
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+
+class StageMetrics:
+    # Latency histograms and error counts per (stage, webhook, host), kept in
+    # memory and rendered in the Prometheus text format. Recording is a dict
+    # lookup and a bisect under one lock. Past max_series label sets, new
+    # webhooks and hosts are folded into "other" to bound memory.
+    def __init__(self, enabled=STAGE_METRICS_ENABLED, webhook_label=STAGE_METRICS_WEBHOOK_LABEL, max_series=STAGE_METRICS_MAX_SERIES):
+        self.enabled = enabled
+        self.webhook_label = webhook_label
+        self.max_series = max_series
+        self.tracer = get_tracer()
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def time(self, stage, webhook_id=None, host=None):
+        return StageTimer(self, stage, webhook_id, host)
+
+    def observe(self, stage, seconds, webhook_id=None, host=None, error=False):
+        if not self.enabled:
+            return
+        key = (stage, (webhook_id or "") if self.webhook_label else "", host or "")
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                if len(self._series) >= self.max_series:
+                    key = (stage, OVERFLOW_LABEL if key[1] else "", OVERFLOW_LABEL if key[2] else "")
+                    series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = Series()
+            series.count += 1
+            series.total += seconds
+            series.buckets[bisect.bisect_left(BUCKETS_SECONDS, seconds)] += 1
+            if error:
+                series.errors += 1
+
+    def render(self, gauges=()):
+        # gauges: (name, help, type, [(labels dict, value), ...])
+        with self._lock:
+            series = [(key, value.count, value.total, value.errors, list(value.buckets)) for key, value in self._series.items()]
+        lines = [
+            "# HELP webhook_stage_duration_seconds Time spent in each request stage.",
+            "# TYPE webhook_stage_duration_seconds histogram",
+        ]
+        for (stage, webhook_id, host), count, total, errors, buckets in series:
+            labels = format_labels({"stage": stage, "webhook_id": webhook_id, "host": host})
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS_SECONDS, buckets):
+                cumulative += bucket
+                lines.append(f'webhook_stage_duration_seconds_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'webhook_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"webhook_stage_duration_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"webhook_stage_duration_seconds_count{{{labels}}} {count}")
+        lines += [
+            "# HELP webhook_stage_errors_total Stage executions that raised or failed.",
+            "# TYPE webhook_stage_errors_total counter",
+        ]
+        for (stage, webhook_id, host), count, total, errors, buckets in series:
+            labels = format_labels({"stage": stage, "webhook_id": webhook_id, "host": host})
+            lines.append(f"webhook_stage_errors_total{{{labels}}} {errors}")
+        for name, description, metric_type, samples in gauges:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {metric_type}"]
+            for labels, value in samples:
+                lines.append(f"{name}{{{format_labels(labels)}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+def format_labels(labels):
+    return ",".join(f'{name}="{escape(value)}"' for name, value in labels.items() if value != "")
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_stage_metrics():
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = StageMetrics()
+        return _metrics
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock, AsyncMock
+from bson.objectid import ObjectId
+from services.async_webhook_service import AsyncWebhookService
+from services.delivery_service import DeliveryResult
+from services.webhook_cache_service import WebhookCache
+from exceptions import NotFoundError
+from constants import RESPONSE_CODE_SUCCESS, RESPONSE_CODE_ACCEPTED
+
+@pytest.fixture
+def service():
+    webhook_service = MagicMock()
+    webhook_service.webhook_cache = WebhookCache()
+    service = AsyncWebhookService(webhook_service)
+    service.mongo = MagicMock()
+    service.delivery_engine = MagicMock()
+    return service
+
+def test_receive_webhook_delivers_and_records(service):
+    webhook_id = str(ObjectId())
+    webhook = {"_id": ObjectId(webhook_id), "webhook_url": "http://example.com", "endpoints": []}
+    endpoints = [{"endpoint_id": "1", "url": "http://example1.com"}]
+    results = [DeliveryResult("http://example1.com", 200), DeliveryResult("http://example.com", 200)]
+    service.mongo.webhook_db.webhooks.find_one = AsyncMock(return_value=webhook)
+    service.webhook_service.select_endpoints.return_value = endpoints
+    service.webhook_service.build_deliveries.side_effect = lambda webhook_id, webhook, endpoints, data, max_wait=None: [
+        (endpoint["url"], data, None) for endpoint in endpoints] + [(webhook["webhook_url"], data, None)]
+    service.delivery_engine.post_each = AsyncMock(return_value=results)
+
+    result, status_code = asyncio.run(service.receive_webhook(webhook_id, {"key": "value"}))
+
+    assert status_code == RESPONSE_CODE_SUCCESS
+    deliveries = service.delivery_engine.post_each.await_args.args[0]
+    assert [delivery[0] for delivery in deliveries] == ["http://example1.com", "http://example.com"]
+    service.webhook_service.record_results.assert_called_once_with(webhook_id, endpoints, {"key": "value"}, results)
+
+def test_logs_are_written_off_the_event_loop(service):
+    threads = []
+    service.log_service = MagicMock()
+    service.log_service.create_log.side_effect = lambda *args: threads.append(threading.get_ident())
+
+    async def log():
+        await service.create_log("abc", None, None, 500, "Error receiving webhook")
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(log())
+
+    service.log_service.create_log.assert_called_once_with("abc", None, None, 500, "Error receiving webhook")
+    assert threads and threads[0] != loop_thread
+
+def test_get_webhook_uses_cache(service):
+    webhook_id = str(ObjectId())
+    service.mongo.webhook_db.webhooks.find_one = AsyncMock(return_value={"_id": ObjectId(webhook_id)})
+
+    asyncio.run(service.get_webhook(webhook_id))
+    asyncio.run(service.get_webhook(webhook_id))
+
+    assert service.mongo.webhook_db.webhooks.find_one.await_count == 1
+
+def test_get_webhook_not_found(service):
+    service.mongo.webhook_db.webhooks.find_one = AsyncMock(return_value=None)
+
+    with pytest.raises(NotFoundError):
+        asyncio.run(service.get_webhook(str(ObjectId())))
+
+def test_accept_webhook_inserts_outbox_event(service):
+    webhook_id = str(ObjectId())
+    event_id = ObjectId()
+    service.mongo.webhook_db.webhooks.find_one = AsyncMock(return_value={"_id": ObjectId(webhook_id), "webhook_url": "http://example.com"})
+    service.mongo.webhook_db.outbox.insert_one = AsyncMock(return_value=MagicMock(inserted_id=event_id))
+
+    result, status_code = asyncio.run(service.accept_webhook(webhook_id, {"key": "value"}))
+
+    assert status_code == RESPONSE_CODE_ACCEPTED
+    assert result["event_id"] == str(event_id)
+    service.outbox_service.wakeup.assert_called_once()
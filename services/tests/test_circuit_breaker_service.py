@@ -0,0 +1,65 @@
+import datetime
+import time
+import pytest
+from unittest.mock import MagicMock
+from services.circuit_breaker_service import CircuitBreakerService
+
+@pytest.fixture
+def mock_mongo():
+    return MagicMock()
+
+@pytest.fixture
+def breaker(mock_mongo):
+    service = CircuitBreakerService(window_seconds=60, min_requests=4, failure_rate=0.5, open_seconds=0.1)
+    service.mongo = mock_mongo
+    return service
+
+def test_circuit_opens_when_failure_rate_exceeded(breaker, mock_mongo):
+    for ok in (True, False, True, False):
+        assert breaker.allow("abc", "1")
+        breaker.record("abc", "1", ok)
+
+    assert not breaker.allow("abc", "1")
+    assert 0 < breaker.retry_after("abc", "1") <= 0.1
+    assert breaker.retry_after("abc", "2") == 0.0
+    persisted = mock_mongo.webhook_db.endpoint_health.update_one.call_args.args[1]["$set"]
+    assert persisted["state"] == "open"
+
+def test_circuit_stays_closed_below_min_requests(breaker):
+    for _ in range(3):
+        breaker.record("abc", "1", False)
+
+    assert breaker.allow("abc", "1")
+
+def test_half_open_allows_single_probe_then_closes(breaker):
+    for _ in range(4):
+        breaker.record("abc", "1", False)
+    time.sleep(0.15)
+
+    assert breaker.allow("abc", "1")
+    assert not breaker.allow("abc", "1")
+    breaker.record("abc", "1", True)
+
+    assert breaker.allow("abc", "1")
+    assert breaker.get_health("abc", [{"endpoint_id": "1", "url": "http://example1.com"}])[0]["state"] == "closed"
+
+def test_failed_probe_reopens_circuit(breaker):
+    for _ in range(4):
+        breaker.record("abc", "1", False)
+    time.sleep(0.15)
+
+    assert breaker.allow("abc", "1")
+    breaker.record("abc", "1", False)
+
+    assert not breaker.allow("abc", "1")
+
+def test_refresh_adopts_state_from_other_workers(breaker, mock_mongo):
+    now = datetime.datetime.utcnow()
+    mock_mongo.webhook_db.endpoint_health.find.return_value = [
+        {"_id": "1", "webhook_id": "abc", "state": "open", "opened_at": now, "updated_at": now}
+    ]
+    breaker.open_seconds = 60
+
+    breaker.refresh()
+
+    assert not breaker.allow("abc", "1")
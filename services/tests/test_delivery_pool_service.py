@@ -0,0 +1,86 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from constants import RATE_LIMITED_MESSAGE
+from services.delivery_pool_service import DeliveryPool, HashRing
+from services.tracing_service import Span
+
+class OrderHandler(BaseHTTPRequestHandler):
+    received = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        # Later requests answer faster, so anything sent concurrently would arrive reordered.
+        time.sleep(0.05 if body.endswith(b'0}') else 0.01)
+        self.received.append((self.path, body))
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), OrderHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    OrderHandler.received = []
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+@pytest.fixture
+def pool():
+    pool = DeliveryPool(processes=2)
+    yield pool
+    pool.close()
+
+def test_hash_ring_is_stable_when_workers_are_added():
+    keys = [f"http://example.com/{i}" for i in range(1000)]
+    before = HashRing(range(4))
+    after = HashRing(range(5))
+
+    moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+    assert all(after.node_for(key) == 4 for key in moved)
+    assert 100 < len(moved) < 350
+    assert {before.node_for(key) for key in keys} == {0, 1, 2, 3}
+
+def test_deliveries_to_one_endpoint_arrive_in_order(pool, stub_url):
+    urls = [f"{stub_url}/a", f"{stub_url}/b"]
+    deliveries = [(url, {"n": n}) for n in range(10) for url in urls]
+
+    results = pool.deliver_each(deliveries)
+
+    assert all(result.ok for result in results)
+    for url in ("/a", "/b"):
+        assert [body for path, body in OrderHandler.received if path == url] == [b'{"n":%d}' % n for n in range(10)]
+
+def test_deferred_throttle_is_not_dispatched(pool, stub_url):
+    throttle = type("Throttle", (), {"reserve": lambda self: None})()
+
+    result, = pool.deliver_each([(f"{stub_url}/a", {"n": 1}, throttle)])
+
+    assert result.deferred
+    assert result.error == RATE_LIMITED_MESSAGE
+    assert OrderHandler.received == []
+
+def test_traced_delivery_gets_worker_timings(pool, stub_url):
+    span = Span("forward")
+
+    result, = pool.deliver_each([(f"{stub_url}/a", {"n": 1}, None, span)])
+
+    assert result.status_code == 200
+    assert span.attributes["status_code"] == 200
+    assert "response_headers_ms" in span.attributes
+    assert span.ended is not None
+
+def test_worker_exit_fails_pending_and_restarts(pool, stub_url):
+    pool.start()
+    pool._workers[0].process.kill()
+    deadline = time.monotonic() + 10
+    while pool.restarts == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert pool.restarts == 1
+    assert all(result.ok for result in pool.deliver_many([f"{stub_url}/{i}" for i in range(5)], {"n": 1}))
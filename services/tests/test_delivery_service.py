@@ -0,0 +1,65 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from services.delivery_service import DeliveryEngine
+from services.payload import Payload
+
+class StubHandler(BaseHTTPRequestHandler):
+    bodies = []
+
+    def do_POST(self):
+        self.bodies.append((self.headers.get("Content-Type"), self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+        time.sleep(0.3)
+        status = 503 if self.path == "/fail" else 200
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+@pytest.fixture
+def engine():
+    engine = DeliveryEngine(max_concurrency=20, limit_per_host=20, timeout=5)
+    yield engine
+    engine.close()
+
+def test_deliver_many_runs_concurrently(engine, stub_url):
+    urls = [f"{stub_url}/ok"] * 10
+    started = time.monotonic()
+    results = engine.deliver_many(urls, {"key": "value"})
+    elapsed = time.monotonic() - started
+
+    assert all(result.ok for result in results)
+    assert elapsed < 1.5  # sequential delivery would take 3 seconds
+
+def test_deliver_reports_non_200_status(engine, stub_url):
+    result = engine.deliver(f"{stub_url}/fail", {"key": "value"})
+
+    assert not result.ok
+    assert result.status_code == 503
+    assert "returned status code 503" in result.error
+
+def test_deliver_reports_connection_error(engine):
+    result = engine.deliver("http://127.0.0.1:1/unreachable", {"key": "value"})
+
+    assert not result.ok
+    assert result.status_code is None
+
+def test_deliver_many_forwards_raw_bytes(engine, stub_url):
+    StubHandler.bodies.clear()
+    body = b'{"b": 1,  "a": 2}'
+
+    results = engine.deliver_many([f"{stub_url}/ok"] * 3, Payload(body))
+
+    assert all(result.ok for result in results)
+    assert StubHandler.bodies == [("application/json", body)] * 3
@@ -0,0 +1,45 @@
+import pytest
+from unittest.mock import MagicMock
+from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError
+from services.endpoints import merge_endpoints, migrate_webhook, to_endpoint, upsert_operation
+
+def test_upsert_operation_keys_by_url_or_endpoint_id():
+    by_url = upsert_operation("w1", {"url": "http://example1.com", "rate_limit": {"rate": 1, "burst": 1}}, "now")
+    endpoint_id = str(ObjectId())
+    by_id = upsert_operation("w1", {"endpoint_id": endpoint_id, "url": "http://example2.com", "disabled": True}, "now")
+
+    assert by_url._filter == {"webhook_id": "w1", "url": "http://example1.com"}
+    assert by_url._doc["$set"] == {"url": "http://example1.com", "rate_limit": {"rate": 1, "burst": 1}, "updated_at": "now"}
+    assert by_url._doc["$setOnInsert"]["disabled"] is False
+    assert isinstance(by_url._doc["$setOnInsert"]["_id"], ObjectId)
+    assert by_id._filter == {"_id": ObjectId(endpoint_id), "webhook_id": "w1"}
+    assert by_id._doc["$set"]["disabled"] is True
+    assert "_id" not in by_id._doc["$setOnInsert"]
+
+def test_to_endpoint_and_merge():
+    stored_id = ObjectId()
+    stored = to_endpoint({"_id": stored_id, "webhook_id": "w1", "url": "http://example2.com", "created_at": "then", "disabled": False})
+    embedded = [{"endpoint_id": str(stored_id), "url": "http://old.example.com"}, {"endpoint_id": "e1", "url": "http://example1.com"}]
+
+    assert stored == {"endpoint_id": str(stored_id), "url": "http://example2.com", "disabled": False}
+    assert merge_endpoints(embedded, [stored]) == [embedded[1], stored]
+    assert merge_endpoints(None, [stored]) == [stored]
+
+def test_migrate_webhook_keeps_first_of_duplicate_urls():
+    webhooks, endpoints = MagicMock(), MagicMock()
+    embedded = [{"endpoint_id": str(ObjectId()), "url": "http://example1.com"},
+                {"endpoint_id": str(ObjectId()), "url": "http://example1.com"}]
+    endpoints.bulk_write.side_effect = BulkWriteError({"writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate"}]})
+
+    assert migrate_webhook(webhooks, endpoints, {"_id": "w1", "endpoints": embedded}) == 2
+    webhooks.update_one.assert_called_once_with({"_id": "w1", "endpoints": embedded}, {"$unset": {"endpoints": ""}})
+
+def test_migrate_webhook_keeps_array_on_other_errors():
+    webhooks, endpoints = MagicMock(), MagicMock()
+    endpoints.bulk_write.side_effect = BulkWriteError({"writeErrors": [{"index": 0, "code": 2, "errmsg": "bad value"}]})
+
+    with pytest.raises(BulkWriteError):
+        migrate_webhook(webhooks, endpoints, {"_id": "w1", "endpoints": [{"endpoint_id": str(ObjectId()), "url": "http://example1.com"}]})
+    webhooks.update_one.assert_not_called()
+    assert migrate_webhook(webhooks, endpoints, {"_id": "w1"}) == 0
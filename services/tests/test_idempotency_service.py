@@ -0,0 +1,90 @@
+import pytest
+from unittest.mock import MagicMock
+from pymongo.errors import DuplicateKeyError
+from services.idempotency_service import BloomFilter, IdempotencyService
+from services.payload import Payload
+from constants import IDEMPOTENCY_COMPLETED, IDEMPOTENCY_IN_PROGRESS, RESPONSE_CODE_CONFLICT
+
+@pytest.fixture
+def mock_mongo():
+    return MagicMock()
+
+@pytest.fixture
+def service(mock_mongo):
+    service = IdempotencyService(bloom_capacity=1000)
+    service.mongo = mock_mongo
+    return service
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    keys = [f"key-{i}" for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    assert sum(f"other-{i}" in bloom for i in range(1000)) < 50
+
+def test_key_prefers_header_over_payload_hash(service):
+    payload = Payload(b'{"a": 1}')
+
+    assert service.key_for("abc", payload, "evt_1") == "abc:key:evt_1"
+    assert service.key_for("abc", payload) is None
+    service.hash_payload = True
+    assert service.key_for("abc", payload).startswith("abc:sha256:")
+    assert service.key_for("abc", payload) == service.key_for("abc", Payload(b'{"a": 1}'))
+
+def test_duplicate_is_answered_locally_without_running_handler(service, mock_mongo):
+    handler = MagicMock(return_value=(Payload(b'{"a": 1}'), 200))
+
+    first = service.run("abc:key:1", handler)
+    second = service.run("abc:key:1", handler)
+
+    assert handler.call_count == 1
+    assert second == first
+    assert mock_mongo.webhook_db.idempotency_keys.insert_one.call_count == 1
+    mock_mongo.webhook_db.idempotency_keys.find_one.assert_not_called()
+
+def test_duplicate_from_another_process_replays_recorded_result(service, mock_mongo):
+    collection = mock_mongo.webhook_db.idempotency_keys
+    collection.insert_one.side_effect = DuplicateKeyError("duplicate")
+    collection.find_one_and_update.return_value = None
+    collection.find_one.return_value = {"_id": "abc:key:1", "status": IDEMPOTENCY_COMPLETED, "status_code": 200,
+                                        "body": b'{"a": 1}', "content_type": "application/json"}
+    handler = MagicMock()
+
+    result, status_code = service.run("abc:key:1", handler)
+
+    handler.assert_not_called()
+    assert status_code == 200
+    assert result.body == b'{"a": 1}'
+
+def test_duplicate_in_progress_returns_conflict(service, mock_mongo):
+    collection = mock_mongo.webhook_db.idempotency_keys
+    collection.insert_one.side_effect = DuplicateKeyError("duplicate")
+    collection.find_one_and_update.return_value = None
+    collection.find_one.return_value = {"_id": "abc:key:1", "status": IDEMPOTENCY_IN_PROGRESS}
+
+    result, status_code = service.run("abc:key:1", MagicMock())
+
+    assert status_code == RESPONSE_CODE_CONFLICT
+
+def test_expired_in_progress_claim_is_taken_over(service, mock_mongo):
+    collection = mock_mongo.webhook_db.idempotency_keys
+    collection.insert_one.side_effect = DuplicateKeyError("duplicate")
+    collection.find_one_and_update.return_value = {"_id": "abc:key:1", "status": IDEMPOTENCY_IN_PROGRESS}
+    handler = MagicMock(return_value=({"ok": True}, 200))
+
+    assert service.run("abc:key:1", handler) == ({"ok": True}, 200)
+
+    handler.assert_called_once()
+    filter = collection.find_one_and_update.call_args.args[0]
+    assert filter["status"] == IDEMPOTENCY_IN_PROGRESS and "$lte" in filter["lease_expires_at"]
+    assert collection.update_one.call_args.args[1]["$set"]["status"] == IDEMPOTENCY_COMPLETED
+
+def test_failed_request_releases_key(service, mock_mongo):
+    handler = MagicMock(side_effect=RuntimeError("boom"))
+
+    with pytest.raises(RuntimeError):
+        service.run("abc:key:1", handler)
+
+    mock_mongo.webhook_db.idempotency_keys.delete_one.assert_called_once_with({"_id": "abc:key:1", "status": IDEMPOTENCY_IN_PROGRESS})
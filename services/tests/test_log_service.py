@@ -0,0 +1,187 @@
+import gzip
+from collections import defaultdict
+import pytest
+from unittest.mock import MagicMock, patch
+from bson import json_util
+from bson.objectid import ObjectId
+from pymongo.errors import OperationFailure
+from exceptions import DatabaseError, ValidationError
+from services.log_partition_service import LogPartitions
+from services.log_service import LogService
+from services.pagination import encode_cursor
+from services.payload_store_service import PayloadStore, compress
+
+@pytest.fixture
+def mock_mongo():
+    return MagicMock()
+
+@pytest.fixture
+def service(mock_mongo):
+    service = LogService()
+    service.mongo = mock_mongo
+    return service
+
+def test_find_logs_builds_indexed_query(service, mock_mongo):
+    service.find_logs("abc", since="2023-06-01T00:00:00Z", until="2023-06-02T00:00:00Z",
+                      endpoint_id="1", response_code=500, fields=["status"], limit=10)
+
+    collection = mock_mongo.webhook_db.logs
+    query, projection = collection.find.call_args.args
+    assert query == {
+        "webhook_id": "abc",
+        "timestamp": {"$gte": "2023-06-01T00:00:00Z", "$lt": "2023-06-02T00:00:00Z"},
+        "endpoint_id": "1",
+        "response_code": 500
+    }
+    assert projection == {"status": 1, "timestamp": 1}
+    collection.find.return_value.sort.assert_called_once_with([("timestamp", 1), ("_id", 1)])
+    assert collection.create_index.called
+
+def test_find_logs_resumes_after_cursor(service, mock_mongo):
+    log_id = ObjectId()
+    service.find_logs("abc", after=encode_cursor("2023-06-01T12:00:00Z", log_id))
+
+    query = mock_mongo.webhook_db.logs.find.call_args.args[0]
+    assert query["$and"][0] == {"webhook_id": "abc"}
+    assert query["$and"][1]["$or"] == [
+        {"timestamp": {"$gt": "2023-06-01T12:00:00Z"}},
+        {"timestamp": "2023-06-01T12:00:00Z", "_id": {"$gt": log_id}}
+    ]
+
+def test_find_delivered_matches_later_successes_per_endpoint(service, mock_mongo):
+    failed = [{"endpoint_id": "1", "event_ref": "a", "timestamp": "2023-06-01T12:00:00Z"},
+              {"endpoint_id": "2", "event_ref": "a", "timestamp": "2023-06-01T12:00:00Z"},
+              {"endpoint_id": "1", "event_ref": "b", "timestamp": "2023-06-01T13:00:00Z"}]
+    cursor = mock_mongo.webhook_db.logs.find.return_value.sort.return_value.batch_size.return_value
+    cursor.__iter__.return_value = iter([
+        {"endpoint_id": "1", "event_ref": "a", "timestamp": "2023-06-01T12:05:00Z"},
+        {"endpoint_id": "1", "event_ref": "b", "timestamp": "2023-06-01T12:30:00Z"},
+    ])
+
+    assert service.find_delivered("abc", failed) == {("1", "a")}
+    query = mock_mongo.webhook_db.logs.find.call_args.args[0]
+    assert query["timestamp"] == {"$gt": "2023-06-01T12:00:00Z"}
+    assert query["response_code"] == 200 and sorted(query["event_ref"]["$in"]) == ["a", "b"]
+
+def test_find_logs_rejects_invalid_cursor(service):
+    with pytest.raises(ValidationError):
+        service.find_logs("abc", after="not-a-cursor")
+
+def test_create_log_stores_payload_once(service, mock_mongo):
+    service.log_writer = None
+    service.payload_store = PayloadStore()
+    service.payload_store.mongo = mock_mongo
+
+    service.create_log(None, None, "Event 1 recieved successfully", 200, {"b": 1, "a": 2})
+    service.create_log(None, None, "Event 1 recieved successfully", 200, {"a": 2, "b": 1})
+
+    logs = [call.args[0] for call in mock_mongo.webhook_db.logs.insert_one.call_args_list]
+    assert logs[0]["response_body"] is None
+    assert logs[0]["payload_ref"] == logs[1]["payload_ref"]
+    assert mock_mongo.webhook_db.payloads.bulk_write.call_count == 1
+    assert len(mock_mongo.webhook_db.payloads.bulk_write.call_args.args[0]) == 1
+    assert "referenced_at" in mock_mongo.webhook_db.payloads.bulk_write.call_args.args[0][0]._doc["$set"]
+
+def test_payload_ttl_follows_log_retention(mock_mongo, partitions):
+    partitions.interval = 3600
+    mock_mongo.webhook_db.payloads.create_index.side_effect = OperationFailure("IndexOptionsConflict")
+    with patch("services.log_partition_service.time.sleep", side_effect=StopIteration):
+        with pytest.raises(StopIteration):
+            partitions._run()
+
+    expire_after = (7 + 1) * 86400 + 3600 + 86400
+    assert mock_mongo.webhook_db.payloads.create_index.call_args.kwargs == {"expireAfterSeconds": expire_after}
+    assert mock_mongo.webhook_db.command.call_args.kwargs["index"]["expireAfterSeconds"] == expire_after
+
+def test_create_log_failure_outside_app_context_raises_database_error(service, mock_mongo):
+    service.log_writer = None
+    mock_mongo.webhook_db.logs.insert_one.side_effect = RuntimeError("connection refused")
+
+    with pytest.raises(DatabaseError):
+        service.create_log("abc", None, None, 500, "Error receiving webhook")
+
+def test_create_log_keeps_messages_inline(service, mock_mongo):
+    service.log_writer = None
+
+    log, _ = service.create_log("abc", None, None, 500, "Error receiving webhook")
+
+    assert log["response_body"] == "Error receiving webhook"
+    assert "payload_ref" not in log
+
+def test_load_bodies_decompresses_referenced_payloads(service, mock_mongo):
+    store = service.payload_store = PayloadStore()
+    store.mongo = mock_mongo
+    digest = store.reference({"key": "value"})
+    body = store._pending[digest]
+    mock_mongo.webhook_db.payloads.find.return_value = [{"_id": digest, "codec": "zlib", "data": compress(body, "zlib")}]
+    logs = [{"payload_ref": digest, "response_body": None}, {"response_body": "Forwarded successfully"}]
+
+    service.load_bodies(logs)
+
+    assert logs == [{"response_body": {"key": "value"}}, {"response_body": "Forwarded successfully"}]
+    assert mock_mongo.webhook_db.payloads.find.call_count == 1
+
+def test_find_logs_projects_payload_ref_with_response_body(service, mock_mongo):
+    service.find_logs("abc", fields=["response_body"])
+
+    projection = mock_mongo.webhook_db.logs.find.call_args.args[1]
+    assert projection == {"response_body": 1, "timestamp": 1, "payload_ref": 1}
+
+def test_batch_writes_collected_logs_together(service, mock_mongo):
+    service.log_writer = None
+
+    with service.batch():
+        service.create_log("abc", "1", "success", 200, "Forwarded successfully")
+        service.create_log("abc", "2", "success", 200, "Forwarded successfully")
+        mock_mongo.webhook_db.logs.insert_one.assert_not_called()
+
+    logs = mock_mongo.webhook_db.logs.insert_many.call_args.args[0]
+    assert [log["endpoint_id"] for log in logs] == ["1", "2"]
+
+@pytest.fixture
+def partitions(mock_mongo):
+    partitions = LogPartitions(retention_days=7, archive_dir="")
+    partitions.mongo = mock_mongo
+    partitions.payload_store = PayloadStore()
+    partitions.payload_store.mongo = mock_mongo
+    collections = defaultdict(MagicMock)
+    mock_mongo.webhook_db.__getitem__.side_effect = collections.__getitem__
+    return partitions
+
+def test_partitioned_logs_are_written_by_day(service, mock_mongo, partitions):
+    service.partitions = partitions
+
+    service.insert_logs([
+        {"webhook_id": "abc", "timestamp": "2024-06-25T23:59:59Z"},
+        {"webhook_id": "abc", "timestamp": "2024-06-26T00:00:01Z"},
+        {"webhook_id": "abc", "timestamp": "2024-06-26T00:00:02Z"},
+    ])
+
+    assert len(mock_mongo.webhook_db["logs_20240625"].insert_many.call_args.args[0]) == 1
+    assert len(mock_mongo.webhook_db["logs_20240626"].insert_many.call_args.args[0]) == 2
+    assert mock_mongo.webhook_db["logs_20240626"].create_index.call_count == 2
+
+def test_partitioned_find_reads_only_days_in_range(service, mock_mongo, partitions):
+    service.partitions = partitions
+    mock_mongo.webhook_db.list_collection_names.return_value = ["logs_20240624", "logs_20240625", "logs_20240626"]
+    mock_mongo.webhook_db["logs_20240625"].find.return_value.sort.return_value.batch_size.return_value.limit.return_value = [{"_id": 1}]
+    mock_mongo.webhook_db["logs_20240626"].find.return_value.sort.return_value.batch_size.return_value.limit.return_value = [{"_id": 2}, {"_id": 3}]
+
+    logs = list(service.find_logs("abc", since="2024-06-25T12:00:00Z", until="2024-06-26T12:00:00Z", limit=2))
+
+    assert logs == [{"_id": 1}, {"_id": 2}]
+    mock_mongo.webhook_db["logs_20240624"].find.assert_not_called()
+    assert mock_mongo.webhook_db["logs_20240626"].find.return_value.sort.return_value.batch_size.return_value.limit.call_args.args == (1,)
+
+def test_expired_partitions_are_archived_then_dropped(mock_mongo, partitions, tmp_path):
+    partitions.archive_dir = str(tmp_path)
+    mock_mongo.webhook_db.list_collection_names.return_value = ["logs", "logs_20000101"]
+    mock_mongo.webhook_db["logs_20000101"].find.return_value.sort.return_value.batch_size.return_value = iter([
+        {"_id": ObjectId(), "webhook_id": "abc", "response_body": "Forwarded successfully", "timestamp": "2000-01-01T00:00:00Z"}
+    ])
+
+    partitions.enforce_retention()
+
+    mock_mongo.webhook_db.drop_collection.assert_called_once_with("logs_20000101")
+    with gzip.open(tmp_path / "logs_20000101.ndjson.gz", "rt") as archive:
+        assert json_util.loads(archive.readline())["response_body"] == "Forwarded successfully"
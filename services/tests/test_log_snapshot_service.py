@@ -0,0 +1,105 @@
+import pytest
+from unittest.mock import MagicMock
+from bson.objectid import ObjectId
+
+np = pytest.importorskip("numpy")
+
+from services import log_snapshot_service
+from services.log_snapshot_service import LogSnapshot
+
+def delivery_log(webhook_id, endpoint_id, timestamp, response_code=200, latency_ms=None):
+    log = {"_id": ObjectId(), "webhook_id": webhook_id, "endpoint_id": endpoint_id,
+           "response_code": response_code, "timestamp": timestamp}
+    if latency_ms is not None:
+        log["latency_ms"] = latency_ms
+    return log
+
+@pytest.fixture
+def snapshot(tmp_path):
+    snapshot = LogSnapshot(directory=str(tmp_path), lag_seconds=0)
+    snapshot.mongo = MagicMock()
+    return snapshot
+
+def stub_logs(snapshot, logs):
+    cursor = snapshot.mongo.webhook_db.logs.find.return_value.sort.return_value.batch_size.return_value
+    cursor.__iter__.return_value = iter(logs)
+
+def test_export_appends_segments_and_advances_watermark(snapshot):
+    first = [delivery_log("w1", "e1", "2024-06-25T12:00:00.000000Z", latency_ms=10.0),
+             delivery_log("w1", "e2", "2024-06-25T12:00:01.000000Z", response_code=500)]
+    stub_logs(snapshot, first)
+    assert snapshot.export() == 2
+
+    second = [delivery_log("w2", "e3", "2024-06-25T13:00:00.000000Z", latency_ms=5.0)]
+    stub_logs(snapshot, second)
+    assert snapshot.export() == 1
+    stub_logs(snapshot, [])
+    assert snapshot.export() == 0
+
+    manifest = snapshot.read_manifest()
+    assert manifest["segments"] == ["segment-00000000", "segment-00000001"]
+    assert manifest["watermark"] == ["2024-06-25T13:00:00.000000Z", str(second[0]["_id"])]
+    query = snapshot.mongo.webhook_db.logs.find.call_args.args[0]
+    assert query["$and"][1]["$or"][0] == {"timestamp": {"$gt": "2024-06-25T13:00:00.000000Z"}}
+    segment = snapshot.segments()[0]
+    assert segment.webhook_ids == ["w1"] and segment.endpoint_ids == ["e1", "e2"]
+    assert segment.columns["response_code"].tolist() == [200, 500]
+    assert np.isnan(segment.columns["latency_ms"][1])
+    snapshot.mongo.webhook_db.logs.create_index.assert_called_once()
+
+def test_export_needs_a_file_lock(snapshot, monkeypatch):
+    assert snapshot.can_export
+    monkeypatch.setattr(log_snapshot_service, "fcntl", None)
+    monkeypatch.setattr(log_snapshot_service, "msvcrt", None)
+    assert snapshot.available and not snapshot.can_export
+
+def test_aggregate_per_endpoint_matches_numpy_percentiles(snapshot):
+    latencies = [float(value) for value in range(1, 101)]
+    logs = [delivery_log("w1", "e1", f"2024-06-25T12:00:{i % 60:02d}.000000Z", latency_ms=latency)
+            for i, latency in enumerate(latencies)]
+    logs.sort(key=lambda log: log["timestamp"])
+    logs += [delivery_log("w1", "e2", "2024-06-25T12:01:00.000000Z", response_code=500, latency_ms=30.0),
+             delivery_log("w1", "e2", "2024-06-25T12:01:01.000000Z", response_code=429)]
+    stub_logs(snapshot, logs)
+    snapshot.export()
+
+    groups = {group["endpoint_id"]: group for group in snapshot.aggregate()}
+
+    assert groups["e1"]["deliveries"] == 100 and groups["e1"]["success_rate"] == 1.0
+    assert groups["e1"]["latency_ms"]["p95"] == round(float(np.percentile(latencies, 95)), 2)
+    assert groups["e1"]["latency_ms"]["avg"] == 50.5
+    assert (groups["e2"]["successful"], groups["e2"]["failed"], groups["e2"]["deferred"]) == (0, 1, 1)
+    assert groups["e2"]["latency_ms"]["p50"] == 30.0
+
+def test_aggregate_filters_window_and_groups_by_webhook_and_interval(snapshot):
+    stub_logs(snapshot, [
+        delivery_log("w1", "e1", "2024-06-25T11:59:00.000000Z", latency_ms=1.0),
+        delivery_log("w1", "e1", "2024-06-25T12:00:00.000000Z", latency_ms=2.0),
+        delivery_log("w1", "e2", "2024-06-25T13:30:00.000000Z", latency_ms=4.0),
+        delivery_log("w2", "e3", "2024-06-25T13:31:00.000000Z", latency_ms=8.0),
+    ])
+    snapshot.export()
+    since = np.datetime64("2024-06-25T12:00:00", "ms").astype(np.int64)
+
+    groups = snapshot.aggregate("webhook", "hour", webhook_id="w1", since=since)
+
+    assert [(group["webhook_id"], group["bucket"], group["deliveries"]) for group in groups] == [
+        ("w1", "2024-06-25T12:00:00.000Z", 1), ("w1", "2024-06-25T13:00:00.000Z", 1)]
+    assert snapshot.aggregate(webhook_id="unknown") == []
+
+def test_export_skips_admin_logs_with_an_endpoint_id(snapshot):
+    mongomock = pytest.importorskip("mongomock")
+    snapshot.mongo = mongomock.MongoClient()
+    forwarded = dict(delivery_log("w1", "e1", "2024-06-25T12:00:00.000000Z", latency_ms=10.0), delivery=True)
+    deferred = dict(delivery_log("w1", "e1", "2024-06-25T12:00:01.000000Z", response_code=429), delivery=True)
+    legacy = delivery_log("w1", "e1", "2024-06-25T12:00:02.000000Z", response_code=500, latency_ms=20.0)
+    snapshot.mongo.webhook_db.logs.insert_many([
+        forwarded, deferred, legacy,
+        delivery_log("w1", "e1", "2024-06-25T12:00:03.000000Z"),  # endpoint deleted
+        delivery_log("w1", "e1", "2024-06-25T12:00:04.000000Z", response_code=202),  # replay created
+        delivery_log("w1", "e1", "2024-06-25T12:00:05.000000Z", response_code=500),  # moved to dead letters
+    ])
+
+    assert snapshot.export() == 3
+    group = snapshot.aggregate()[0]
+    assert (group["deliveries"], group["successful"], group["failed"], group["deferred"]) == (3, 1, 1, 1)
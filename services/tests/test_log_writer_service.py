@@ -0,0 +1,56 @@
+import time
+from unittest.mock import MagicMock
+from services.log_writer_service import LogWriter
+
+def test_writes_full_batches_with_one_call():
+    write_batch = MagicMock()
+    writer = LogWriter(write_batch, batch_size=3, flush_interval=10, queue_size=10)
+
+    for i in range(6):
+        writer.write({"n": i})
+    writer.flush()
+
+    assert [len(call.args[0]) for call in write_batch.call_args_list] == [3, 3]
+    assert writer.stats()["written"] == 6
+    writer.close()
+
+def test_partial_batch_is_flushed_after_interval():
+    write_batch = MagicMock()
+    writer = LogWriter(write_batch, batch_size=100, flush_interval=0.05, queue_size=10)
+
+    writer.write({"n": 1})
+    time.sleep(0.2)
+
+    write_batch.assert_called_once_with([{"n": 1}])
+    writer.close()
+
+def test_close_flushes_pending_logs():
+    write_batch = MagicMock()
+    writer = LogWriter(write_batch, batch_size=100, flush_interval=10, queue_size=10)
+
+    writer.write({"n": 1})
+    writer.write({"n": 2})
+    writer.close()
+
+    write_batch.assert_called_once_with([{"n": 1}, {"n": 2}])
+
+def test_drop_policy_counts_logs_when_queue_is_full():
+    write_batch = MagicMock(side_effect=lambda batch: time.sleep(0.2))
+    writer = LogWriter(write_batch, batch_size=1, flush_interval=10, queue_size=1, full_policy="drop")
+
+    results = [writer.write({"n": i}) for i in range(5)]
+
+    assert not all(results)
+    assert writer.stats()["dropped"] == results.count(False)
+    writer.close()
+
+def test_failed_batches_are_counted():
+    writer = LogWriter(MagicMock(side_effect=Exception("MongoDB connection error")), batch_size=2,
+                       flush_interval=10, queue_size=10)
+
+    writer.write({"n": 1})
+    writer.write({"n": 2})
+    writer.flush()
+
+    assert writer.stats()["failed"] == 2
+    writer.close()
@@ -0,0 +1,81 @@
+import datetime
+import pytest
+from unittest.mock import MagicMock
+from services.metrics_service import LatencyHistogram, StatusMetrics, TOTALS_ID
+
+@pytest.fixture
+def mock_mongo():
+    return MagicMock()
+
+@pytest.fixture
+def metrics(mock_mongo):
+    metrics = StatusMetrics(flush_interval=3600)
+    metrics.mongo = mock_mongo
+    metrics.start = MagicMock()
+    return metrics
+
+def test_histogram_percentiles_interpolate_within_buckets():
+    histogram = LatencyHistogram()
+    for latency_ms in [3] * 50 + [40] * 45 + [700] * 5:
+        histogram.observe(latency_ms)
+
+    assert 2 <= histogram.percentile(0.5) <= 5
+    assert 25 <= histogram.percentile(0.95) <= 50
+    assert 500 <= histogram.percentile(0.99) <= 1000
+    assert LatencyHistogram().percentile(0.5) is None
+
+def test_snapshot_combines_persisted_totals_and_unflushed_counts(metrics, mock_mongo):
+    mock_mongo.webhook_db.status_rollups.find_one.return_value = {
+        "_id": TOTALS_ID, "requests": 10, "successful": 9, "failed": 1, "latency_sum_ms": 1000.0,
+        "latency_buckets": {"6": 10}
+    }
+    metrics.record(True, 50)
+    metrics.record(False, 150)
+
+    status = metrics.snapshot()
+
+    mock_mongo.webhook_db.status_rollups.find_one.assert_called_once_with({"_id": TOTALS_ID})
+    assert status["total_requests"] == 12
+    assert status["successful_requests"] == 10
+    assert status["failed_requests"] == 2
+    assert status["average_latency_ms"] == 100.0
+    assert status["latency_ms"]["p50"] is not None
+    assert status["uptime_seconds"] >= 0
+
+def test_flush_increments_totals_and_rollups(metrics, mock_mongo):
+    metrics.record(True, 50)
+    metrics.record(False, 150)
+
+    metrics.flush()
+
+    updates = {call.args[0]["_id"]: call.args[1] for call in mock_mongo.webhook_db.status_rollups.update_one.call_args_list}
+    assert updates[TOTALS_ID]["$inc"]["requests"] == 2
+    assert updates[TOTALS_ID]["$inc"]["failed"] == 1
+    granularities = sorted(update["$set"]["granularity"] for key, update in updates.items() if key != TOTALS_ID)
+    assert granularities == ["hour", "minute"]
+
+def test_flush_sets_bucket_expiry_per_granularity(metrics, mock_mongo):
+    metrics.retention = {"minute": 60, "hour": 3600}
+    metrics.record(True, 50)
+
+    metrics.flush()
+
+    for call in mock_mongo.webhook_db.status_rollups.update_one.call_args_list:
+        if call.args[0]["_id"] == TOTALS_ID:
+            assert "$set" not in call.args[1]
+            continue
+        fields = call.args[1]["$set"]
+        bucket = datetime.datetime.fromisoformat(fields["bucket"].rstrip("Z"))
+        assert fields["expires_at"] - bucket == datetime.timedelta(seconds=metrics.retention[fields["granularity"]])
+
+def test_failed_flush_keeps_counts_for_next_flush(metrics, mock_mongo):
+    mock_mongo.webhook_db.status_rollups.update_one.side_effect = Exception("MongoDB connection error")
+    metrics.record(True, 50)
+
+    metrics.flush()
+    mock_mongo.webhook_db.status_rollups.update_one.side_effect = None
+    mock_mongo.webhook_db.status_rollups.update_one.reset_mock()
+    metrics.flush()
+
+    updates = {call.args[0]["_id"]: call.args[1] for call in mock_mongo.webhook_db.status_rollups.update_one.call_args_list}
+    assert updates[TOTALS_ID]["$inc"]["requests"] == 1
@@ -0,0 +1,113 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from bson.objectid import ObjectId
+from services.outbox_service import OutboxService
+from services.payload import to_payload
+from constants import OUTBOX_PENDING, OUTBOX_DELIVERING, OUTBOX_DELIVERED, OUTBOX_FAILED, OUTBOX_RETRYING
+
+@pytest.fixture
+def mock_mongo():
+    return MagicMock()
+
+def test_enqueue_persists_payload_and_targets(mock_mongo):
+    service = OutboxService()
+    service.mongo = mock_mongo
+    mock_mongo.webhook_db.outbox.insert_one.return_value = MagicMock(inserted_id=ObjectId())
+
+    webhook = {"webhook_url": "http://example.com", "endpoints": [{"endpoint_id": "1", "url": "http://example1.com"}]}
+    event_id = service.enqueue("abc", webhook, {"key": "value"})
+
+    event = mock_mongo.webhook_db.outbox.insert_one.call_args.args[0]
+    assert ObjectId.is_valid(event_id)
+    assert event["status"] == OUTBOX_PENDING
+    assert to_payload(event["payload"]).data == {"key": "value"}
+    assert event["webhook_url"] == "http://example.com"
+    assert event["endpoints"] == webhook["endpoints"]
+
+def test_claim_reclaims_expired_leases(mock_mongo):
+    service = OutboxService()
+    service.mongo = mock_mongo
+
+    service.claim()
+
+    query, update = mock_mongo.webhook_db.outbox.find_one_and_update.call_args.args
+    assert {"status": OUTBOX_PENDING} in query["$or"]
+    assert any(clause.get("status") == OUTBOX_DELIVERING and "lease_expires_at" in clause for clause in query["$or"])
+    assert update["$set"]["status"] == OUTBOX_DELIVERING
+
+def test_workers_deliver_and_complete_events(mock_mongo):
+    service = OutboxService(workers=1, poll_interval=0.01)
+    service.mongo = mock_mongo
+    events = [{"_id": 1, "owner": "a"}, {"_id": 2, "owner": "b"}]
+    mock_mongo.webhook_db.outbox.find_one_and_update.side_effect = lambda *a, **k: events.pop(0) if events else None
+    deliver = MagicMock(side_effect=[None, Exception("endpoint down")])
+
+    service.start_workers(MagicMock(), deliver)
+    time.sleep(0.2)
+    service.stop_workers()
+
+    assert deliver.call_count == 2
+    updates = {call.args[0]["_id"]: call.args[1]["$set"] for call in mock_mongo.webhook_db.outbox.update_one.call_args_list}
+    assert updates[1]["status"] == OUTBOX_DELIVERED
+    assert updates[2]["status"] == OUTBOX_FAILED
+    assert updates[2]["error"] == "endpoint down"
+    assert all(call.args[0]["owner"] for call in mock_mongo.webhook_db.outbox.update_one.call_args_list)
+
+def test_workers_leave_retrying_events_to_the_retry_scheduler(mock_mongo):
+    service = OutboxService(workers=1, poll_interval=0.01)
+    service.mongo = mock_mongo
+    events = [{"_id": 1, "owner": "a"}]
+    mock_mongo.webhook_db.outbox.find_one_and_update.side_effect = lambda *a, **k: events.pop(0) if events else None
+    deliver = MagicMock(return_value=OUTBOX_RETRYING)
+
+    service.start_workers(MagicMock(), deliver)
+    time.sleep(0.1)
+    service.stop_workers()
+
+    deliver.assert_called_once()
+    mock_mongo.webhook_db.outbox.update_one.assert_not_called()
+
+def test_settle_only_updates_retrying_events(mock_mongo):
+    service = OutboxService()
+    service.mongo = mock_mongo
+
+    service.settle(1, "503")
+
+    query, update = mock_mongo.webhook_db.outbox.update_one.call_args.args
+    assert query == {"_id": 1, "status": OUTBOX_RETRYING}
+    assert update["$set"]["status"] == OUTBOX_FAILED
+    assert update["$set"]["error"] == "503"
+
+def test_ensure_indexes_expires_finished_events(mock_mongo):
+    service = OutboxService(retention_seconds=3600)
+    service.mongo = mock_mongo
+
+    service.ensure_indexes()
+
+    mock_mongo.webhook_db.outbox.create_index.assert_any_call("delivered_at", expireAfterSeconds=3600)
+
+def test_claim_takes_ownership_of_the_event(mock_mongo):
+    service = OutboxService()
+    service.mongo = mock_mongo
+
+    service.claim()
+
+    update = mock_mongo.webhook_db.outbox.find_one_and_update.call_args.args[1]
+    assert ObjectId.is_valid(update["$set"]["owner"])
+
+def test_heartbeat_renews_leases_of_events_in_delivery(mock_mongo):
+    service = OutboxService(workers=1, lease_seconds=0.15, poll_interval=0.01)
+    service.mongo = mock_mongo
+    events = [{"_id": 1, "owner": "a"}]
+    mock_mongo.webhook_db.outbox.find_one_and_update.side_effect = lambda *a, **k: events.pop(0) if events else None
+    deliver = MagicMock(side_effect=lambda event: time.sleep(0.3))
+
+    service.start_workers(MagicMock(), deliver)
+    time.sleep(0.4)
+    service.stop_workers()
+
+    renewals = [call for call in mock_mongo.webhook_db.outbox.update_one.call_args_list if "lease_expires_at" in call.args[1]["$set"]
+                and call.args[1]["$set"]["lease_expires_at"] is not None]
+    assert renewals
+    assert renewals[0].args[0] == {"_id": 1, "status": OUTBOX_DELIVERING, "owner": "a"}
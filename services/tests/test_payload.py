@@ -0,0 +1,51 @@
+import pytest
+from services import payload as payload_module
+from exceptions import ValidationError
+from services.payload import Payload, read_batch, read_payload, to_payload
+
+def test_read_payload_keeps_original_bytes():
+    body = b'{"b": 1,  "a": [1, 2]}'
+
+    payload = read_payload(body, "application/json", validate=False)
+
+    assert payload.body == body
+    assert payload.data == {"b": 1, "a": [1, 2]}
+
+def test_read_payload_rejects_empty_and_non_json_bodies():
+    assert read_payload(b"", "application/json", validate=False) is None
+    assert read_payload(b" {} ", "application/json", validate=False) is None
+    assert read_payload(b'{"a": 1}', "text/plain", validate=False) is None
+
+def test_read_payload_validates_when_asked():
+    assert read_payload(b'{"a": ', "application/json", validate=True) is None
+    assert read_payload(b'{"a": 1}', "application/vnd.api+json", validate=True).data == {"a": 1}
+
+def test_read_payload_rejects_malformed_json_by_default():
+    assert read_payload(b'{"a": ', "application/json") is None
+    assert read_payload(b'{"a": 1}', "application/json").data == {"a": 1}
+
+def test_to_payload_accepts_stored_values():
+    assert to_payload(b'{"a": 1}').data == {"a": 1}
+    assert to_payload({"a": 1}).data == {"a": 1}
+    payload = Payload(b'{"a": 1}')
+    assert to_payload(payload) is payload
+
+@pytest.mark.parametrize("backend", [payload_module.orjson, None])
+def test_json_backends_round_trip(monkeypatch, backend):
+    monkeypatch.setattr(payload_module, "orjson", backend)
+
+    assert payload_module.loads(payload_module.dumps({"a": [1, "x"]})) == {"a": [1, "x"]}
+
+def test_read_batch_splits_ndjson_without_parsing():
+    payloads = read_batch(b'{"n": 1}\n\n{"n":  2}\n', "application/x-ndjson", validate=False)
+
+    assert [payload.body for payload in payloads] == [b'{"n": 1}', b'{"n":  2}']
+
+def test_read_batch_encodes_each_array_event_once():
+    payloads = read_batch(b'[{"n": 1}, {"n": 2}]', "application/json")
+
+    assert [payload.data for payload in payloads] == [{"n": 1}, {"n": 2}]
+
+def test_read_batch_rejects_non_array_json():
+    with pytest.raises(ValidationError):
+        read_batch(b'{"n": 1}', "application/json")
@@ -0,0 +1,60 @@
+import pytest
+from exceptions import ValidationError
+from services.delivery_service import DeliveryEngine
+from services.rate_limit_service import RateLimiter, parse_rate_limit
+
+ENDPOINT = {"endpoint_id": "1", "url": "http://example1.com/hook", "rate_limit": {"rate": 10, "burst": 2}}
+
+def test_burst_is_paced_not_dropped():
+    limiter = RateLimiter(max_wait=10)
+
+    waits = [limiter.throttle(ENDPOINT["url"], ENDPOINT, "abc").reserve() for _ in range(5)]
+
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2:] == pytest.approx([0.1, 0.2, 0.3], abs=0.01)
+    stats = limiter.stats("abc", [ENDPOINT])[0]["endpoint"]
+    assert stats["queued"] == 3 and stats["throttled"] == 3 and stats["deferred"] == 0
+
+def test_backlog_beyond_max_wait_is_deferred():
+    limiter = RateLimiter(max_wait=0.15)
+
+    waits = [limiter.throttle(ENDPOINT["url"], ENDPOINT, "abc").reserve() for _ in range(5)]
+
+    assert waits[3:] == [None, None]
+    assert limiter.stats("abc", [ENDPOINT])[0]["endpoint"]["deferred"] == 2
+
+def test_max_wait_override_defers_sooner():
+    limiter = RateLimiter(max_wait=10)
+
+    waits = [limiter.throttle(ENDPOINT["url"], ENDPOINT, "abc", max_wait=0.05).reserve() for _ in range(3)]
+    paced = limiter.throttle(ENDPOINT["url"], ENDPOINT, "abc").reserve()
+
+    assert waits[2] is None
+    assert paced is not None and paced > 0.05
+
+def test_host_limit_is_shared_across_endpoints():
+    limiter = RateLimiter(max_wait=10, host_rate=1, host_burst=1)
+    other = {"endpoint_id": "2", "url": "http://example1.com/other"}
+
+    assert limiter.throttle(ENDPOINT["url"], ENDPOINT, "abc").reserve() == 0.0
+    assert limiter.throttle(other["url"], other, "abc").reserve() == pytest.approx(1.0, abs=0.01)
+
+def test_unlimited_delivery_has_no_throttle():
+    assert RateLimiter().throttle("http://example.com") is None
+
+@pytest.mark.parametrize("spec", [{"rate": 0}, {"rate": "10"}, {"rate": 10, "period": 1}, [10]])
+def test_parse_rate_limit_rejects_invalid_specs(spec):
+    with pytest.raises(ValidationError):
+        parse_rate_limit(spec)
+
+def test_engine_defers_without_sending():
+    limiter = RateLimiter(max_wait=0)
+    limiter.throttle(ENDPOINT["url"], ENDPOINT, "abc").reserve()
+    limiter.throttle(ENDPOINT["url"], ENDPOINT, "abc").reserve()
+    engine = DeliveryEngine()
+    try:
+        result = engine.deliver_each([("http://127.0.0.1:1/unreachable", {"key": "value"}, limiter.throttle(ENDPOINT["url"], ENDPOINT, "abc"))])[0]
+    finally:
+        engine.close()
+
+    assert result.deferred and not result.ok
@@ -0,0 +1,137 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from bson.objectid import ObjectId
+from exceptions import ValidationError
+from services.pagination import decode_cursor
+from services.replay_service import ReplayService, to_replay_response
+
+def forward_log(endpoint_id, event_ref, response_code=500, timestamp="2024-06-25T12:00:00.000000Z"):
+    return {"_id": ObjectId(), "endpoint_id": endpoint_id, "event_ref": event_ref,
+            "response_code": response_code, "timestamp": timestamp}
+
+def make_replay(**fields):
+    replay = {"_id": ObjectId(), "owner": ObjectId(), "webhook_id": "w1", "endpoint_id": None,
+              "since": "2024-06-25T00:00:00Z", "until": "2024-06-26T00:00:00Z", "only_failed": True,
+              "rate": 1000.0, "concurrency": 2, "checkpoint": None}
+    replay.update(fields)
+    return replay
+
+@pytest.fixture
+def service():
+    service = ReplayService(MagicMock())
+    service.mongo = MagicMock()
+    return service
+
+def test_create_validates_and_caps_until(service):
+    with pytest.raises(ValidationError):
+        service.create("w1", {})
+    with pytest.raises(ValidationError):
+        service.create("w1", {"since": "2024-06-25T00:00:00Z", "rate": 0})
+    with pytest.raises(ValidationError):
+        service.create("w1", {"since": "2024-06-25T00:00:00Z", "concurrency": 1000})
+
+    replay = service.create("w1", {"since": "2024-06-25T00:00:00Z", "until": "9999-01-01T00:00:00Z", "rate": 5})
+
+    assert replay["status"] == "pending" and replay["rate"] == 5.0 and replay["only_failed"] is True
+    assert replay["until"] < "9999"
+    service.mongo.webhook_db.replays.insert_one.assert_called_once()
+
+def test_select_groups_replayable_logs_from_checkpoint(service):
+    logs = [forward_log("e1", "a"), forward_log("e1", "b", response_code=200),
+            forward_log(None, "c"), forward_log("e2", None), forward_log("e2", "d"), forward_log("e1", "e")]
+    service.log_service.find_logs.return_value = iter(logs)
+    replay = make_replay(checkpoint="cursor")
+
+    groups = list(service.select(replay))
+
+    assert [([log["event_ref"] for log in group], last["_id"], read) for group, last, read in groups] == [
+        (["a", "d"], logs[4]["_id"], 5), (["e"], logs[5]["_id"], 1)]
+    assert service.log_service.find_logs.call_args.kwargs["after"] == "cursor"
+    assert service.log_service.find_logs.call_args.kwargs["limit"] == 1000
+
+def test_run_dedupes_checkpoints_and_completes(service):
+    logs = [forward_log("e1", "a"), forward_log("e1", "a"), forward_log("e2", "a")]
+    service.log_service.find_logs.return_value = iter(logs)
+    service.log_service.payload_store.load_raw_many.return_value = {"a": b'{"key": "value"}'}
+    service.log_service.find_delivered.return_value = set()
+    service.mongo.webhook_db.replays.update_one.return_value.modified_count = 1
+    deliver = MagicMock(return_value={"delivered": 1, "failed": 0, "skipped": 0})
+    replay = make_replay()
+
+    service.run(replay, deliver)
+
+    assert [[log["endpoint_id"] for log in call.args[1]] for call in deliver.call_args_list] == [["e1"], ["e2"]]
+    checkpoint, finish = service.mongo.webhook_db.replays.update_one.call_args_list[1:]
+    filter, update = checkpoint.args
+    assert filter == {"_id": replay["_id"], "status": "running", "owner": replay["owner"]}
+    assert decode_cursor(update["$set"]["checkpoint"], 2) == [logs[2]["timestamp"], str(logs[2]["_id"])]
+    assert update["$inc"] == {"counts.read": 1, "counts.delivered": 1}
+    assert finish.args[1]["$set"]["status"] == "completed"
+
+def test_run_stops_when_checkpoint_is_refused(service):
+    service.log_service.find_logs.return_value = iter([forward_log("e1", "a"), forward_log("e2", "b"), forward_log("e3", "c")])
+    service.log_service.payload_store.load_raw_many.return_value = {}
+    service.log_service.find_delivered.return_value = set()
+    service.mongo.webhook_db.replays.update_one.return_value.modified_count = 0
+    deliver = MagicMock(return_value={"delivered": 0, "failed": 0, "skipped": 2})
+
+    service.run(make_replay(), deliver)
+
+    deliver.assert_called_once()
+    service.mongo.webhook_db.replays.update_one.assert_called_once()
+
+def test_transition_checks_allowed_statuses(service):
+    replay_id = str(ObjectId())
+    with pytest.raises(ValidationError):
+        service.transition(replay_id, "restart")
+    assert service.transition("not-an-id", "pause") is None
+
+    service.transition(replay_id, "resume")
+
+    filter, update = service.mongo.webhook_db.replays.find_one_and_update.call_args.args
+    assert filter == {"_id": ObjectId(replay_id), "status": {"$in": ["paused", "failed"]}}
+    assert update["$set"]["status"] == "pending"
+    assert update["$unset"] == {"error": ""}
+
+def test_to_replay_response_hides_lease():
+    replay = make_replay(status="running", lease_expires_at="later", counts={},
+                         created_at=MagicMock(isoformat=lambda: "2024-06-25T00:00:00"),
+                         updated_at=MagicMock(isoformat=lambda: "2024-06-25T00:00:01"))
+
+    response = to_replay_response(replay)
+
+    assert response["replay_id"] == str(replay["_id"])
+    assert "owner" not in response and "lease_expires_at" not in response and "_id" not in response
+    assert response["updated_at"] == "2024-06-25T00:00:01Z"
+
+def test_run_skips_failures_delivered_later(service):
+    logs = [forward_log("e1", "a"), forward_log("e2", "b")]
+    service.log_service.find_logs.return_value = iter(logs)
+    service.log_service.find_delivered.return_value = {("e1", "a")}
+    service.log_service.payload_store.load_raw_many.return_value = {"b": b"{}"}
+    service.mongo.webhook_db.replays.update_one.return_value.modified_count = 1
+    deliver = MagicMock(return_value={"delivered": 1, "failed": 0, "skipped": 0})
+
+    service.run(make_replay(), deliver)
+
+    assert [log["event_ref"] for log in deliver.call_args.args[1]] == ["b"]
+    update = service.mongo.webhook_db.replays.update_one.call_args_list[0].args[1]
+    assert update["$inc"] == {"counts.read": 2, "counts.delivered": 1, "counts.skipped": 1}
+
+def test_lease_is_renewed_while_delivering_and_lost_lease_stops_run(service):
+    service.lease_seconds = 0.03
+    service.log_service.find_logs.return_value = iter([forward_log("e1", "a"), forward_log("e2", "b"), forward_log("e3", "c")])
+    service.log_service.find_delivered.return_value = set()
+    service.log_service.payload_store.load_raw_many.return_value = {}
+    service.mongo.webhook_db.replays.update_one.return_value.modified_count = 0
+    deliver = MagicMock(side_effect=lambda *args: time.sleep(0.1) or {"delivered": 0, "failed": 0, "skipped": 2})
+
+    service.run(make_replay(rate=1.0), deliver)
+
+    deliver.assert_called_once()
+    renewals = [call for call in service.mongo.webhook_db.replays.update_one.call_args_list
+                if set(call.args[1]["$set"]) == {"lease_expires_at"}]
+    assert renewals
+    updates = [call.args[1]["$set"] for call in service.mongo.webhook_db.replays.update_one.call_args_list]
+    assert not any(update.get("status") == "completed" for update in updates)
@@ -0,0 +1,117 @@
+import datetime
+import time
+import pytest
+from unittest.mock import MagicMock
+from bson.objectid import ObjectId
+from services.delivery_service import DeliveryResult
+from services.retry_service import RetryService
+
+@pytest.fixture
+def mock_mongo():
+    return MagicMock()
+
+@pytest.fixture
+def service(mock_mongo):
+    service = RetryService(max_attempts=3, base_delay=1, max_delay=8)
+    service.mongo = mock_mongo
+    service.log_service = MagicMock()
+    return service
+
+ENDPOINT = {"endpoint_id": "1", "url": "http://example1.com"}
+
+def test_next_delay_grows_exponentially_with_jitter(service):
+    for attempts, delay in [(1, 1), (2, 2), (3, 4), (4, 8), (10, 8)]:
+        for _ in range(20):
+            assert delay / 2 <= service.next_delay(attempts) <= delay
+
+def test_schedule_persists_retry_with_due_time(service, mock_mongo):
+    mock_mongo.webhook_db.retries.insert_one.return_value = MagicMock(inserted_id=ObjectId())
+
+    before = datetime.datetime.utcnow()
+    retry = service.schedule("abc", ENDPOINT, {"key": "value"}, "timeout")
+
+    assert retry["attempts"] == 1
+    assert retry["status"] == "scheduled"
+    assert retry["due_at"] >= before + datetime.timedelta(seconds=0.5)
+    assert mock_mongo.webhook_db.retries.insert_one.called
+    assert not mock_mongo.webhook_db.dead_letters.insert_one.called
+
+def test_reschedule_moves_exhausted_retry_to_dead_letters(service, mock_mongo):
+    retry = {"_id": ObjectId(), "webhook_id": "abc", "endpoint_id": "1", "url": ENDPOINT["url"],
+             "payload": {"key": "value"}, "attempts": 2, "status": "in_flight"}
+
+    service.reschedule(retry, "503")
+
+    mock_mongo.webhook_db.retries.delete_one.assert_called_once_with({"_id": retry["_id"]})
+    dead_letter = mock_mongo.webhook_db.dead_letters.insert_one.call_args.args[0]
+    assert dead_letter["attempts"] == 3
+    assert dead_letter["last_error"] == "503"
+    assert "status" not in dead_letter
+    assert service.log_service.create_log.called
+
+def test_scheduler_delivers_due_retries(service, mock_mongo):
+    service.poll_interval = 0.05
+    due = {"_id": ObjectId(), "due_at": datetime.datetime.utcnow()}
+    claimed = {"_id": due["_id"], "webhook_id": "abc", "endpoint_id": "1", "url": ENDPOINT["url"],
+               "payload": {"key": "value"}, "attempts": 1}
+    mock_mongo.webhook_db.retries.find.side_effect = [[due]] + [[]] * 100
+    mock_mongo.webhook_db.retries.find_one_and_update.return_value = claimed
+    deliver = MagicMock(return_value=[DeliveryResult(ENDPOINT["url"], 200)])
+
+    service.start(MagicMock(), deliver)
+    time.sleep(0.2)
+    service.stop()
+
+    deliver.assert_called_once_with([claimed])
+    mock_mongo.webhook_db.retries.delete_one.assert_called_once_with({"_id": due["_id"]})
+
+def test_defer_backs_off_on_deferrals_until_circuit_half_opens(service, mock_mongo):
+    retry = {"_id": ObjectId(), "attempts": 0, "deferrals": 2, "last_error": "Circuit open"}
+
+    before = datetime.datetime.utcnow()
+    service.defer(retry, retry_after=30.0)
+
+    update = mock_mongo.webhook_db.retries.update_one.call_args.args[1]["$set"]
+    assert update["deferrals"] == 3
+    assert update["due_at"] >= before + datetime.timedelta(seconds=30)
+    service.defer(retry)
+    update = mock_mongo.webhook_db.retries.update_one.call_args.args[1]["$set"]
+    assert before + datetime.timedelta(seconds=2) <= update["due_at"] <= datetime.datetime.utcnow() + datetime.timedelta(seconds=4)
+
+def test_defer_moves_retry_to_dead_letters_after_max_deferrals(service, mock_mongo):
+    service.max_deferrals = 2
+    retry = {"_id": ObjectId(), "webhook_id": "abc", "endpoint_id": "1", "url": ENDPOINT["url"],
+             "payload": {"key": "value"}, "attempts": 0, "deferrals": 2, "last_error": "Circuit open"}
+
+    service.defer(retry, error="Rate limited")
+
+    mock_mongo.webhook_db.retries.delete_one.assert_called_once_with({"_id": retry["_id"]})
+    dead_letter = mock_mongo.webhook_db.dead_letters.insert_one.call_args.args[0]
+    assert dead_letter["last_error"] == "Deferred 2 times: Rate limited"
+    mock_mongo.webhook_db.retries.update_one.assert_not_called()
+
+def test_outbox_webhook_retry_settles_its_event(service, mock_mongo):
+    service.outbox_service = MagicMock()
+    retry = {"_id": ObjectId(), "webhook_id": "abc", "endpoint_id": None, "url": "http://example.com",
+             "payload": {"key": "value"}, "attempts": 2, "status": "in_flight", "outbox_event_id": "event-1"}
+
+    service.complete(retry)
+    service.outbox_service.settle.assert_called_once_with("event-1", None)
+
+    service.outbox_service.reset_mock()
+    service.reschedule(retry, "503")
+    service.outbox_service.settle.assert_called_once_with("event-1", "503")
+
+    service.outbox_service.reset_mock()
+    service.complete({"_id": ObjectId(), "endpoint_id": "1"})
+    service.outbox_service.settle.assert_not_called()
+
+def test_cancelled_retry_is_dropped_without_dead_letter(service, mock_mongo):
+    retry = {"_id": ObjectId(), "webhook_id": "abc", "endpoint_id": "1", "url": ENDPOINT["url"],
+             "payload": {"key": "value"}, "attempts": 1}
+
+    service._deliver([retry], MagicMock(return_value=[DeliveryResult(ENDPOINT["url"], error="Endpoint removed", cancelled=True)]))
+
+    mock_mongo.webhook_db.retries.delete_one.assert_called_once_with({"_id": retry["_id"]})
+    mock_mongo.webhook_db.dead_letters.insert_one.assert_not_called()
+    mock_mongo.webhook_db.retries.update_one.assert_not_called()
@@ -0,0 +1,47 @@
+import pytest
+from exceptions import ValidationError
+from services.payload import Payload
+from services.routing_service import RoutingIndex, compile_filter
+
+ENDPOINTS = [
+    {"endpoint_id": "all", "url": "http://all.example.com"},
+    {"endpoint_id": "paid", "url": "http://paid.example.com", "filter": {"event_types": ["order.paid"]}},
+    {"endpoint_id": "big", "url": "http://big.example.com",
+     "filter": {"event_types": ["order.paid", "order.refunded"], "match": {"data.amount": {"$gte": 100}, "data.currency": "EUR"}}},
+    {"endpoint_id": "flagged", "url": "http://flagged.example.com", "filter": {"match": {"data.flagged": {"$exists": True}}}},
+]
+
+def endpoint_ids(endpoints):
+    return [endpoint["endpoint_id"] for endpoint in endpoints]
+
+def test_routes_by_event_type_and_predicates():
+    index = RoutingIndex(ENDPOINTS)
+
+    assert endpoint_ids(index.route({"type": "order.paid", "data": {"amount": 150, "currency": "EUR"}})) == ["all", "paid", "big"]
+    assert endpoint_ids(index.route({"type": "order.paid", "data": {"amount": 50, "currency": "EUR"}})) == ["all", "paid"]
+    assert endpoint_ids(index.route({"type": "order.created", "data": {"flagged": False}})) == ["all", "flagged"]
+    assert endpoint_ids(index.route(Payload(b'{"type": "order.refunded", "data": {"amount": 100, "currency": "EUR"}}'))) == ["all", "big"]
+
+def test_unfiltered_webhook_does_not_parse_payload():
+    index = RoutingIndex([{"endpoint_id": "1", "url": "http://example1.com"}])
+
+    assert not index.needs_data
+    assert endpoint_ids(index.route(Payload(b"not json"))) == ["1"]
+
+def test_unparseable_payload_only_reaches_unfiltered_endpoints():
+    assert endpoint_ids(RoutingIndex(ENDPOINTS).route(Payload(b"not json"))) == ["all"]
+
+def test_mismatched_types_do_not_match():
+    index = RoutingIndex(ENDPOINTS)
+
+    assert endpoint_ids(index.route({"type": "order.paid", "data": {"amount": "lots", "currency": "EUR"}})) == ["all", "paid"]
+
+@pytest.mark.parametrize("spec", [
+    {"event_types": "order.paid"},
+    {"match": {"amount": {"$regex": "1"}}},
+    {"match": {"amount": {"$in": 1}}},
+    {"unknown": True},
+])
+def test_compile_filter_rejects_invalid_specs(spec):
+    with pytest.raises(ValidationError):
+        compile_filter(spec)
@@ -0,0 +1,46 @@
+import pytest
+from services.stage_metrics_service import StageMetrics
+
+def test_timer_records_duration_and_errors():
+    metrics = StageMetrics(enabled=True)
+
+    with metrics.time("webhook_lookup", "abc"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.time("webhook_lookup", "abc"):
+            raise RuntimeError("boom")
+
+    text = metrics.render()
+    assert 'webhook_stage_duration_seconds_count{stage="webhook_lookup",webhook_id="abc"} 2' in text
+    assert 'webhook_stage_errors_total{stage="webhook_lookup",webhook_id="abc"} 1' in text
+
+def test_histogram_buckets_are_cumulative():
+    metrics = StageMetrics(enabled=True)
+    metrics.observe("forward", 0.003, "abc", "example.com")
+    metrics.observe("forward", 0.2, "abc", "example.com")
+
+    text = metrics.render()
+    labels = 'stage="forward",webhook_id="abc",host="example.com"'
+    assert f'webhook_stage_duration_seconds_bucket{{{labels},le="0.005"}} 1' in text
+    assert f'webhook_stage_duration_seconds_bucket{{{labels},le="0.25"}} 2' in text
+    assert f'webhook_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+
+def test_series_beyond_limit_fold_into_other():
+    metrics = StageMetrics(enabled=True, max_series=2)
+    for webhook_id in ("a", "b", "c", "d"):
+        metrics.observe("forward", 0.01, webhook_id, "example.com")
+
+    text = metrics.render()
+    assert 'webhook_stage_duration_seconds_count{stage="forward",webhook_id="other",host="other"} 2' in text
+
+def test_webhook_label_can_be_dropped_and_values_escaped():
+    metrics = StageMetrics(enabled=True, webhook_label=False)
+    metrics.observe("forward", 0.01, "abc", 'we"ird')
+
+    assert 'webhook_stage_duration_seconds_count{stage="forward",host="we\\"ird"} 1' in metrics.render()
+
+def test_disabled_metrics_record_nothing():
+    metrics = StageMetrics(enabled=False)
+    metrics.observe("forward", 0.01)
+
+    assert "webhook_stage_duration_seconds_count" not in metrics.render()
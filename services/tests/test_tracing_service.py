@@ -0,0 +1,70 @@
+import pytest
+from services.stage_metrics_service import StageMetrics
+from services.tracing_service import Tracer
+
+def test_unsampled_request_records_nothing():
+    tracer = Tracer(sample_rate=0)
+
+    with tracer.trace("receive_webhook", "abc") as trace:
+        with tracer.span("parse") as span:
+            assert span is None
+        assert tracer.child_span("forward") is None
+
+    assert trace is None
+    assert tracer.find() == []
+
+def test_forced_trace_nests_spans():
+    tracer = Tracer(sample_rate=0)
+
+    with tracer.trace("receive_webhook", "abc", force=True) as trace:
+        with tracer.span("webhook_lookup"):
+            with tracer.span("inner", cached=True):
+                pass
+        forward = tracer.child_span("forward", url="http://example.com")
+        forward.mark("connect_end_ms")
+        forward.finish(status_code=200)
+
+    stored = tracer.get(trace.trace_id)
+    assert stored["webhook_id"] == "abc"
+    assert stored["forced"] is True
+    lookup, forward = stored["root"]["children"]
+    assert lookup["name"] == "webhook_lookup"
+    assert lookup["children"][0]["attributes"] == {"cached": True}
+    assert forward["attributes"]["status_code"] == 200
+    assert "connect_end_ms" in forward["attributes"]
+    assert forward["duration_ms"] is not None
+
+def test_span_records_error():
+    tracer = Tracer(sample_rate=1)
+
+    with pytest.raises(RuntimeError):
+        with tracer.trace("receive_webhook", "abc") as trace:
+            with tracer.span("parse"):
+                raise RuntimeError("boom")
+
+    root = tracer.get(trace.trace_id)["root"]
+    assert root["children"][0]["attributes"]["error"] == "RuntimeError: boom"
+    assert root["attributes"]["error"] == "RuntimeError: boom"
+
+def test_find_filters_newest_first_and_buffer_is_bounded():
+    tracer = Tracer(sample_rate=1, buffer_size=3)
+    ids = []
+    for webhook_id in ("a", "b", "a", "a"):
+        with tracer.trace("receive_webhook", webhook_id) as trace:
+            pass
+        ids.append(trace.trace_id)
+
+    assert [trace["trace_id"] for trace in tracer.find("a")] == [ids[3], ids[2]]
+    assert tracer.get(ids[0]) is None
+    assert tracer.find(limit=1)[0]["trace_id"] == ids[3]
+    assert tracer.find(min_duration_ms=60000) == []
+
+def test_stage_timer_opens_span():
+    metrics = StageMetrics(enabled=True)
+    metrics.tracer = Tracer(sample_rate=0)
+
+    with metrics.tracer.trace("receive_webhook", "abc", force=True) as trace:
+        with metrics.time("select_endpoints", "abc"):
+            pass
+
+    assert trace.to_dict()["root"]["children"][0]["name"] == "select_endpoints"
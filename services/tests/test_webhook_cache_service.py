@@ -0,0 +1,59 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from exceptions import NotFoundError
+from services.webhook_cache_service import WebhookCache
+
+def test_get_loads_once_and_counts_hits():
+    cache = WebhookCache(max_size=10, ttl_seconds=60)
+    loader = MagicMock(return_value={"webhook_url": "http://example.com", "endpoints": []})
+
+    first = cache.get("abc", loader)
+    second = cache.get("abc", loader)
+
+    assert first is second
+    loader.assert_called_once_with("abc")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_entries_expire_after_ttl():
+    cache = WebhookCache(max_size=10, ttl_seconds=0.05)
+    loader = MagicMock(return_value={})
+
+    cache.get("abc", loader)
+    time.sleep(0.1)
+    cache.get("abc", loader)
+
+    assert loader.call_count == 2
+
+def test_least_recently_used_entry_is_evicted():
+    cache = WebhookCache(max_size=2, ttl_seconds=60)
+    loader = MagicMock(side_effect=lambda webhook_id: {"id": webhook_id})
+
+    cache.get("a", loader)
+    cache.get("b", loader)
+    cache.get("a", loader)
+    cache.get("c", loader)
+    cache.get("a", loader)
+    cache.get("b", loader)
+
+    assert [call.args[0] for call in loader.call_args_list] == ["a", "b", "c", "b"]
+
+def test_invalidate_forces_reload():
+    cache = WebhookCache(max_size=10, ttl_seconds=60)
+    loader = MagicMock(return_value={})
+
+    cache.get("abc", loader)
+    cache.invalidate("abc")
+    cache.get("abc", loader)
+
+    assert loader.call_count == 2
+
+def test_missing_webhooks_are_not_cached():
+    cache = WebhookCache(max_size=10, ttl_seconds=60)
+    loader = MagicMock(side_effect=NotFoundError("Webhook not found"))
+
+    with pytest.raises(NotFoundError):
+        cache.get("abc", loader)
+
+    assert cache.stats()["size"] == 0
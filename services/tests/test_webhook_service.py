@@ -1,7 +1,9 @@
 import pytest
 from unittest.mock import MagicMock
 from bson.objectid import ObjectId
-from exceptions import NotFoundError
+from config import BATCH_MAX_EVENTS, ENDPOINT_BULK_MAX, RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS
+from exceptions import NotFoundError, ValidationError
+from services.delivery_service import DeliveryResult
 from services.webhook_service import WebhookService, DatabaseError, RESPONSE_CODE_SUCCESS
 
 @pytest.fixture
@@ -55,17 +57,23 @@ def test_add_endpoints_success(mock_log_service, mock_mongo):
     service.mongo = mock_mongo
 
     # Mocking MongoDB collection methods
+    webhook_id = ObjectId()
     mock_collection = MagicMock()
+    mock_collection.find_one.return_value = {"_id": webhook_id}
     mock_collection.update_one.return_value = None  # Mocking successful update
     mock_mongo.webhook_db.webhooks = mock_collection
 
-    webhook_id = ObjectId()
     data = {"endpoints": [{"url": "http://example1.com"}, {"url": "http://example2.com"}]}
     result, status_code = service.add_endpoints(str(webhook_id), data)
 
     assert status_code == RESPONSE_CODE_SUCCESS
     assert result['webhook_id'] == str(webhook_id)
     assert len(result['endpoints']) == len(data['endpoints'])
+    operations = mock_mongo.webhook_db.endpoints.bulk_write.call_args.args[0]
+    assert [operation._filter for operation in operations] == [
+        {"webhook_id": str(webhook_id), "url": "http://example1.com"},
+        {"webhook_id": str(webhook_id), "url": "http://example2.com"},
+    ]
     assert mock_log_service.create_log.called
 
 def test_add_endpoints_database_error(mock_log_service, mock_mongo):
@@ -74,11 +82,10 @@ def test_add_endpoints_database_error(mock_log_service, mock_mongo):
     service.mongo = mock_mongo
 
     # Mocking MongoDB collection methods
-    mock_collection = MagicMock()
-    mock_collection.update_one.side_effect = Exception("MongoDB connection error")
-    mock_mongo.webhook_db.webhooks = mock_collection
-
     webhook_id = ObjectId()
+    mock_mongo.webhook_db.webhooks.find_one.return_value = {"_id": webhook_id}
+    mock_mongo.webhook_db.endpoints.bulk_write.side_effect = Exception("MongoDB connection error")
+
     data = {"endpoints": [{"url": "http://example1.com"}, {"url": "http://example2.com"}]}
     with pytest.raises(DatabaseError):
         service.add_endpoints(str(webhook_id), data)
@@ -127,3 +134,407 @@ def test_delete_endpoint_not_found(mock_log_service, mock_mongo):
     # Additional check to verify the exception message or type, if needed
     assert isinstance(excinfo.value, NotFoundError)
     assert str(excinfo.value) == "Webhook not found"
+
+def test_receive_webhook_logs_each_endpoint(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.delivery_engine = MagicMock()
+    service.retry_service = MagicMock()
+    service.circuit_breaker = MagicMock()
+    service.status_metrics = MagicMock()
+
+    webhook_id = ObjectId()
+    mock_collection = MagicMock()
+    mock_collection.find_one.return_value = {
+        "_id": webhook_id,
+        "webhook_url": "http://example.com",
+        "endpoints": [
+            {"endpoint_id": "1", "url": "http://example1.com"},
+            {"endpoint_id": "2", "url": "http://example2.com"}
+        ]
+    }
+    mock_mongo.webhook_db.webhooks = mock_collection
+    service.delivery_engine.deliver_each.return_value = [
+        DeliveryResult("http://example1.com", 200), DeliveryResult("http://example2.com", error="timeout"), DeliveryResult("http://example.com", 200)
+    ]
+
+    data = {"data": {"key": "value"}}
+    result, status_code = service.receive_webhook(str(webhook_id), data)
+
+    assert status_code == RESPONSE_CODE_SUCCESS
+    assert result == data
+    deliveries = service.delivery_engine.deliver_each.call_args.args[0]
+    assert [delivery[0] for delivery in deliveries] == ["http://example1.com", "http://example2.com", "http://example.com"]
+    assert all(delivery[1].data == data for delivery in deliveries)
+    logged = [call.args[:4] for call in mock_log_service.create_log.call_args_list]
+    assert (str(webhook_id), "1", "success", 200) in logged
+    assert (str(webhook_id), "2", None, 500) in logged
+    service.retry_service.schedule.assert_called_once_with(
+        str(webhook_id), {"endpoint_id": "2", "url": "http://example2.com"}, data, "timeout"
+    )
+
+def test_accept_webhook_enqueues_and_returns_202(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.delivery_engine = MagicMock()
+    service.outbox_service = MagicMock()
+    service.circuit_breaker = MagicMock()
+    service.status_metrics = MagicMock()
+    service.outbox_service.enqueue.return_value = "event-1"
+
+    webhook_id = ObjectId()
+    webhook = {"_id": webhook_id, "webhook_url": "http://example.com", "endpoints": []}
+    mock_mongo.webhook_db.webhooks.find_one.return_value = webhook
+
+    result, status_code = service.accept_webhook(str(webhook_id), {"key": "value"})
+
+    assert status_code == 202
+    assert result == {"status": "accepted", "event_id": "event-1"}
+    service.outbox_service.enqueue.assert_called_once_with(str(webhook_id), webhook, {"key": "value"})
+    service.delivery_engine.deliver_each.assert_not_called()
+
+def test_receive_webhook_defers_open_circuit_endpoints(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.delivery_engine = MagicMock()
+    service.retry_service = MagicMock()
+    service.circuit_breaker = MagicMock()
+    service.status_metrics = MagicMock()
+    service.circuit_breaker.allow.side_effect = lambda webhook_id, endpoint_id: endpoint_id != "2"
+    service.circuit_breaker.retry_after.return_value = 12.0
+
+    webhook_id = ObjectId()
+    mock_mongo.webhook_db.webhooks.find_one.return_value = {
+        "_id": webhook_id,
+        "webhook_url": "http://example.com",
+        "endpoints": [
+            {"endpoint_id": "1", "url": "http://example1.com"},
+            {"endpoint_id": "2", "url": "http://example2.com"}
+        ]
+    }
+    service.delivery_engine.deliver_each.return_value = [DeliveryResult("http://example1.com", 200), DeliveryResult("http://example.com", 200)]
+
+    data = {"data": {"key": "value"}}
+    service.receive_webhook(str(webhook_id), data)
+
+    deliveries = service.delivery_engine.deliver_each.call_args.args[0]
+    assert [delivery[0] for delivery in deliveries] == ["http://example1.com", "http://example.com"]
+    service.retry_service.schedule.assert_called_once_with(
+        str(webhook_id), {"endpoint_id": "2", "url": "http://example2.com"}, data, "Circuit open, delivery deferred", attempts=0, retry_after=12.0
+    )
+
+def test_add_endpoints_invalidates_cached_webhook(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.webhook_cache = MagicMock()
+
+    webhook_id = str(ObjectId())
+    service.add_endpoints(webhook_id, {"endpoints": [{"url": "http://example1.com"}]})
+
+    service.webhook_cache.invalidate.assert_called_once_with(webhook_id)
+
+def test_get_webhook_logs_returns_page_and_next_cursor(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+
+    logs = [{"_id": ObjectId(), "webhook_id": "abc", "timestamp": f"2023-06-01T12:00:0{i}Z"} for i in range(3)]
+    mock_log_service.find_logs.return_value = iter(logs)
+
+    result, status_code = service.get_webhook_logs("abc", limit=2)
+
+    assert status_code == RESPONSE_CODE_SUCCESS
+    assert [log["timestamp"] for log in result["logs"]] == ["2023-06-01T12:00:00Z", "2023-06-01T12:00:01Z"]
+    assert result["next"] is not None
+    assert mock_log_service.find_logs.call_args.kwargs["limit"] == 3
+
+def test_list_webhooks_filters_and_paginates(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+
+    webhook_ids = [ObjectId() for _ in range(3)]
+    webhooks = [{"_id": webhook_id, "customer_id": "123", "webhook_url": "http://example.com"} for webhook_id in webhook_ids]
+    cursor = mock_mongo.webhook_db.webhooks.find.return_value.sort.return_value.batch_size.return_value
+    cursor.limit.return_value = iter(webhooks)
+
+    result, status_code = service.list_webhooks(limit=2, customer_id="123", include_endpoints=False)
+
+    assert status_code == RESPONSE_CODE_SUCCESS
+    assert [webhook["_id"] for webhook in result["webhooks"]] == [str(webhook_id) for webhook_id in webhook_ids[:2]]
+    assert result["next"] is not None
+    query, projection = mock_mongo.webhook_db.webhooks.find.call_args.args
+    assert query == {"customer_id": "123"}
+    assert projection == {"endpoints": 0}
+    assert not mock_log_service.create_log.called
+
+    service.list_webhooks(limit=2, after=result["next"])
+    query = mock_mongo.webhook_db.webhooks.find.call_args.args[0]
+    assert query == {"_id": {"$gt": webhook_ids[1]}}
+
+def test_handle_webhook_runs_receive_through_idempotency(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.idempotency_service = MagicMock()
+    service.idempotency_service.key_for.return_value = "abc:key:evt_1"
+    service.idempotency_service.run.side_effect = lambda key, handler: handler()
+    service.receive_webhook = MagicMock(return_value=({"key": "value"}, 200))
+
+    result, status_code = service.handle_webhook("abc", {"key": "value"}, "evt_1")
+
+    assert status_code == 200
+    service.idempotency_service.key_for.assert_called_once_with("abc", {"key": "value"}, "evt_1")
+    service.receive_webhook.assert_called_once_with("abc", {"key": "value"})
+
+def test_receive_batch_delivers_all_events_in_one_round(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.retry_service = MagicMock()
+    service.circuit_breaker = MagicMock()
+    service.status_metrics = MagicMock()
+    service.delivery_engine = MagicMock()
+    webhook_id = ObjectId()
+    mock_mongo.webhook_db.webhooks.find_one.return_value = {
+        "_id": webhook_id,
+        "webhook_url": "http://example.com",
+        "endpoints": [{"endpoint_id": "1", "url": "http://example1.com"}]
+    }
+    service.delivery_engine.deliver_each.return_value = [
+        DeliveryResult("http://example1.com", 200), DeliveryResult("http://example.com", 200),
+        DeliveryResult("http://example1.com", 200), DeliveryResult("http://example.com", error="timeout"),
+    ]
+
+    result, status_code = service.receive_batch(str(webhook_id), [{"n": 1}, {"n": 2}])
+
+    assert status_code == RESPONSE_CODE_SUCCESS
+    assert mock_mongo.webhook_db.webhooks.find_one.call_count == 1
+    assert service.delivery_engine.deliver_each.call_count == 1
+    assert [delivery[0] for delivery in service.delivery_engine.deliver_each.call_args.args[0]] == [
+        "http://example1.com", "http://example.com", "http://example1.com", "http://example.com"]
+    assert [event["status_code"] for event in result["results"]] == [200, 500]
+    assert result["delivered"] == 1 and result["failed"] == 1
+    mock_log_service.batch.assert_called_once()
+
+def test_receive_batch_rejects_oversized_batch(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+
+    with pytest.raises(ValidationError):
+        service.receive_batch("abc", [{"n": i} for i in range(BATCH_MAX_EVENTS + 1)])
+
+def test_add_endpoints_rejects_invalid_filter(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+
+    with pytest.raises(ValidationError):
+        service.add_endpoints(str(ObjectId()), {"endpoints": [{"url": "http://example1.com", "filter": {"match": {"amount": {"$regex": "1"}}}}]})
+
+    mock_mongo.webhook_db.webhooks.update_one.assert_not_called()
+
+def test_rate_limited_endpoint_is_deferred_to_retry_queue(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.delivery_engine = MagicMock()
+    service.retry_service = MagicMock()
+    service.circuit_breaker = MagicMock()
+    service.status_metrics = MagicMock()
+    endpoint = {"endpoint_id": "1", "url": "http://example1.com", "rate_limit": {"rate": 1}}
+    mock_mongo.webhook_db.webhooks.find_one.return_value = {"_id": ObjectId(), "webhook_url": "http://example.com", "endpoints": [endpoint]}
+    service.delivery_engine.deliver_each.return_value = [
+        DeliveryResult("http://example1.com", error="Rate limited, delivery deferred", deferred=True), DeliveryResult("http://example.com", 200)
+    ]
+
+    service.receive_webhook(str(ObjectId()), {"key": "value"})
+
+    assert service.delivery_engine.deliver_each.call_args.args[0][0][2] is not None
+    service.retry_service.schedule.assert_called_once()
+    assert service.retry_service.schedule.call_args.kwargs == {"attempts": 0}
+    service.circuit_breaker.record.assert_not_called()
+
+def test_add_endpoints_migrates_embedded_endpoints_first(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    webhook_id = ObjectId()
+    embedded = [{"endpoint_id": str(ObjectId()), "url": "http://example1.com"}]
+    mock_mongo.webhook_db.webhooks.find_one.return_value = {"_id": webhook_id, "endpoints": embedded}
+
+    service.add_endpoints(str(webhook_id), {"endpoints": [{"url": "http://example2.com"}]})
+
+    migrated, added = [call.args[0] for call in mock_mongo.webhook_db.endpoints.bulk_write.call_args_list]
+    assert migrated[0]._filter == {"_id": ObjectId(embedded[0]["endpoint_id"]), "webhook_id": str(webhook_id)}
+    assert added[0]._filter == {"webhook_id": str(webhook_id), "url": "http://example2.com"}
+    mock_mongo.webhook_db.webhooks.update_one.assert_any_call(
+        {"_id": webhook_id, "endpoints": embedded}, {"$unset": {"endpoints": ""}})
+
+def test_add_endpoints_requires_url(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+
+    with pytest.raises(ValidationError):
+        service.add_endpoints(str(ObjectId()), {"endpoints": [{"filter": {"event_types": ["a"]}}]})
+    mock_mongo.webhook_db.endpoints.bulk_write.assert_not_called()
+
+def test_bulk_update_endpoints_sends_one_bulk_write(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    webhook_id = ObjectId()
+    disabled, deleted = str(ObjectId()), str(ObjectId())
+    mock_mongo.webhook_db.webhooks.find_one.return_value = {"_id": webhook_id}
+    mock_mongo.webhook_db.endpoints.bulk_write.return_value.bulk_api_result = {
+        "nUpserted": 1, "nMatched": 1, "nModified": 1, "nRemoved": 1}
+    service.webhook_cache.put(str(webhook_id), {"_id": webhook_id}, service.webhook_cache.peek(str(webhook_id))[1])
+
+    result, status_code = service.bulk_update_endpoints(str(webhook_id), {
+        "upsert": [{"url": "http://example1.com"}], "disable": [disabled], "delete": [deleted]})
+
+    assert status_code == RESPONSE_CODE_SUCCESS
+    assert (result["upserted"], result["modified"], result["deleted"], result["errors"]) == (1, 1, 1, [])
+    mock_mongo.webhook_db.endpoints.bulk_write.assert_called_once()
+    operations = mock_mongo.webhook_db.endpoints.bulk_write.call_args.args[0]
+    assert operations[1]._filter == {"webhook_id": str(webhook_id), "_id": {"$in": [ObjectId(disabled)]}}
+    assert operations[1]._doc["$set"]["disabled"] is True
+    assert operations[2]._filter == {"webhook_id": str(webhook_id), "_id": {"$in": [ObjectId(deleted)]}}
+    assert mock_mongo.webhook_db.endpoints.bulk_write.call_args.kwargs == {"ordered": False}
+    assert service.webhook_cache.peek(str(webhook_id))[0] is None
+
+def test_bulk_update_endpoints_rejects_too_many_operations(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+
+    with pytest.raises(ValidationError):
+        service.bulk_update_endpoints(str(ObjectId()), {"delete": [str(ObjectId())] * (ENDPOINT_BULK_MAX + 1)})
+    mock_mongo.webhook_db.endpoints.bulk_write.assert_not_called()
+
+def test_delete_endpoint_missing_from_collection(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    mock_mongo.webhook_db.webhooks.find_one.return_value = {"_id": ObjectId()}
+    mock_mongo.webhook_db.endpoints.delete_one.return_value = MagicMock(deleted_count=0)
+
+    with pytest.raises(NotFoundError) as excinfo:
+        service.delete_endpoint(str(ObjectId()), str(ObjectId()))
+    assert str(excinfo.value) == "Endpoint not found"
+
+def test_load_webhook_merges_stored_and_embedded_endpoints(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    webhook_id = ObjectId()
+    stored_id, embedded_id = ObjectId(), str(ObjectId())
+    mock_mongo.webhook_db.webhooks.find_one.return_value = {
+        "_id": webhook_id, "webhook_url": "http://example.com",
+        "endpoints": [{"endpoint_id": embedded_id, "url": "http://example1.com"}]
+    }
+    cursor = mock_mongo.webhook_db.endpoints.find.return_value.sort.return_value.batch_size.return_value
+    cursor.__iter__.return_value = iter([
+        {"_id": stored_id, "webhook_id": str(webhook_id), "url": "http://example2.com", "disabled": False}])
+
+    webhook = service.load_webhook(str(webhook_id))
+
+    assert [endpoint["endpoint_id"] for endpoint in webhook["endpoints"]] == [embedded_id, str(stored_id)]
+    assert mock_mongo.webhook_db.endpoints.find.call_args.args[0] == {"webhook_id": str(webhook_id), "disabled": {"$ne": True}}
+    assert len(webhook["routing"].route({})) == 2
+
+def test_delivery_analytics_need_a_snapshot(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.log_snapshot = MagicMock(available=False)
+
+    with pytest.raises(NotFoundError):
+        service.get_delivery_analytics()
+
+    service.log_snapshot = MagicMock(available=True)
+    with pytest.raises(ValidationError):
+        service.get_delivery_analytics(interval="week")
+
+def test_deliver_replay_sends_stored_bodies_to_current_endpoints(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.delivery_engine = MagicMock()
+    service.circuit_breaker = MagicMock()
+    service.status_metrics = MagicMock()
+    service.get_webhook = MagicMock(return_value={"endpoints": [
+        {"endpoint_id": "1", "url": "http://example1.com"}, {"endpoint_id": "2", "url": "http://example2.com"}]})
+    service.delivery_engine.deliver_each.return_value = [
+        DeliveryResult("http://example1.com", 200), DeliveryResult("http://example2.com", error="timeout")]
+    logs = [{"endpoint_id": "1", "event_ref": "a"}, {"endpoint_id": "2", "event_ref": "a"},
+            {"endpoint_id": "3", "event_ref": "a"}, {"endpoint_id": "1", "event_ref": "gone"}]
+
+    counts = service.deliver_replay({"_id": "r1", "webhook_id": "w1"}, logs, {"a": b'{"key": "value"}'})
+
+    assert counts == {"delivered": 1, "failed": 1, "skipped": 2}
+    deliveries = service.delivery_engine.deliver_each.call_args.args[0]
+    assert [delivery[0] for delivery in deliveries] == ["http://example1.com", "http://example2.com"]
+    assert deliveries[0][1].body == b'{"key": "value"}'
+    logged = [call.args[1:4] for call in mock_log_service.create_log.call_args_list]
+    assert logged == [("1", "success", 200), ("2", None, 500)]
+    assert all(call.kwargs["delivery"] for call in mock_log_service.create_log.call_args_list)
+
+def test_outbox_webhook_url_failure_is_retried_not_failed(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.delivery_engine = MagicMock()
+    service.retry_service = MagicMock()
+    service.outbox_service = MagicMock()
+    service.status_metrics = MagicMock()
+    event = {"_id": ObjectId(), "webhook_id": "abc", "webhook_url": "http://example.com", "endpoints": [], "payload": b'{"key": "value"}'}
+    service.delivery_engine.deliver_each.return_value = [DeliveryResult("http://example.com", error="503")]
+
+    assert service.deliver_outbox_event(event) == "retrying"
+
+    service.outbox_service.mark_retrying.assert_called_once()
+    endpoint = service.retry_service.schedule.call_args.args[1]
+    assert endpoint == {"endpoint_id": None, "url": "http://example.com"}
+    assert service.retry_service.schedule.call_args.kwargs == {"outbox_event_id": event["_id"]}
+
+def test_retries_follow_current_endpoint_config(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.delivery_engine = MagicMock()
+    service.circuit_breaker = MagicMock()
+    service.status_metrics = MagicMock()
+    service.get_webhook = MagicMock(return_value={"endpoints": [{"endpoint_id": "1", "url": "http://moved.example.com"}]})
+    moved = {"_id": ObjectId(), "webhook_id": "abc", "endpoint_id": "1", "url": "http://example1.com", "payload": b"{}", "attempts": 1}
+    deleted = {"_id": ObjectId(), "webhook_id": "abc", "endpoint_id": "2", "url": "http://example2.com", "payload": b"{}", "attempts": 1}
+    service.delivery_engine.deliver_each.return_value = [DeliveryResult("http://moved.example.com", 200)]
+
+    results = service.deliver_retries([moved, deleted])
+
+    deliveries = service.delivery_engine.deliver_each.call_args.args[0]
+    assert [delivery[0] for delivery in deliveries] == ["http://moved.example.com"]
+    assert results[0].ok
+    assert results[1].cancelled and not results[1].deferred
+
+def test_ingress_defers_rate_limited_deliveries_sooner_than_outbox(mock_log_service, mock_mongo):
+    service = WebhookService()
+    service.log_service = mock_log_service
+    service.mongo = mock_mongo
+    service.delivery_engine = MagicMock()
+    service.rate_limiter = MagicMock()
+    service.status_metrics = MagicMock()
+    endpoint = {"endpoint_id": "1", "url": "http://example1.com", "rate_limit": {"rate": 1}}
+    webhook = {"_id": ObjectId(), "webhook_url": "http://example.com", "endpoints": [endpoint]}
+    mock_mongo.webhook_db.webhooks.find_one.return_value = webhook
+    service.delivery_engine.deliver_each.return_value = [DeliveryResult("http://example1.com", 200), DeliveryResult("http://example.com", 200)]
+
+    service.receive_webhook(str(webhook["_id"]), {"key": "value"})
+    assert service.rate_limiter.throttle.call_args_list[0].args[4] == RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS
+
+    service.rate_limiter.reset_mock()
+    service.deliver_outbox_event({"_id": ObjectId(), "webhook_id": "abc", "webhook_url": "http://example.com", "endpoints": [endpoint], "payload": b"{}"})
+    assert service.rate_limiter.throttle.call_args_list[0].args[4] is None
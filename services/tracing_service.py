@@ -0,0 +1,168 @@
+import collections
+import contextvars
+import datetime
+import random
+import threading
+import time
+from bson.objectid import ObjectId
+from config import TRACE_SAMPLE_RATE, TRACE_BUFFER_SIZE
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "attributes", "children", "started", "ended")
+
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = attributes or {}
+        self.children = []
+        self.started = time.perf_counter()
+        self.ended = None
+
+    def child(self, name, **attributes):
+        span = Span(name, attributes)
+        self.children.append(span)
+        return span
+
+    def mark(self, name):
+        # Milliseconds since the span started, e.g. dns_ms or connect_ms.
+        self.attributes[name] = round((time.perf_counter() - self.started) * 1000, 3)
+
+    def finish(self, **attributes):
+        self.attributes.update(attributes)
+        self.ended = time.perf_counter()
+
+    def to_dict(self, origin):
+        return {
+            "name": self.name,
+            "start_ms": round((self.started - origin) * 1000, 3),
+            "duration_ms": round((self.ended - self.started) * 1000, 3) if self.ended is not None else None,
+            "attributes": self.attributes,
+            "children": [child.to_dict(origin) for child in self.children],
+        }
+
+
+class Trace:
+    def __init__(self, name, webhook_id, forced):
+        self.trace_id = str(ObjectId())
+        self.webhook_id = webhook_id
+        self.forced = forced
+        self.started_at = datetime.datetime.utcnow()
+        self.root = Span(name)
+
+    @property
+    def duration_ms(self):
+        if self.root.ended is None:
+            return None
+        return round((self.root.ended - self.root.started) * 1000, 3)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "webhook_id": self.webhook_id,
+            "forced": self.forced,
+            "started_at": self.started_at.isoformat() + "Z",
+            "duration_ms": self.duration_ms,
+            "root": self.root.to_dict(self.root.started),
+        }
+
+
+class SpanScope:
+    __slots__ = ("span", "token")
+
+    def __init__(self, span):
+        self.span = span
+        self.token = None
+
+    def __enter__(self):
+        if self.span is not None:
+            self.token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, error_type, error, traceback):
+        if self.span is not None:
+            _current_span.reset(self.token)
+            self.span.finish(**({"error": f"{error_type.__name__}: {error}"} if error_type else {}))
+        return False
+
+
+class TraceScope(SpanScope):
+    __slots__ = ("tracer", "trace")
+
+    def __init__(self, tracer, trace):
+        SpanScope.__init__(self, trace.root if trace else None)
+        self.tracer = tracer
+        self.trace = trace
+
+    def __enter__(self):
+        SpanScope.__enter__(self)
+        return self.trace
+
+    def __exit__(self, error_type, error, traceback):
+        SpanScope.__exit__(self, error_type, error, traceback)
+        if self.trace is not None:
+            self.tracer.store(self.trace)
+        return False
+
+
+class Tracer:
+    # Sampled per-request traces. Spans nest through a context variable, so
+    # instrumented code only pays for a lookup when the request isn't traced.
+    # Finished traces go to a bounded ring buffer, newest last.
+    def __init__(self, sample_rate=TRACE_SAMPLE_RATE, buffer_size=TRACE_BUFFER_SIZE):
+        self.sample_rate = sample_rate
+        self._traces = collections.deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+
+    def trace(self, name, webhook_id=None, force=False):
+        sampled = force or (self.sample_rate > 0 and random.random() < self.sample_rate)
+        return TraceScope(self, Trace(name, webhook_id, force) if sampled else None)
+
+    def span(self, name, **attributes):
+        parent = _current_span.get()
+        return SpanScope(parent.child(name, **attributes) if parent is not None else None)
+
+    def child_span(self, name, **attributes):
+        # An unscoped child of the current span, for work finished elsewhere
+        # (e.g. on the delivery engine's loop); the caller finishes it.
+        parent = _current_span.get()
+        return parent.child(name, **attributes) if parent is not None else None
+
+    def store(self, trace):
+        with self._lock:
+            self._traces.append(trace)
+
+    def find(self, webhook_id=None, min_duration_ms=None, limit=50):
+        with self._lock:
+            traces = list(self._traces)
+        result = []
+        for trace in reversed(traces):
+            if webhook_id and trace.webhook_id != webhook_id:
+                continue
+            if min_duration_ms is not None and (trace.duration_ms or 0) < min_duration_ms:
+                continue
+            result.append(trace.to_dict())
+            if len(result) >= limit:
+                break
+        return result
+
+    def get(self, trace_id):
+        with self._lock:
+            traces = list(self._traces)
+        for trace in traces:
+            if trace.trace_id == trace_id:
+                return trace.to_dict()
+        return None
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+        return _tracer
@@ -0,0 +1,108 @@
+import collections
+import logging
+import threading
+import time
+from config import WEBHOOK_CACHE_SIZE, WEBHOOK_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookCache:
+    # Bounded LRU of webhook documents keyed by webhook id. Entries expire
+    # after the TTL so a process that misses an invalidation converges anyway.
+    def __init__(self, max_size=WEBHOOK_CACHE_SIZE, ttl_seconds=WEBHOOK_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._watcher = None
+
+    def get(self, webhook_id, loader):
+        webhook, generation = self.peek(webhook_id)
+        if webhook is None:
+            webhook = loader(webhook_id)
+            self.put(webhook_id, webhook, generation)
+        return webhook
+
+    def peek(self, webhook_id):
+        # Returns the cached document (or None on a miss) and the generation
+        # to hand back to put() once the caller has loaded it.
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(webhook_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(webhook_id)
+                self.hits += 1
+                return entry[1], self._generation
+            self.misses += 1
+            return None, self._generation
+
+    def put(self, webhook_id, webhook, generation):
+        with self._lock:
+            # Don't store a document that was invalidated while it was loading.
+            if generation != self._generation:
+                return
+            self._entries[webhook_id] = (time.monotonic() + self.ttl_seconds, webhook)
+            self._entries.move_to_end(webhook_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, webhook_id):
+        with self._lock:
+            self._entries.pop(webhook_id, None)
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def watch(self, collection):
+        # Change streams need a replica set; they let other processes' writes
+        # evict entries here without waiting for the TTL.
+        if self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(collection,), name="webhook-cache-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self, collection):
+        while True:
+            try:
+                with collection.watch() as stream:
+                    self.clear()
+                    for change in stream:
+                        document_key = change.get("documentKey")
+                        if document_key:
+                            self.invalidate(str(document_key["_id"]))
+                        else:
+                            self.clear()
+            except Exception as e:
+                logger.error(f"Webhook cache change stream stopped: {e}")
+                time.sleep(5)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_webhook_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = WebhookCache()
+        return _cache
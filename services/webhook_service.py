@@ -1,32 +1,76 @@
-import asyncio
-from aiohttp import ClientSession
+import itertools
+import threading
 from bson.objectid import ObjectId
 from flask import current_app
-from config import mongo
+from pymongo import ASCENDING, DeleteMany, UpdateMany
+from pymongo.errors import BulkWriteError
+from config import (
+    mongo, DELIVERY_PROCESSES, RETRY_ENABLED, CIRCUIT_BREAKER_ENABLED, IDEMPOTENCY_ENABLED, BATCH_MAX_EVENTS,
+    RATE_LIMIT_ENABLED, ENDPOINT_BULK_MAX, REPLAY_ENABLED, RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS
+)
 from constants import (
     RESPONSE_CODE_ERROR, SUCCESS_MESSAGE, ENDPOINT_DELETED_MESSAGE, WEBHOOK_NOT_FOUND_MESSAGE,
-    DATABASE_ERROR_MESSAGE, FORWARDING_ERROR_MESSAGE, UPTIME, AVERAGE_LATENCY_MS,
-    RESPONSE_CODE_SUCCESS
+    DATABASE_ERROR_MESSAGE, FORWARDING_ERROR_MESSAGE,
+    RESPONSE_CODE_SUCCESS, RESPONSE_CODE_ACCEPTED, ACCEPTED_MESSAGE, CIRCUIT_OPEN_MESSAGE,
+    RESPONSE_CODE_UNAVAILABLE, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_BATCH_SIZE,
+    RESPONSE_CODE_TOO_MANY_REQUESTS, RATE_LIMITED_MESSAGE, TRACE_NOT_FOUND_MESSAGE, ENDPOINT_NOT_FOUND_MESSAGE,
+    ENDPOINT_URL_REQUIRED_MESSAGE, ANALYTICS_UNAVAILABLE_MESSAGE, REPLAY_NOT_FOUND_MESSAGE, REPLAY_DISABLED_MESSAGE,
+    OUTBOX_RETRYING, RETRY_CANCELLED_MESSAGE
 )
-from exceptions import DatabaseError, NotFoundError
+from exceptions import DatabaseError, NotFoundError, ForwardingError, ValidationError
 import datetime
+from services.circuit_breaker_service import CircuitBreakerService
+from services.delivery_pool_service import DeliveryPool, get_delivery_pool
+from services.delivery_service import DeliveryResult, get_delivery_engine
+from services.endpoints import (
+    ensure_endpoint_indexes, fan_out_query, merge_endpoints, migrate_webhook, to_endpoint, to_endpoint_id, upsert_operation
+)
+from services.idempotency_service import get_idempotency_service
 from services.log_service import LogService
-import requests
+from services.log_snapshot_service import INTERVALS_MS, get_log_snapshot, to_epoch_ms
+from services.metrics_service import ROLLUP_GRANULARITIES, get_status_metrics
+from services.outbox_service import OutboxService
+from services.pagination import decode_cursor, encode_cursor, to_ndjson, to_object_id
+from services.payload import Payload, to_payload
+from services.rate_limit_service import get_rate_limiter, parse_rate_limit
+from services.replay_service import ReplayService, to_replay_response
+from services.retry_service import RetryService
+from services.routing_service import RoutingIndex, compile_filter, get_routing_index
+from services.stage_metrics_service import get_stage_metrics, host_of
+from services.tracing_service import get_tracer
+from services.webhook_cache_service import get_webhook_cache
+
+_indexes_ensured = False
+_indexes_lock = threading.Lock()
 
 class WebhookService:
     def __init__(self):
         self.mongo = mongo
         self.log_service = LogService()
+        self.delivery_engine = get_delivery_pool() if DELIVERY_PROCESSES else get_delivery_engine()
+        self.outbox_service = OutboxService()
+        self.retry_service = RetryService(outbox_service=self.outbox_service)
+        self.circuit_breaker = CircuitBreakerService()
+        self.webhook_cache = get_webhook_cache()
+        self.status_metrics = get_status_metrics()
+        self.idempotency_service = get_idempotency_service()
+        self.rate_limiter = get_rate_limiter()
+        self.stage_metrics = get_stage_metrics()
+        self.tracer = get_tracer()
+        self.log_snapshot = get_log_snapshot()
+        self.replay_service = ReplayService(self.log_service)
 
     def get_webhook_collection(self):
         return self.mongo.webhook_db.webhooks
 
+    def get_endpoints_collection(self):
+        return self.mongo.webhook_db.endpoints
+
     def create_webhook(self, data):
         try:
             webhook = {
                 "customer_id": data["customer_id"],
-                "webhook_url": data["webhook_url"],
-                "endpoints": []
+                "webhook_url": data["webhook_url"]
             }
             result = self.get_webhook_collection().insert_one(webhook)
             if result.acknowledged:
@@ -38,83 +82,266 @@ class WebhookService:
             self.log_service.create_log(None, None, None, RESPONSE_CODE_ERROR, f"Error creating webhook: {e}")
             raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
+    def validate_endpoints(self, endpoints):
+        for endpoint in endpoints:
+            if not isinstance(endpoint, dict) or not isinstance(endpoint.get("url"), str) or not endpoint["url"]:
+                raise ValidationError(ENDPOINT_URL_REQUIRED_MESSAGE)
+            compile_filter(endpoint.get("filter"))
+            parse_rate_limit(endpoint.get("rate_limit"))
+            parse_rate_limit(endpoint.get("host_rate_limit"))
+
+    def prepare_endpoint_write(self, webhook_id):
+        # Endpoints live in their own collection. A webhook that still embeds
+        # them is migrated first, so every id a write names resolves there.
+        self.ensure_indexes()
+        webhook = self.get_webhook_collection().find_one({"_id": ObjectId(webhook_id)}, {"endpoints": 1})
+        if not webhook:
+            raise NotFoundError(WEBHOOK_NOT_FOUND_MESSAGE)
+        migrate_webhook(self.get_webhook_collection(), self.get_endpoints_collection(), webhook)
+
+    def finish_endpoint_write(self, webhook_id):
+        # Touching the webhook document lets other processes' change streams
+        # evict their cached copy too.
+        self.get_webhook_collection().update_one(
+            {"_id": ObjectId(webhook_id)},
+            {"$set": {"endpoints_updated_at": datetime.datetime.utcnow().isoformat() + "Z"}}
+        )
+        self.webhook_cache.invalidate(webhook_id)
+
+    def resolve_endpoint_ids(self, webhook_id, endpoints):
+        # Upserts keyed by url keep the id of the endpoint they matched.
+        urls = [endpoint["url"] for endpoint in endpoints]
+        ids = {document["url"]: str(document["_id"]) for document in self.get_endpoints_collection().find(
+            {"webhook_id": webhook_id, "url": {"$in": urls}}, {"url": 1})}
+        return [dict(endpoint, endpoint_id=ids.get(endpoint["url"], endpoint.get("endpoint_id"))) for endpoint in endpoints]
+
     def add_endpoints(self, webhook_id, data):
         try:
-            endpoints = data.get("endpoints", [])
-            for endpoint in endpoints:
-                endpoint["endpoint_id"] = str(ObjectId())
-            self.get_webhook_collection().update_one(
-                {"_id": ObjectId(webhook_id)},
-                {"$addToSet": {"endpoints": {"$each": endpoints}}}
-            )
+            endpoints = [{key: value for key, value in endpoint.items() if key != "endpoint_id"}
+                         for endpoint in data.get("endpoints", []) if isinstance(endpoint, dict)]
+            self.validate_endpoints(endpoints)
+            self.prepare_endpoint_write(webhook_id)
+            if endpoints:
+                self.get_endpoints_collection().bulk_write([upsert_operation(webhook_id, endpoint) for endpoint in endpoints], ordered=False)
+            self.finish_endpoint_write(webhook_id)
             self.log_service.create_log(webhook_id, None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Endpoints added successfully")
-            return {"webhook_id": webhook_id, "endpoints": endpoints}, RESPONSE_CODE_SUCCESS
+            return {"webhook_id": webhook_id, "endpoints": self.resolve_endpoint_ids(webhook_id, endpoints)}, RESPONSE_CODE_SUCCESS
+        except (ValidationError, NotFoundError) as e:
+            raise e
         except Exception as e:
             self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error adding endpoints: {e}")
             raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
+    def bulk_update_endpoints(self, webhook_id, data):
+        # Upserts, disables, enables and deletes in one unordered bulk_write.
+        # Operations that fail (e.g. an upsert renaming an endpoint to another
+        # one's url) are reported without failing the rest.
+        upserts = data.get("upsert", [])
+        ids = {action: data.get(action, []) for action in ("disable", "enable", "delete")}
+        if not isinstance(upserts, list) or not all(isinstance(value, list) for value in ids.values()):
+            raise ValidationError("upsert, disable, enable and delete must be lists")
+        if len(upserts) + sum(len(value) for value in ids.values()) > ENDPOINT_BULK_MAX:
+            raise ValidationError(f"Bulk request exceeds {ENDPOINT_BULK_MAX} operations")
+        self.validate_endpoints(upserts)
+        try:
+            self.prepare_endpoint_write(webhook_id)
+            now = datetime.datetime.utcnow().isoformat() + "Z"
+            operations = [upsert_operation(webhook_id, endpoint, now) for endpoint in upserts]
+            for action, disabled in (("disable", True), ("enable", False)):
+                if ids[action]:
+                    operations.append(UpdateMany(
+                        {"webhook_id": webhook_id, "_id": {"$in": [to_endpoint_id(endpoint_id) for endpoint_id in ids[action]]}},
+                        {"$set": {"disabled": disabled, "updated_at": now}}
+                    ))
+            if ids["delete"]:
+                operations.append(DeleteMany(
+                    {"webhook_id": webhook_id, "_id": {"$in": [to_endpoint_id(endpoint_id) for endpoint_id in ids["delete"]]}}
+                ))
+            written, errors = {}, []
+            if operations:
+                try:
+                    written = self.get_endpoints_collection().bulk_write(operations, ordered=False).bulk_api_result
+                except BulkWriteError as e:
+                    written = e.details
+                    errors = [{"index": error["index"], "message": error["errmsg"]} for error in e.details["writeErrors"]]
+                self.finish_endpoint_write(webhook_id)
+            failed = {error["index"] for error in errors}
+            applied = [endpoint for index, endpoint in enumerate(upserts) if index not in failed]
+            self.log_service.create_log(webhook_id, None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS,
+                                        f"Bulk endpoint update of {len(operations)} operations, {len(errors)} failed")
+            return {
+                "webhook_id": webhook_id,
+                "upserted": written.get("nUpserted", 0),
+                "matched": written.get("nMatched", 0),
+                "modified": written.get("nModified", 0),
+                "deleted": written.get("nRemoved", 0),
+                "endpoints": self.resolve_endpoint_ids(webhook_id, applied) if applied else [],
+                "errors": errors,
+            }, RESPONSE_CODE_SUCCESS
+        except (ValidationError, NotFoundError) as e:
+            raise e
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error updating endpoints: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def list_endpoints(self, webhook_id, limit=DEFAULT_PAGE_SIZE, after=None, include_disabled=True):
+        # Keyset pagination over endpoint ids. Endpoints of a webhook that
+        # hasn't been migrated yet are merged in from its document.
+        try:
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            webhook = self.get_webhook_collection().find_one({"_id": ObjectId(webhook_id)}, {"endpoints": 1})
+            if not webhook:
+                raise NotFoundError(WEBHOOK_NOT_FOUND_MESSAGE)
+            query = fan_out_query(webhook_id) if not include_disabled else {"webhook_id": webhook_id}
+            embedded = webhook.get("endpoints") or []
+            if after:
+                after_id = to_object_id(decode_cursor(after, 1)[0])
+                query["_id"] = {"$gt": after_id}
+                embedded = [endpoint for endpoint in embedded if endpoint["endpoint_id"] > str(after_id)]
+            stored = [to_endpoint(document) for document in
+                      self.get_endpoints_collection().find(query).sort("_id", ASCENDING).limit(limit + 1)]
+            endpoints = sorted(merge_endpoints(embedded, stored), key=lambda endpoint: endpoint["endpoint_id"])
+            next_cursor = None
+            if len(endpoints) > limit:
+                endpoints = endpoints[:limit]
+                next_cursor = encode_cursor(endpoints[-1]["endpoint_id"])
+            return {"endpoints": endpoints, "next": next_cursor}, RESPONSE_CODE_SUCCESS
+        except (ValidationError, NotFoundError) as e:
+            raise e
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error listing endpoints: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
     def delete_endpoint(self, webhook_id, endpoint_id):
         try:
-            self.get_webhook_collection().update_one(
-                {"_id": ObjectId(webhook_id)},
-                {"$pull": {"endpoints": {"endpoint_id": endpoint_id}}}
-            )
+            self.prepare_endpoint_write(webhook_id)
+            result = self.get_endpoints_collection().delete_one({"_id": to_endpoint_id(endpoint_id), "webhook_id": webhook_id})
+            if not result.deleted_count:
+                raise NotFoundError(ENDPOINT_NOT_FOUND_MESSAGE)
+            self.finish_endpoint_write(webhook_id)
             self.log_service.create_log(webhook_id, endpoint_id, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Endpoint deleted successfully")
             return {"message": ENDPOINT_DELETED_MESSAGE}, RESPONSE_CODE_SUCCESS
+        except NotFoundError as e:
+            raise e
         except Exception as e:
             self.log_service.create_log(webhook_id, endpoint_id, None, RESPONSE_CODE_ERROR, f"Error deleting endpoint: {e}")
             raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
-    def list_webhooks(self):
+    def ensure_indexes(self):
+        global _indexes_ensured
+        with _indexes_lock:
+            if _indexes_ensured:
+                return
+            self.get_webhook_collection().create_index([("customer_id", ASCENDING), ("_id", ASCENDING)])
+            ensure_endpoint_indexes(self.get_endpoints_collection())
+            _indexes_ensured = True
+
+    def find_webhooks(self, customer_id=None, after=None, include_endpoints=True, limit=None):
+        # Keyset pagination over _id: `after` is the cursor token of the last
+        # webhook already returned.
+        self.ensure_indexes()
+        query = {}
+        if customer_id:
+            query["customer_id"] = customer_id
+        if after:
+            query["_id"] = {"$gt": to_object_id(decode_cursor(after, 1)[0])}
+        projection = None if include_endpoints else {"endpoints": 0}
+        cursor = self.get_webhook_collection().find(query, projection).sort("_id", ASCENDING).batch_size(STREAM_BATCH_SIZE)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    def list_webhooks(self, limit=DEFAULT_PAGE_SIZE, **filters):
         try:
-            webhooks = list(self.get_webhook_collection().find())
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            webhooks = list(self.find_webhooks(limit=limit + 1, **filters))
+            next_cursor = None
+            if len(webhooks) > limit:
+                webhooks = webhooks[:limit]
+                next_cursor = encode_cursor(webhooks[-1]["_id"])
+            if filters.get("include_endpoints", True):
+                self.attach_endpoints(webhooks)
             for webhook in webhooks:
                 webhook["_id"] = str(webhook["_id"])
-            self.log_service.create_log(None, None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Webhooks listed successfully")
-            return webhooks, RESPONSE_CODE_SUCCESS
+            return {"webhooks": webhooks, "next": next_cursor}, RESPONSE_CODE_SUCCESS
+        except ValidationError as e:
+            raise e
         except Exception as e:
             self.log_service.create_log(None, None, None, RESPONSE_CODE_ERROR, f"Error listing webhooks: {e}")
             raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
-    def get_webhook_logs(self, webhook_id):
+    def stream_webhooks(self, limit=None, **filters):
+        cursor = self.find_webhooks(limit=limit, **filters)
+        for webhooks in iter(lambda: list(itertools.islice(cursor, STREAM_BATCH_SIZE)), []):
+            if filters.get("include_endpoints", True):
+                self.attach_endpoints(webhooks)
+            for webhook in webhooks:
+                yield to_ndjson(webhook)
+
+    def attach_endpoints(self, webhooks):
+        # One endpoints query per page of webhooks.
+        by_webhook = {}
+        query = {"webhook_id": {"$in": [str(webhook["_id"]) for webhook in webhooks]}}
+        for document in self.get_endpoints_collection().find(query).sort([("webhook_id", ASCENDING), ("_id", ASCENDING)]).batch_size(STREAM_BATCH_SIZE):
+            by_webhook.setdefault(document["webhook_id"], []).append(to_endpoint(document))
+        for webhook in webhooks:
+            webhook["endpoints"] = merge_endpoints(webhook.get("endpoints"), by_webhook.get(str(webhook["_id"]), []))
+
+    def get_webhook_logs(self, webhook_id, limit=DEFAULT_PAGE_SIZE, after=None, fields=None, **filters):
         try:
-            logs = list(self.log_service.get_logs_collection().find({"webhook_id": webhook_id}))
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            logs = list(self.log_service.find_logs(webhook_id, after=after, fields=fields, limit=limit + 1, **filters))
+            next_cursor = None
+            if len(logs) > limit:
+                logs = logs[:limit]
+                next_cursor = encode_cursor(logs[-1]["timestamp"], logs[-1]["_id"])
+            self.log_service.load_bodies(logs)
             for log in logs:
                 log["_id"] = str(log["_id"])
-            return logs, RESPONSE_CODE_SUCCESS
+            return {"logs": logs, "next": next_cursor}, RESPONSE_CODE_SUCCESS
+        except ValidationError as e:
+            raise e
         except Exception as e:
             self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error getting webhook logs: {e}")
             raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
+    def stream_webhook_logs(self, webhook_id, limit=None, after=None, fields=None, **filters):
+        cursor = self.log_service.find_logs(webhook_id, after=after, fields=fields, limit=limit, **filters)
+        return self.iter_logs_ndjson(cursor)
+
+    def iter_logs_ndjson(self, cursor):
+        for logs in iter(lambda: list(itertools.islice(cursor, STREAM_BATCH_SIZE)), []):
+            self.log_service.load_bodies(logs)
+            for log in logs:
+                yield to_ndjson(log)
+
     def get_status(self):
         try:
-            status = {
-                "uptime": UPTIME,
-                "total_requests": self.log_service.get_logs_collection().count_documents({}),
-                "successful_requests": self.log_service.get_logs_collection().count_documents({"status": SUCCESS_MESSAGE}),
-                "failed_requests": self.log_service.get_logs_collection().count_documents({"status": "failure"}),
-                "average_latency_ms": AVERAGE_LATENCY_MS
-            }
-            self.log_service.create_log(None, None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Status retrieved successfully")
-            return status, RESPONSE_CODE_SUCCESS
+            return self.status_metrics.snapshot(), RESPONSE_CODE_SUCCESS
         except Exception as e:
             self.log_service.create_log(None, None, None, RESPONSE_CODE_ERROR, f"Error getting status: {e}")
             raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
-    def receive_webhook(self, webhook_id, data):
+    def get_status_history(self, granularity, limit=60):
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValidationError(f"Unknown granularity: {granularity}")
         try:
-            webhook = self.get_webhook_collection().find_one({"_id": ObjectId(webhook_id)})
-            if not webhook:
-                raise NotFoundError(WEBHOOK_NOT_FOUND_MESSAGE)
+            return self.status_metrics.history(granularity, limit), RESPONSE_CODE_SUCCESS
+        except Exception as e:
+            self.log_service.create_log(None, None, None, RESPONSE_CODE_ERROR, f"Error getting status history: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
-            endpoints = webhook.get("endpoints", [])
-            for endpoint in endpoints:
-                try:
-                    self.forward_to_endpoint(endpoint["url"], data)
-                    self.log_service.create_log(webhook_id, endpoint["endpoint_id"], SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Forwarded successfully")
-                except Exception as e:
-                    self.log_service.create_log(webhook_id, endpoint["endpoint_id"], None, RESPONSE_CODE_ERROR, f"Error forwarding to endpoint {endpoint['url']}: {e}")
-            self.forward_to_endpoint(webhook["webhook_url"], data)
+    def handle_webhook(self, webhook_id, payload, idempotency_key=None, accept=False):
+        handler = self.accept_webhook if accept else self.receive_webhook
+        key = self.idempotency_service.key_for(webhook_id, payload, idempotency_key) if IDEMPOTENCY_ENABLED else None
+        if key is None:
+            return handler(webhook_id, payload)
+        return self.idempotency_service.run(key, lambda: handler(webhook_id, payload))
+
+    def receive_webhook(self, webhook_id, data):
+        try:
+            webhook = self.get_webhook(webhook_id)
+            self.deliver_webhook(webhook_id, webhook, data, RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS)
             self.log_service.create_log(webhook_id, None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Webhook received successfully")
             return data, RESPONSE_CODE_SUCCESS
         except NotFoundError as e:
@@ -123,21 +350,412 @@ class WebhookService:
             self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error receiving webhook: {e}")
             raise DatabaseError(DATABASE_ERROR_MESSAGE)
 
-    def forward_to_endpoint(self, endpoint, data):
+    def accept_webhook(self, webhook_id, data):
         try:
-            # async with ClientSession() as session:
-            #     async with session.post(endpoint, json=data) as response:
-            #         if response.status != 200:
-            #             raise Exception(f"Endpoint {endpoint} returned status code {response.status}")
-                        
-            response = requests.post(endpoint, json=data)
-            
-            if response.status_code != 200:
-                
-                raise Exception(f"Endpoint {endpoint} returned status code {response.status_code}")
-            
-        except Exception as e:
-            raise Exception(f"Error forwarding to endpoint {endpoint}: {e}")
-        
-    
+            webhook = self.get_webhook(webhook_id)
+            with self.stage_metrics.time("outbox_enqueue", webhook_id):
+                event_id = self.outbox_service.enqueue(webhook_id, webhook, data)
+            return {"status": ACCEPTED_MESSAGE, "event_id": event_id}, RESPONSE_CODE_ACCEPTED
+        except NotFoundError as e:
+            raise e
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error accepting webhook: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def receive_batch(self, webhook_id, payloads):
+        # One webhook lookup, one gather for every event's deliveries and one
+        # log write for the whole batch; each event still gets its own result.
+        if len(payloads) > BATCH_MAX_EVENTS:
+            raise ValidationError(f"Batch exceeds {BATCH_MAX_EVENTS} events")
+        try:
+            webhook = self.get_webhook(webhook_id)
+            with self.log_service.batch():
+                selected = [self.select_endpoints(webhook_id, webhook, payload) for payload in payloads]
+                deliveries = []
+                for endpoints, payload in zip(selected, payloads):
+                    deliveries.extend(self.build_deliveries(webhook_id, webhook, endpoints, payload, RATE_LIMIT_INGRESS_MAX_WAIT_SECONDS))
+                delivered = iter(self.delivery_engine.deliver_each(deliveries))
+                results = []
+                for index, (endpoints, payload) in enumerate(zip(selected, payloads)):
+                    event_results = [next(delivered) for _ in range(len(endpoints) + 1)]
+                    try:
+                        self.record_results(webhook_id, endpoints, payload, event_results)
+                        results.append({"index": index, "status_code": RESPONSE_CODE_SUCCESS})
+                    except ForwardingError as e:
+                        self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, str(e))
+                        results.append({"index": index, "status_code": RESPONSE_CODE_ERROR, "error": str(e)})
+                delivered_count = sum(1 for result in results if result["status_code"] == RESPONSE_CODE_SUCCESS)
+                self.log_service.create_log(webhook_id, None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS,
+                                            f"Batch of {len(payloads)} webhooks received, {delivered_count} delivered")
+            return {"results": results, "delivered": delivered_count, "failed": len(results) - delivered_count}, RESPONSE_CODE_SUCCESS
+        except NotFoundError as e:
+            raise e
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error receiving webhook batch: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def accept_batch(self, webhook_id, payloads):
+        if len(payloads) > BATCH_MAX_EVENTS:
+            raise ValidationError(f"Batch exceeds {BATCH_MAX_EVENTS} events")
+        try:
+            webhook = self.get_webhook(webhook_id)
+            event_ids = self.outbox_service.enqueue_many(webhook_id, webhook, payloads)
+            results = [{"index": index, "status_code": RESPONSE_CODE_ACCEPTED, "event_id": event_id}
+                       for index, event_id in enumerate(event_ids)]
+            return {"status": ACCEPTED_MESSAGE, "results": results}, RESPONSE_CODE_ACCEPTED
+        except NotFoundError as e:
+            raise e
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error accepting webhook batch: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def get_webhook(self, webhook_id):
+        with self.stage_metrics.time("webhook_lookup", webhook_id):
+            return self.webhook_cache.get(webhook_id, self.load_webhook)
+
+    def load_webhook(self, webhook_id):
+        webhook = self.get_webhook_collection().find_one({"_id": ObjectId(webhook_id)})
+        if not webhook:
+            raise NotFoundError(WEBHOOK_NOT_FOUND_MESSAGE)
+        webhook["endpoints"] = self.load_endpoints(webhook)
+        webhook["routing"] = RoutingIndex(webhook["endpoints"])
+        return webhook
 
+    def load_endpoints(self, webhook):
+        # The enabled endpoints, read from a cursor in batches of
+        # STREAM_BATCH_SIZE, plus any still embedded in the webhook document.
+        cursor = self.get_endpoints_collection().find(fan_out_query(str(webhook["_id"]))).sort("_id", ASCENDING).batch_size(STREAM_BATCH_SIZE)
+        return merge_endpoints(webhook.get("endpoints"), [to_endpoint(document) for document in cursor])
+
+    def get_cache_stats(self):
+        return self.webhook_cache.stats(), RESPONSE_CODE_SUCCESS
+
+    def deliver_webhook(self, webhook_id, webhook, data, max_wait=None):
+        endpoints = self.select_endpoints(webhook_id, webhook, data)
+        results = self.delivery_engine.deliver_each(self.build_deliveries(webhook_id, webhook, endpoints, data, max_wait))
+        self.record_results(webhook_id, endpoints, data, results)
+
+    def build_deliveries(self, webhook_id, webhook, endpoints, data, max_wait=None):
+        # One delivery per endpoint, then the webhook_url's, which is paced by
+        # its host's limit but never deferred. Endpoint deliveries that would
+        # wait longer than max_wait (the limiter's own when None) are deferred.
+        payload = to_payload(data)
+        deliveries = [
+            (endpoint["url"], payload, self.throttle(endpoint["url"], endpoint, webhook_id, max_wait=max_wait),
+             self.tracer.child_span("forward", url=endpoint["url"], endpoint_id=endpoint["endpoint_id"]))
+            for endpoint in endpoints
+        ]
+        deliveries.append((webhook["webhook_url"], payload, self.throttle(webhook["webhook_url"], defer=False),
+                           self.tracer.child_span("forward", url=webhook["webhook_url"])))
+        return deliveries
+
+    def throttle(self, url, endpoint=None, webhook_id=None, defer=True, max_wait=None):
+        if not RATE_LIMIT_ENABLED:
+            return None
+        return self.rate_limiter.throttle(url, endpoint, webhook_id, defer, max_wait)
+
+    def select_endpoints(self, webhook_id, webhook, data):
+        with self.stage_metrics.time("select_endpoints", webhook_id):
+            return self._select_endpoints(webhook_id, webhook, data)
+
+    def _select_endpoints(self, webhook_id, webhook, data):
+        endpoints = []
+        event_ref = None
+        for endpoint in get_routing_index(webhook).route(data):
+            if self.allow_delivery(webhook_id, endpoint["endpoint_id"]):
+                endpoints.append(endpoint)
+                continue
+            event_ref = event_ref or self.log_service.reference_event(data)
+            self.log_service.create_log(webhook_id, endpoint["endpoint_id"], None, RESPONSE_CODE_UNAVAILABLE, f"{CIRCUIT_OPEN_MESSAGE} for endpoint {endpoint['url']}",
+                                        event_ref=event_ref, delivery=True)
+            if RETRY_ENABLED:
+                self.retry_service.schedule(webhook_id, endpoint, data, CIRCUIT_OPEN_MESSAGE, attempts=0,
+                                            retry_after=self.circuit_breaker.retry_after(webhook_id, endpoint["endpoint_id"]))
+        return endpoints
+
+    def record_results(self, webhook_id, endpoints, data, results):
+        # `results` holds one result per endpoint followed by the webhook_url's.
+        event_ref = self.log_service.reference_event(data) if endpoints else None
+        for endpoint, result in zip(endpoints, results):
+            if result.deferred:
+                self.log_service.create_log(webhook_id, endpoint["endpoint_id"], None, RESPONSE_CODE_TOO_MANY_REQUESTS, f"{RATE_LIMITED_MESSAGE} for endpoint {endpoint['url']}",
+                                            event_ref=event_ref, delivery=True)
+                if RETRY_ENABLED:
+                    self.retry_service.schedule(webhook_id, endpoint, data, RATE_LIMITED_MESSAGE, attempts=0)
+                continue
+            self.record_delivery(webhook_id, endpoint["endpoint_id"], result)
+            if result.ok:
+                self.log_service.create_log(webhook_id, endpoint["endpoint_id"], SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Forwarded successfully",
+                                            latency_ms=result.latency_ms, event_ref=event_ref, delivery=True)
+            else:
+                self.log_service.create_log(webhook_id, endpoint["endpoint_id"], None, RESPONSE_CODE_ERROR, f"Error forwarding to endpoint {endpoint['url']}: {result.error}",
+                                            latency_ms=result.latency_ms, event_ref=event_ref, delivery=True)
+                if RETRY_ENABLED:
+                    self.retry_service.schedule(webhook_id, endpoint, data, result.error)
+        webhook_result = results[-1]
+        self.record_delivery(webhook_id, None, webhook_result)
+        if not webhook_result.ok:
+            raise ForwardingError(f"Error forwarding to endpoint {webhook_result.url}: {webhook_result.error}")
+
+    def allow_delivery(self, webhook_id, endpoint_id):
+        # The webhook_url (endpoint_id None) has no circuit of its own.
+        return not CIRCUIT_BREAKER_ENABLED or endpoint_id is None or self.circuit_breaker.allow(webhook_id, endpoint_id)
+
+    def record_delivery(self, webhook_id, endpoint_id, result):
+        self.status_metrics.record(result.ok, result.latency_ms)
+        self.stage_metrics.observe("forward", result.latency_ms / 1000, webhook_id, host_of(result.url), not result.ok)
+        if CIRCUIT_BREAKER_ENABLED and endpoint_id is not None:
+            self.circuit_breaker.record(webhook_id, endpoint_id, result.ok)
+
+    def deliver_outbox_event(self, event):
+        webhook_id = event["webhook_id"]
+        try:
+            self.deliver_webhook(webhook_id, event, event["payload"])
+            self.log_service.create_log(webhook_id, None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, "Webhook delivered successfully")
+        except ForwardingError as e:
+            # Endpoint failures already have their own retries; only the
+            # webhook_url delivery is retried here, so endpoints aren't re-sent.
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error delivering webhook: {e}")
+            if not RETRY_ENABLED:
+                raise
+            # A worker that lost its lease leaves the event to its new owner.
+            if self.outbox_service.mark_retrying(event, str(e)):
+                self.retry_service.schedule(webhook_id, {"endpoint_id": None, "url": event["webhook_url"]}, event["payload"], str(e),
+                                            outbox_event_id=event["_id"])
+            return OUTBOX_RETRYING
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error delivering webhook: {e}")
+            raise
+
+    def resolve_retries(self, retries):
+        # Points endpoint retries at their endpoint as it is configured now.
+        # Returns the ids of those whose endpoint was removed or disabled.
+        endpoints = {}
+        for webhook_id in {retry["webhook_id"] for retry in retries if retry["endpoint_id"] is not None}:
+            try:
+                webhook = self.get_webhook(webhook_id)
+            except NotFoundError:
+                continue
+            endpoints.update({(webhook_id, endpoint["endpoint_id"]): endpoint for endpoint in webhook["endpoints"]})
+        cancelled = set()
+        for retry in retries:
+            if retry["endpoint_id"] is None:
+                continue
+            endpoint = endpoints.get((retry["webhook_id"], retry["endpoint_id"]))
+            if endpoint is None:
+                cancelled.add(retry["_id"])
+                continue
+            retry["url"] = endpoint["url"]
+            for key in ("rate_limit", "host_rate_limit"):
+                if endpoint.get(key):
+                    retry[key] = endpoint[key]
+                else:
+                    retry.pop(key, None)
+        return cancelled
+
+    def deliver_retries(self, retries):
+        cancelled = self.resolve_retries(retries)
+        allowed = [retry for retry in retries
+                   if retry["_id"] not in cancelled and self.allow_delivery(retry["webhook_id"], retry["endpoint_id"])]
+        delivered = self.delivery_engine.deliver_each([
+            (retry["url"], retry["payload"], self.throttle(retry["url"], retry, retry["webhook_id"])) for retry in allowed
+        ])
+        for retry, result in zip(allowed, delivered):
+            if result.deferred:
+                continue
+            self.record_delivery(retry["webhook_id"], retry["endpoint_id"], result)
+            attempt = retry["attempts"] + 1
+            if retry["endpoint_id"] is None:
+                self.log_webhook_retry(retry, result, attempt)
+                continue
+            event_ref = self.log_service.reference_event(retry["payload"])
+            if result.ok:
+                self.log_service.create_log(retry["webhook_id"], retry["endpoint_id"], SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, f"Forwarded successfully on attempt {attempt}",
+                                            latency_ms=result.latency_ms, event_ref=event_ref, delivery=True)
+            else:
+                self.log_service.create_log(retry["webhook_id"], retry["endpoint_id"], None, RESPONSE_CODE_ERROR, f"Error forwarding to endpoint {retry['url']} on attempt {attempt}: {result.error}",
+                                            latency_ms=result.latency_ms, event_ref=event_ref, delivery=True)
+        results = {retry["_id"]: result for retry, result in zip(allowed, delivered)}
+        results.update({retry["_id"]: DeliveryResult(retry["url"], error=RETRY_CANCELLED_MESSAGE, cancelled=True)
+                        for retry in retries if retry["_id"] in cancelled})
+        return [results.get(retry["_id"]) or DeliveryResult(retry["url"], error=CIRCUIT_OPEN_MESSAGE, deferred=True,
+                                                              retry_after=self.circuit_breaker.retry_after(retry["webhook_id"], retry["endpoint_id"]))
+                for retry in retries]
+
+    def log_webhook_retry(self, retry, result, attempt):
+        # Logged like the outbox's own webhook_url outcome, not as an endpoint delivery.
+        if result.ok:
+            self.log_service.create_log(retry["webhook_id"], None, SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, f"Webhook delivered successfully on attempt {attempt}")
+        else:
+            self.log_service.create_log(retry["webhook_id"], None, None, RESPONSE_CODE_ERROR, f"Error delivering webhook on attempt {attempt}: {result.error}")
+
+    def get_endpoint_health(self, webhook_id):
+        try:
+            webhook = self.get_webhook(webhook_id)
+            return self.circuit_breaker.get_health(webhook_id, webhook.get("endpoints", [])), RESPONSE_CODE_SUCCESS
+        except NotFoundError as e:
+            raise e
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error getting endpoint health: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def get_rate_limits(self, webhook_id):
+        try:
+            webhook = self.get_webhook(webhook_id)
+            return self.rate_limiter.stats(webhook_id, webhook.get("endpoints", [])), RESPONSE_CODE_SUCCESS
+        except NotFoundError as e:
+            raise e
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error getting rate limits: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def get_prometheus_metrics(self):
+        cache = self.webhook_cache.stats()
+        gauges = [
+            ("webhook_cache_lookups_total", "Webhook config cache lookups.", "counter",
+             [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+            ("webhook_cache_size", "Webhook configs held in the cache.", "gauge", [({}, cache["size"])]),
+        ]
+        if self.log_service.log_writer is not None:
+            writer = self.log_service.log_writer.stats()
+            gauges += [
+                ("webhook_log_queue_depth", "Log documents waiting to be written.", "gauge", [({}, writer["queued"])]),
+                ("webhook_logs_total", "Log documents by outcome.", "counter",
+                 [({"outcome": outcome}, writer[outcome]) for outcome in ("written", "dropped", "failed")]),
+            ]
+        if isinstance(self.delivery_engine, DeliveryPool):
+            pool = self.delivery_engine.stats()
+            gauges += [
+                ("webhook_delivery_pool_pending", "Deliveries handed to a pool worker and not yet answered.", "gauge",
+                 [({"worker": str(index)}, pending) for index, pending in enumerate(pool["pending"])]),
+                ("webhook_delivery_pool_restarts_total", "Pool workers restarted after exiting.", "counter", [({}, pool["restarts"])]),
+            ]
+        return self.stage_metrics.render(gauges)
+
+    def get_delivery_analytics(self, group_by="endpoint", interval=None, webhook_id=None, endpoint_id=None, since=None, until=None):
+        if not self.log_snapshot.available:
+            raise NotFoundError(ANALYTICS_UNAVAILABLE_MESSAGE)
+        if group_by not in ("endpoint", "webhook"):
+            raise ValidationError(f"Unknown group_by: {group_by}")
+        if interval is not None and interval not in INTERVALS_MS:
+            raise ValidationError(f"Unknown interval: {interval}")
+        try:
+            window = [to_epoch_ms([value])[0] if value else None for value in (since, until)]
+        except ValueError:
+            raise ValidationError(f"Invalid time window: {since} - {until}")
+        try:
+            groups = self.log_snapshot.aggregate(group_by, interval, webhook_id, endpoint_id, *window)
+            watermark = self.log_snapshot.read_manifest()["watermark"]
+            return {"groups": groups, "snapshot_until": watermark[0] if watermark else None}, RESPONSE_CODE_SUCCESS
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error getting delivery analytics: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def create_replay(self, webhook_id, data):
+        if not REPLAY_ENABLED:
+            raise NotFoundError(REPLAY_DISABLED_MESSAGE)
+        try:
+            webhook = self.get_webhook(webhook_id)
+            endpoint_id = data.get("endpoint_id")
+            if endpoint_id is not None and endpoint_id not in {endpoint["endpoint_id"] for endpoint in webhook["endpoints"]}:
+                raise NotFoundError(ENDPOINT_NOT_FOUND_MESSAGE)
+            replay = self.replay_service.create(webhook_id, data)
+            self.log_service.create_log(webhook_id, endpoint_id, SUCCESS_MESSAGE, RESPONSE_CODE_ACCEPTED,
+                                        f"Replay {replay['_id']} of {replay['since']} - {replay['until']} created")
+            return to_replay_response(replay), RESPONSE_CODE_ACCEPTED
+        except (ValidationError, NotFoundError) as e:
+            raise e
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error creating replay: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def list_replays(self, webhook_id, limit=100):
+        try:
+            return {"replays": [to_replay_response(replay) for replay in self.replay_service.list_replays(webhook_id, limit)]}, RESPONSE_CODE_SUCCESS
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error listing replays: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def get_replay(self, replay_id):
+        replay = self.replay_service.get(replay_id)
+        if replay is None:
+            raise NotFoundError(REPLAY_NOT_FOUND_MESSAGE)
+        return to_replay_response(replay), RESPONSE_CODE_SUCCESS
+
+    def update_replay(self, replay_id, action):
+        replay = self.replay_service.transition(replay_id, action)
+        if replay is None:
+            if self.replay_service.get(replay_id) is None:
+                raise NotFoundError(REPLAY_NOT_FOUND_MESSAGE)
+            raise ValidationError(f"Replay can't {action} from its current status")
+        return to_replay_response(replay), RESPONSE_CODE_SUCCESS
+
+    def deliver_replay(self, replay, logs, bodies):
+        # Sends one group of a replay to the endpoints as they are configured
+        # now. Events whose endpoint was removed or disabled, or whose body is
+        # gone from the payload store, are skipped.
+        webhook_id = replay["webhook_id"]
+        endpoints = {endpoint["endpoint_id"]: endpoint for endpoint in self.get_webhook(webhook_id)["endpoints"]}
+        sendable = [(log, endpoints[log["endpoint_id"]], Payload(bodies[log["event_ref"]])) for log in logs
+                    if log["endpoint_id"] in endpoints and log["event_ref"] in bodies]
+        results = self.delivery_engine.deliver_each([
+            (endpoint["url"], payload, self.throttle(endpoint["url"], endpoint, webhook_id, defer=False))
+            for log, endpoint, payload in sendable
+        ])
+        counts = {"delivered": 0, "failed": 0, "skipped": len(logs) - len(sendable)}
+        with self.log_service.batch():
+            for (log, endpoint, payload), result in zip(sendable, results):
+                self.record_delivery(webhook_id, endpoint["endpoint_id"], result)
+                if result.ok:
+                    counts["delivered"] += 1
+                    self.log_service.create_log(webhook_id, endpoint["endpoint_id"], SUCCESS_MESSAGE, RESPONSE_CODE_SUCCESS, f"Replayed successfully by replay {replay['_id']}",
+                                                latency_ms=result.latency_ms, event_ref=log["event_ref"], delivery=True)
+                else:
+                    counts["failed"] += 1
+                    self.log_service.create_log(webhook_id, endpoint["endpoint_id"], None, RESPONSE_CODE_ERROR, f"Error replaying to endpoint {endpoint['url']}: {result.error}",
+                                                latency_ms=result.latency_ms, event_ref=log["event_ref"], delivery=True)
+        return counts
+
+    def get_traces(self, webhook_id=None, min_duration_ms=None, limit=50):
+        return {"traces": self.tracer.find(webhook_id, min_duration_ms, limit)}, RESPONSE_CODE_SUCCESS
+
+    def get_trace(self, trace_id):
+        trace = self.tracer.get(trace_id)
+        if trace is None:
+            raise NotFoundError(TRACE_NOT_FOUND_MESSAGE)
+        return trace, RESPONSE_CODE_SUCCESS
+
+    def get_dead_letters(self, webhook_id, limit=100):
+        try:
+            return self.retry_service.list_dead_letters(webhook_id, limit), RESPONSE_CODE_SUCCESS
+        except Exception as e:
+            self.log_service.create_log(webhook_id, None, None, RESPONSE_CODE_ERROR, f"Error getting dead letters: {e}")
+            raise DatabaseError(DATABASE_ERROR_MESSAGE)
+
+    def start_outbox_workers(self, app):
+        self.outbox_service.start_workers(app, self.deliver_outbox_event)
+
+    def start_retry_scheduler(self, app):
+        self.retry_service.start(app, self.deliver_retries)
+
+    def start_circuit_sync(self):
+        self.circuit_breaker.start()
+
+    def start_log_retention(self):
+        self.log_service.partitions.start()
+
+    def start_replay_workers(self, app):
+        self.replay_service.start_workers(app, self.deliver_replay)
+
+    def start_log_snapshots(self):
+        if self.log_snapshot.can_export:
+            self.log_snapshot.start()
+
+    def start_cache_invalidation(self):
+        self.webhook_cache.watch(self.get_webhook_collection())
+
+    def forward_to_endpoint(self, endpoint, data):
+        result = self.delivery_engine.deliver(endpoint, data)
+        if not result.ok:
+            raise ForwardingError(f"Error forwarding to endpoint {endpoint}: {result.error}")
+        return result